@@ -0,0 +1,171 @@
+"""
+Materialized daily absences
+
+At the end of each school day every active student without an ATTENDED or
+LATE check-in gets a DailyAbsence row, written in bulk. Runs are idempotent:
+re-running a day removes absences of students who have checked in since and
+inserts only the missing rows, so the job can be retried or used to backfill
+past days. An AbsenceRun marks each day whose absences are complete; days
+without a completed run fall back to deriving absence from the roster.
+Each recorded day is also counted in the per-student statistics; backfilled
+days older than a student's counters need rebuild_attendance_stats.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+ABSENCE_BATCH_SIZE = 1000
+
+PRESENT_STATUSES = ('ATTENDED', 'LATE')
+
+
+def present_student_ids(day):
+    """Querysets of the students with an ATTENDED or LATE check-in on a local date"""
+    from .archive import range_needs_archive
+    from .models import Attendance, AttendanceArchive
+
+    models = [Attendance]
+    if range_needs_archive(day):
+        models.append(AttendanceArchive)
+    return [
+        model.objects.filter(
+            local_date=day, attendance_type='CHECK_IN', status__in=PRESENT_STATUSES
+        ).values('student_id')
+        for model in models
+    ]
+
+
+def is_school_day(day):
+    from .reports import get_school_days
+    return bool(get_school_days(day, day))
+
+
+def materialize_absences(day, batch_size=ABSENCE_BATCH_SIZE):
+    """
+    Record the absences of one school day.
+
+    Returns:
+        int: Number of absences recorded for the day, or None for non-school days
+    """
+    from core.models import Student
+    from .models import AbsenceRun, DailyAbsence
+
+    if not is_school_day(day):
+        return None
+
+    run, _ = AbsenceRun.objects.get_or_create(date=day)
+    run.status = 'RUNNING'
+    run.error_message = ''
+    run.save(update_fields=['status', 'error_message', 'updated_at'])
+
+    try:
+        with transaction.atomic():
+            roster = Student.objects.filter(is_active=True)
+            for present in present_student_ids(day):
+                # Students that checked in after a previous run are no longer absent
+                DailyAbsence.objects.filter(date=day, student_id__in=present).delete()
+                roster = roster.exclude(id__in=present)
+
+            batch = []
+            absent = roster.values_list('id', 'branch_id', 'grade', 'level', 'class_name').order_by('id')
+            for student_id, branch_id, grade, level, class_name in absent.iterator(chunk_size=batch_size):
+                batch.append(DailyAbsence(
+                    student_id=student_id, date=day, branch_id=branch_id,
+                    grade=grade, level=level, class_name=class_name or '',
+                ))
+                if len(batch) >= batch_size:
+                    DailyAbsence.objects.bulk_create(batch, ignore_conflicts=True)
+                    batch = []
+            if batch:
+                DailyAbsence.objects.bulk_create(batch, ignore_conflicts=True)
+
+            recorded = DailyAbsence.objects.filter(date=day).count()
+    except Exception as e:
+        run.status = 'FAILED'
+        run.error_message = str(e)
+        run.save(update_fields=['status', 'error_message', 'updated_at'])
+        raise
+
+    run.status = 'COMPLETED'
+    run.absences_recorded = recorded
+    run.completed_at = timezone.now()
+    run.save(update_fields=['status', 'absences_recorded', 'completed_at', 'updated_at'])
+    logger.info(f"Recorded {recorded} absence(s) for {day}")
+
+    # Count the finished day in the per-student running statistics
+    from .student_stats import update_stats_for_day
+    update_stats_for_day(day)
+    return recorded
+
+
+def materialize_absence_range(date_from, date_to, batch_size=ABSENCE_BATCH_SIZE):
+    """
+    Record absences for every school day in a range (backfill).
+
+    Returns:
+        dict: absences recorded per school day
+    """
+    results = {}
+    day = date_from
+    while day <= date_to:
+        recorded = materialize_absences(day, batch_size)
+        if recorded is not None:
+            results[day] = recorded
+        day += timedelta(days=1)
+    return results
+
+
+def materialized_days(date_from, date_to):
+    """Days in a range whose absences have been completely recorded"""
+    from .models import AbsenceRun
+
+    return set(
+        AbsenceRun.objects.filter(
+            date__gte=date_from, date__lte=date_to, status='COMPLETED'
+        ).values_list('date', flat=True)
+    )
+
+
+def get_absences(date_from, date_to, branch_id=None, grade=None, level=None, class_name=None):
+    """Recorded absences inside a date range matching the report filters"""
+    from .models import DailyAbsence
+
+    absences = DailyAbsence.objects.filter(date__gte=date_from, date__lte=date_to)
+    if branch_id:
+        absences = absences.filter(branch_id=branch_id)
+    if grade:
+        absences = absences.filter(grade=grade)
+    if level:
+        absences = absences.filter(level=level)
+    if class_name:
+        absences = absences.filter(class_name=class_name)
+    return absences
+
+
+def count_absences_by_day(date_from, date_to, **filters):
+    """
+    Recorded absence counts per day for the materialized days of a range.
+
+    Returns:
+        dict: {date: absence count}; days without a completed run are missing
+    """
+    from django.db.models import Count
+
+    days = materialized_days(date_from, date_to)
+    if not days:
+        return {}
+    counts = {day: 0 for day in days}
+    rows = (
+        get_absences(date_from, date_to, **filters)
+        .filter(date__in=days)
+        .values('date')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    for row in rows:
+        counts[row['date']] = row['count']
+    return counts
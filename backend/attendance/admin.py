@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import FingerprintDevice, Attendance, SMSLog
+from .models import FingerprintDevice, Attendance, SMSLog, ReportJob, ArchiveRun, DailyAbsence, AbsenceRun, StudentAttendanceStats, NotificationOutbox
 
 
 @admin.register(FingerprintDevice)
@@ -21,8 +21,8 @@ class AttendanceAdmin(admin.ModelAdmin):
 
 @admin.register(SMSLog)
 class SMSLogAdmin(admin.ModelAdmin):
-    list_display = ['student', 'parent', 'phone_number', 'status', 'attendance', 'sent_at', 'delivered_at', 'created_at']
-    list_filter = ['status', 'created_at', 'sent_at', 'delivered_at']
+    list_display = ['student', 'parent', 'channel', 'phone_number', 'status', 'attendance', 'sent_at', 'delivered_at', 'created_at']
+    list_filter = ['status', 'channel', 'created_at', 'sent_at', 'delivered_at']
     search_fields = ['student__first_name', 'student__last_name', 'student__student_id', 'parent__first_name', 'parent__last_name', 'parent__email', 'phone_number', 'message_id']
     date_hierarchy = 'created_at'
     readonly_fields = ['created_at', 'updated_at']
@@ -32,7 +32,7 @@ class SMSLogAdmin(admin.ModelAdmin):
             'fields': ('student', 'parent', 'phone_number')
         }),
         ('SMS Details', {
-            'fields': ('attendance', 'message', 'status')
+            'fields': ('attendance', 'channel', 'message', 'status')
         }),
         ('API Information', {
             'fields': ('message_id', 'api_response', 'error_message'),
@@ -47,3 +47,61 @@ class SMSLogAdmin(admin.ModelAdmin):
         """Optimize queries by selecting related objects"""
         qs = super().get_queryset(request)
         return qs.select_related('student', 'parent', 'attendance')
+
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'file_format', 'status', 'expires_at', 'completed_at', 'requested_by', 'created_at']
+    list_filter = ['status', 'file_format', 'created_at']
+    search_fields = ['filter_hash']
+    readonly_fields = ['filter_hash', 'filters', 'result', 'created_at', 'updated_at', 'completed_at']
+
+
+@admin.register(ArchiveRun)
+class ArchiveRunAdmin(admin.ModelAdmin):
+    list_display = ['cutoff', 'status', 'attendances_archived', 'sms_logs_archived', 'started_at', 'completed_at']
+    list_filter = ['status']
+    readonly_fields = ['cutoff', 'status', 'attendances_archived', 'sms_logs_archived', 'error_message', 'started_at', 'updated_at', 'completed_at']
+
+
+@admin.register(DailyAbsence)
+class DailyAbsenceAdmin(admin.ModelAdmin):
+    list_display = ['student', 'date', 'branch', 'grade', 'level', 'class_name', 'created_at']
+    list_filter = ['branch', 'grade', 'date']
+    search_fields = ['student__first_name', 'student__last_name', 'student__student_id']
+    date_hierarchy = 'date'
+    list_select_related = ['student', 'branch']
+    raw_id_fields = ['student']
+
+
+@admin.register(AbsenceRun)
+class AbsenceRunAdmin(admin.ModelAdmin):
+    list_display = ['date', 'status', 'absences_recorded', 'started_at', 'completed_at']
+    list_filter = ['status']
+    readonly_fields = ['date', 'status', 'absences_recorded', 'error_message', 'started_at', 'updated_at', 'completed_at']
+
+
+@admin.register(StudentAttendanceStats)
+class StudentAttendanceStatsAdmin(admin.ModelAdmin):
+    list_display = ['student', 'days_present', 'days_late', 'days_absent', 'current_streak', 'streak_status', 'last_counted_date', 'last_seen']
+    list_filter = ['streak_status', 'school_year_start']
+    search_fields = ['student__first_name', 'student__last_name', 'student__student_id']
+    list_select_related = ['student']
+    readonly_fields = ['student', 'school_year_start', 'days_present', 'days_late', 'days_absent', 'current_streak', 'streak_status', 'last_day_status', 'last_counted_date', 'last_seen', 'updated_at']
+
+
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ['idempotency_key', 'channel', 'parent', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at']
+    list_filter = ['status', 'channel', 'created_at']
+    search_fields = ['idempotency_key', 'last_error']
+    list_select_related = ['parent']
+    raw_id_fields = ['parent']
+    readonly_fields = ['idempotency_key', 'channel', 'attendance', 'attempts', 'last_error', 'sent_at', 'created_at', 'updated_at']
+    actions = ['requeue']
+
+    @admin.action(description='Requeue selected dead-lettered notifications')
+    def requeue(self, request, queryset):
+        from .outbox import requeue_dead_notifications
+        requeued = requeue_dead_notifications(queryset)
+        self.message_user(request, f'{requeued} notification(s) requeued')
@@ -85,6 +85,107 @@ class AttendanceConfig(AppConfig):
             else:
                 logger.info(f"Created attendance sync periodic task (every {every} {period.lower()})")
             
+            # Hourly cleanup of expired background report jobs
+            hourly_schedule, _ = IntervalSchedule.objects.get_or_create(
+                every=1,
+                period=IntervalSchedule.HOURS,
+            )
+            _, created = PeriodicTask.objects.update_or_create(
+                name='Cleanup Report Jobs',
+                defaults={
+                    'task': 'attendance.cleanup_report_jobs',
+                    'interval': hourly_schedule,
+                    'enabled': True,
+                }
+            )
+            if created:
+                logger.info("Created report job cleanup periodic task (every 1 hour)")
+            
+            # Keep monthly attendance / SMS log partitions created ahead of time
+            daily_schedule, _ = IntervalSchedule.objects.get_or_create(
+                every=1,
+                period=IntervalSchedule.DAYS,
+            )
+            _, created = PeriodicTask.objects.update_or_create(
+                name='Ensure Attendance Partitions',
+                defaults={
+                    'task': 'attendance.ensure_partitions',
+                    'interval': daily_schedule,
+                    'enabled': True,
+                }
+            )
+            if created:
+                logger.info("Created attendance partition maintenance periodic task (every 1 day)")
+            
+            # Record the day's absences at the end of the school day (local time)
+            from django.conf import settings
+            absence_hour = getattr(settings, 'ABSENCE_JOB_HOUR', 15)
+            absence_minute = getattr(settings, 'ABSENCE_JOB_MINUTE', 0)
+            absence_schedule, _ = CrontabSchedule.objects.get_or_create(
+                minute=str(absence_minute),
+                hour=str(absence_hour),
+                day_of_week='*',
+                day_of_month='*',
+                month_of_year='*',
+                timezone=settings.TIME_ZONE,
+            )
+            _, created = PeriodicTask.objects.update_or_create(
+                name='Materialize Daily Absences',
+                defaults={
+                    'task': 'attendance.materialize_absences',
+                    'crontab': absence_schedule,
+                    'interval': None,
+                    'enabled': True,
+                }
+            )
+            if created:
+                logger.info(f"Created daily absences periodic task (daily at {absence_hour:02d}:{absence_minute:02d})")
+            
+            # Safety net for the notification outbox: dispatch tasks are also
+            # started whenever notifications are queued
+            dispatch_seconds = getattr(settings, 'NOTIFICATION_DISPATCH_INTERVAL_SECONDS', 30)
+            dispatch_schedule, _ = IntervalSchedule.objects.get_or_create(
+                every=dispatch_seconds,
+                period=IntervalSchedule.SECONDS,
+            )
+            _, created = PeriodicTask.objects.update_or_create(
+                name='Dispatch Notifications',
+                defaults={
+                    'task': 'attendance.dispatch_notifications',
+                    'interval': dispatch_schedule,
+                    'enabled': True,
+                }
+            )
+            if created:
+                logger.info(f"Created notification dispatch periodic task (every {dispatch_seconds} seconds)")
+            
+            _, created = PeriodicTask.objects.update_or_create(
+                name='Purge Notification Outbox',
+                defaults={
+                    'task': 'attendance.purge_notification_outbox',
+                    'interval': daily_schedule,
+                    'enabled': True,
+                }
+            )
+            if created:
+                logger.info("Created notification outbox purge periodic task (every 1 day)")
+            
+            receipt_seconds = getattr(settings, 'DELIVERY_RECEIPT_INTERVAL_SECONDS', 10)
+            receipt_schedule, _ = IntervalSchedule.objects.get_or_create(
+                every=receipt_seconds,
+                period=IntervalSchedule.SECONDS,
+            )
+            _, created = PeriodicTask.objects.update_or_create(
+                name='Apply Delivery Receipts',
+                defaults={
+                    'task': 'attendance.apply_delivery_receipts',
+                    'interval': receipt_schedule,
+                    'enabled': True,
+                }
+            )
+            if created:
+                logger.info(f"Created delivery receipt periodic task (every {receipt_seconds} seconds)")
+            
             # DISABLED: Student sync task is disabled
             # Disable any existing sync_students periodic tasks
             student_tasks = PeriodicTask.objects.filter(task='attendance.sync_students')
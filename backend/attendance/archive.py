@@ -0,0 +1,191 @@
+"""
+Archival of closed school years out of the hot attendance and SMS log tables
+
+Rows recorded before a cutoff (the start of a school year) are moved into the
+AttendanceArchive and SMSLogArchive tables in batches. Each batch is a single
+DELETE ... RETURNING feeding an INSERT, so a row is always in exactly one of the
+two tables and an interrupted run can simply be started again. A row whose ID
+is already archived fails its batch (and the run) rather than being dropped. SMS logs are
+moved first so no hot SMS log is left pointing at an archived attendance record.
+
+Reports union in the archive tables only when their date range starts before
+the latest archive cutoff (see get_archived_before()). Archived SMS logs are
+listed separately, by the read-only sms-logs-archive endpoint.
+"""
+import logging
+from datetime import date
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ArchiveRun, Attendance, AttendanceArchive, SMSLog, SMSLogArchive
+from .utils import get_local_date, get_local_day_bounds
+
+logger = logging.getLogger(__name__)
+
+
+def get_school_year_start(day=None):
+    """First day of the school year containing the given local date"""
+    day = day or get_local_date()
+    start_month = getattr(settings, 'SCHOOL_YEAR_START_MONTH', 8)
+    year = day.year if day.month >= start_month else day.year - 1
+    return date(year, start_month, 1)
+
+
+def get_school_year_cutoff(school_year=None):
+    """
+    Archive cutoff for a school year: the UTC instant its first local day starts.
+
+    Args:
+        school_year: Calendar year the school year starts in. Defaults to the
+                     current school year, so every closed year is archived.
+    """
+    if school_year is None:
+        start = get_school_year_start()
+    else:
+        start = date(school_year, getattr(settings, 'SCHOOL_YEAR_START_MONTH', 8), 1)
+    start_of_day, _ = get_local_day_bounds(start)
+    return start_of_day
+
+
+def get_archived_before():
+    """Latest archive cutoff, or None if nothing was ever archived"""
+    run = ArchiveRun.objects.order_by('-cutoff').only('cutoff').first()
+    return run.cutoff if run else None
+
+
+def range_needs_archive(date_from):
+    """Whether a report starting on this local date (ISO string or date) may include archived rows"""
+    archived_before = get_archived_before()
+    if archived_before is None:
+        return False
+    if isinstance(date_from, str):
+        date_from = date.fromisoformat(date_from[:10])
+    start_of_day, _ = get_local_day_bounds(date_from)
+    return start_of_day < archived_before
+
+
+def _archive_columns(model):
+    return [field.column for field in model._meta.concrete_fields if field.name != 'archived_at']
+
+
+def _move_rows_sql(source_model, archive_model, where, key, limit=True):
+    """
+    SQL moving one batch of rows from a hot table into its archive table.
+
+    Returns the IDs of the moved rows.
+    """
+    quote = connection.ops.quote_name
+    source = quote(source_model._meta.db_table)
+    archive = quote(archive_model._meta.db_table)
+    columns = ', '.join(quote(column) for column in _archive_columns(archive_model))
+    return f"""
+        WITH batch AS (
+            SELECT id, {quote(key)} FROM {source} WHERE {where}{' ORDER BY ' + quote(key) + ', id LIMIT %s' if limit else ''}
+        ),
+        moved AS (
+            DELETE FROM {source} hot USING batch
+            WHERE hot.id = batch.id AND hot.{quote(key)} = batch.{quote(key)}
+            RETURNING hot.*
+        ),
+        archived AS (
+            INSERT INTO {archive} ({columns}, archived_at)
+            SELECT {columns}, now() FROM moved
+        )
+        SELECT id FROM moved
+    """
+
+
+def archive_sms_logs_batch(cutoff, batch_size):
+    """Move up to batch_size SMS logs created before the cutoff; returns the number moved"""
+    sql = _move_rows_sql(SMSLog, SMSLogArchive, f'{connection.ops.quote_name("created_at")} < %s', 'created_at')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [cutoff, batch_size])
+        return len(cursor.fetchall())
+
+
+def archive_attendance_batch(cutoff, batch_size):
+    """
+    Move up to batch_size attendance records from before the cutoff.
+
+    SMS logs of the moved records that were created after the cutoff (e.g. sent
+    for a late device sync) are moved with them.
+
+    Returns:
+        tuple: (attendance records moved, SMS logs moved)
+    """
+    sql = _move_rows_sql(Attendance, AttendanceArchive, f'{connection.ops.quote_name("timestamp")} < %s', 'timestamp')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [cutoff, batch_size])
+        attendance_ids = [row[0] for row in cursor.fetchall()]
+        sms_logs_moved = 0
+        if attendance_ids:
+            sms_sql = _move_rows_sql(SMSLog, SMSLogArchive, 'attendance_id = ANY(%s)', 'created_at', limit=False)
+            cursor.execute(sms_sql, [attendance_ids])
+            sms_logs_moved = len(cursor.fetchall())
+    return len(attendance_ids), sms_logs_moved
+
+
+def run_archive(cutoff, batch_size=None, max_batches=None, progress=None):
+    """
+    Archive every attendance record and SMS log from before the cutoff.
+
+    Progress is checkpointed on the ArchiveRun row after every batch, in the
+    same transaction as the batch itself. Running again with the same cutoff
+    resumes where an interrupted run stopped.
+
+    Args:
+        cutoff: Aware datetime; rows recorded before it are archived
+        batch_size: Rows per batch (default: ARCHIVE_BATCH_SIZE)
+        max_batches: Stop after this many batches (the run stays resumable)
+        progress: Optional callable receiving the ArchiveRun after each batch
+
+    Returns:
+        ArchiveRun
+    """
+    batch_size = batch_size or getattr(settings, 'ARCHIVE_BATCH_SIZE', 5000)
+    run, _ = ArchiveRun.objects.get_or_create(cutoff=cutoff)
+    if run.status != 'RUNNING':
+        run.status = 'RUNNING'
+        run.error_message = ''
+        run.completed_at = None
+        run.save(update_fields=['status', 'error_message', 'completed_at', 'updated_at'])
+
+    batches = 0
+    try:
+        # SMS logs first, then attendance records (sweeping any remaining SMS logs)
+        for phase in ('sms_logs', 'attendances'):
+            while max_batches is None or batches < max_batches:
+                with transaction.atomic():
+                    if phase == 'sms_logs':
+                        sms_logs_moved = archive_sms_logs_batch(cutoff, batch_size)
+                        attendances_moved = 0
+                    else:
+                        attendances_moved, sms_logs_moved = archive_attendance_batch(cutoff, batch_size)
+                    run.sms_logs_archived += sms_logs_moved
+                    run.attendances_archived += attendances_moved
+                    run.save(update_fields=['sms_logs_archived', 'attendances_archived', 'updated_at'])
+                batches += 1
+                if progress:
+                    progress(run)
+                moved = sms_logs_moved if phase == 'sms_logs' else attendances_moved
+                if moved < batch_size:
+                    break
+            else:
+                logger.info(f"Archive run before {cutoff} paused after {batches} batch(es)")
+                return run
+    except Exception as e:
+        run.status = 'FAILED'
+        run.error_message = str(e)
+        run.save(update_fields=['status', 'error_message', 'updated_at'])
+        raise
+
+    run.status = 'COMPLETED'
+    run.completed_at = timezone.now()
+    run.save(update_fields=['status', 'completed_at', 'updated_at'])
+    logger.info(
+        f"Archived {run.attendances_archived} attendance record(s) and "
+        f"{run.sms_logs_archived} SMS log(s) from before {cutoff}"
+    )
+    return run
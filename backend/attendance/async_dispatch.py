@@ -0,0 +1,178 @@
+"""
+Asyncio dispatcher for the notification outbox
+
+dispatch_notifications() in attendance.outbox sends one provider request at a
+time per worker. This dispatcher claims larger batches
+(NOTIFICATION_ASYNC_BATCH_SIZE) from the same outbox and sends their requests
+concurrently from one process over httpx.AsyncClient, so a single worker
+keeps hundreds of SMS and WhatsApp requests in flight:
+
+1. claim a batch (SELECT ... FOR UPDATE SKIP LOCKED, as for the sync path);
+2. render messages and plan the submissions, with identical SMS texts
+   grouped into multi-number submissions, as the sync path does;
+3. send them in an event loop through each channel's backend (see
+   attendance.channel_backends), at most <PROVIDER>_ASYNC_CONCURRENCY
+   requests in flight per provider, each checking the provider's circuit
+   breaker and taking a token from its rate limit first, and none started
+   that could outlast the batch's lease;
+4. record the outcomes and write the batch's SMS logs in one insert.
+
+The ORM is only used in steps 1 and 4, outside the event loop. Outcomes,
+retries and dead-lettering are the outbox's (see attendance.outbox). The
+async transport retries failed connections only; 429 and 503 responses come
+back as retriable results and the outbox reschedules them.
+"""
+import asyncio
+import logging
+import time
+
+import httpx
+from django.conf import settings
+
+from . import provider_http
+from .notifications import LEASE_EXPIRING
+from .outbox import (
+    DEFAULT_DISPATCH_SECONDS, _attendance_of, _service, claim_notifications, lease_deadline, store_outcomes,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+# Provider -> requests in flight at once
+DEFAULT_CONCURRENCY = {'SMS': 50, 'WHATSAPP': 100}
+
+MISSING_ATTENDANCE = {'success': False, 'error': 'Attendance record no longer exists', 'retriable': False}
+
+
+def get_concurrency(provider):
+    return max(1, getattr(settings, f'{provider}_ASYNC_CONCURRENCY', DEFAULT_CONCURRENCY[provider]))
+
+
+def build_client(provider):
+    """AsyncClient for one provider, with its timeouts and a pool sized to its concurrency"""
+    connect_timeout, read_timeout = provider_http.get_timeout(provider)
+    concurrency = get_concurrency(provider)
+    transport = httpx.AsyncHTTPTransport(
+        retries=provider_http.provider_setting(provider, 'retries'),
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+    )
+    return httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(read_timeout, connect=connect_timeout))
+
+
+class ProviderRequest:
+    """One backend send and the notifications (result indexes) it serves"""
+
+    def __init__(self, service, numbers, message, indexes):
+        self.service = service
+        self.numbers = numbers
+        self.message = message
+        self.indexes = indexes
+
+    @property
+    def provider(self):
+        return self.service.channel
+
+
+def plan_requests(notifications, services):
+    """
+    Build the backend sends of a claimed batch, grouped into submissions by
+    each channel's service as for the sync path.
+
+    Returns:
+        tuple: (results known without sending, None for the others;
+        ProviderRequest list)
+    """
+    results = [None] * len(notifications)
+    requests = []
+    by_channel = {}
+    for index, notification in enumerate(notifications):
+        if _attendance_of(notification) is None:
+            results[index] = MISSING_ATTENDANCE
+        else:
+            by_channel.setdefault(notification.channel, []).append(index)
+
+    for channel, indexes in by_channel.items():
+        service = _service(services, channel)
+        planned, submissions = service.plan_batch([
+            (notifications[index].attendance, notifications[index].parent) for index in indexes
+        ])
+        for position, result in enumerate(planned):
+            if result is not None:
+                results[indexes[position]] = result
+        configuration_error = service.check_configuration()
+        for message, chunk in submissions:
+            chunk = [indexes[position] for position in chunk]
+            if configuration_error:
+                service.fan_out(results, chunk, message, configuration_error)
+                continue
+            numbers = [notifications[index].parent.phone_number for index in chunk]
+            requests.append(ProviderRequest(service, numbers, message, chunk))
+    return results, requests
+
+
+async def _perform(client, semaphore, request, deadline):
+    async with semaphore:
+        if deadline is not None and time.monotonic() + request.service.backend.max_send_seconds >= deadline:
+            return LEASE_EXPIRING
+        try:
+            return await request.service.backend.send_async(client, request.numbers, request.message)
+        except Exception as e:
+            logger.exception(f"Error sending {request.service.label} to {len(request.numbers)} number(s): {e}")
+            return {'success': False, 'error': str(e), 'status': 'FAILED', 'retriable': True}
+
+
+async def send_requests(requests, deadline=None):
+    """
+    Send provider requests concurrently, within each provider's concurrency
+    cap, starting none that could still be running at deadline (a
+    time.monotonic() value); results in order
+    """
+    providers = {request.provider for request in requests}
+    clients = {provider: build_client(provider) for provider in providers}
+    semaphores = {provider: asyncio.Semaphore(get_concurrency(provider)) for provider in providers}
+    try:
+        return await asyncio.gather(*(
+            _perform(clients[request.provider], semaphores[request.provider], request, deadline) for request in requests
+        ))
+    finally:
+        for client in clients.values():
+            await client.aclose()
+
+
+def deliver_notifications_async(notifications, services=None):
+    """
+    Send claimed notifications concurrently and record the outcomes.
+
+    Returns:
+        list: New status of each notification (SENT, PENDING for a retry, or DEAD)
+    """
+    services = services if services is not None else {}
+    results, requests = plan_requests(notifications, services)
+    if requests:
+        deadline = lease_deadline(notifications)
+        for request, result in zip(requests, asyncio.run(send_requests(requests, deadline))):
+            request.service.fan_out(results, request.indexes, request.message, result)
+    return store_outcomes(notifications, results, services)
+
+
+def dispatch_notifications_async(batch_size=None, max_seconds=None):
+    """
+    Claim and send due notifications, a batch at a time with its requests in
+    flight concurrently, until the outbox is drained or the time budget is
+    spent. Safe to run alongside sync and async dispatchers.
+
+    Returns:
+        dict: Notifications per resulting status
+    """
+    batch_size = batch_size or getattr(settings, 'NOTIFICATION_ASYNC_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    max_seconds = max_seconds or getattr(settings, 'NOTIFICATION_DISPATCH_SECONDS', DEFAULT_DISPATCH_SECONDS)
+    deadline = time.monotonic() + max_seconds
+    results = {'SENT': 0, 'PENDING': 0, 'DEAD': 0}
+    services = {}
+    while time.monotonic() < deadline:
+        batch = claim_notifications(batch_size)
+        if not batch:
+            break
+        for status in deliver_notifications_async(batch, services):
+            results[status] += 1
+    return results
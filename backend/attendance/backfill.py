@@ -0,0 +1,116 @@
+"""
+Batched backfill of denormalized attendance columns
+
+Walks the attendance (and archived attendance) tables in ID ranges, updating
+one range per short transaction, so it can run on a live database and be
+interrupted and restarted at any time. Rows that are already filled are skipped.
+
+Columns filled: local_date (device-local day of the timestamp) and the student
+placement snapshot (branch, grade, level, class_name). Records taken before
+the snapshot columns existed get the student's placement at backfill time,
+the closest information available.
+"""
+import logging
+
+from django.db import connection, transaction
+
+from .utils import get_device_timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 10000
+
+
+def backfill_local_dates(model, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """
+    Fill local_date (the timestamp's date in the device timezone) where missing.
+
+    Returns:
+        int: Number of rows updated
+    """
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    timezone_name = str(get_device_timezone())
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN(id), MAX(id) FROM {table} WHERE local_date IS NULL')
+        min_id, max_id = cursor.fetchone()
+    if min_id is None:
+        return 0
+
+    updated = 0
+    for start in range(min_id, max_id + 1, batch_size):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {table}
+                SET local_date = (timestamp AT TIME ZONE %s)::date
+                WHERE id >= %s AND id < %s AND local_date IS NULL
+                """,
+                [timezone_name, start, start + batch_size],
+            )
+            updated += cursor.rowcount
+        if progress:
+            progress(model, updated)
+    return updated
+
+
+def backfill_student_snapshots(model, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """
+    Copy the student's branch, grade, level and class onto records without a snapshot.
+
+    Returns:
+        int: Number of rows updated
+    """
+    from core.models import Student
+
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    student_table = quote(Student._meta.db_table)
+
+    # grade is required on students, so an empty grade marks a missing snapshot
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT MIN(id), MAX(id) FROM {table} WHERE grade = ''")
+        min_id, max_id = cursor.fetchone()
+    if min_id is None:
+        return 0
+
+    updated = 0
+    for start in range(min_id, max_id + 1, batch_size):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {table} AS record
+                SET branch_id = student.branch_id,
+                    grade = student.grade,
+                    level = student.level,
+                    class_name = student.class_name
+                FROM {student_table} AS student
+                WHERE record.student_id = student.id
+                  AND record.id >= %s AND record.id < %s AND record.grade = ''
+                """,
+                [start, start + batch_size],
+            )
+            updated += cursor.rowcount
+        if progress:
+            progress(model, updated)
+    return updated
+
+
+def backfill_attendance(batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """
+    Backfill every denormalized attendance column on live and archived records.
+
+    Returns:
+        dict: rows updated per model name
+    """
+    from .models import Attendance, AttendanceArchive
+
+    results = {}
+    for model in (Attendance, AttendanceArchive):
+        updated = backfill_local_dates(model, batch_size, progress)
+        logger.info(f"Backfilled local_date on {updated} {model.__name__} row(s)")
+        snapshots = backfill_student_snapshots(model, batch_size, progress)
+        logger.info(f"Backfilled student snapshots on {snapshots} {model.__name__} row(s)")
+        results[model.__name__] = updated + snapshots
+    return results
@@ -0,0 +1,145 @@
+"""
+End-to-end throughput benchmark of attendance notifications
+
+run_benchmark() creates synthetic students with parents, records a punch for
+each student and queues its notifications as ingest does
+(enqueue_notifications), then drains the outbox with the sync or async
+dispatcher through the chosen channel backends:
+
+- memory: InMemoryBackend, no network (the cost of the pipeline itself);
+- stub: the Mora and WhatsApp clients against a local stub provider
+  (attendance.stub_provider) with simulated latency and errors, started
+  in-process unless a stub_url is given.
+
+Everything runs in one transaction that is rolled back, so no benchmark data
+is kept. Provider rate limits and circuit breakers apply as configured
+(unthrottled lifts the rate limits); they are shared with real senders
+through Redis, so run benchmarks against a development environment.
+"""
+import os
+import time
+import uuid
+from contextlib import redirect_stdout
+from datetime import date
+
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+BACKENDS = {
+    'memory': {
+        'SMS_BACKEND': 'attendance.channel_backends.InMemoryBackend',
+        'WHATSAPP_BACKEND': 'attendance.channel_backends.InMemoryBackend',
+    },
+    'stub': {
+        'SMS_BACKEND': 'attendance.channel_backends.MoraStubBackend',
+        'WHATSAPP_BACKEND': 'attendance.channel_backends.WhatsAppStubBackend',
+    },
+}
+# Long enough for the dispatchers to drain the outbox
+DISPATCH_SECONDS = 3600
+
+
+def create_students(count, parents_per_student):
+    """Synthetic students of the first branch, each with its own parents"""
+    from core.models import Branch, Parent, Student
+
+    branch = Branch.objects.order_by('id').first()
+    if branch is None:
+        raise ValueError('A branch is needed to create benchmark students')
+    run = uuid.uuid4().hex[:8]
+    parents = Parent.objects.bulk_create([
+        Parent(
+            first_name=f'Bench{index}', last_name='Parent', email=f'bench-{run}-{index}@example.invalid',
+            phone_number=f'05{index:08d}',
+        )
+        for index in range(count * parents_per_student)
+    ])
+    students = Student.objects.bulk_create([
+        Student(
+            first_name=f'Bench{index}', last_name='Student', student_id=f'BENCH-{run}-{index}', grade='PRIMARY',
+            level=1, gender='M', date_of_birth=date(2015, 1, 1), branch=branch,
+        )
+        for index in range(count)
+    ])
+    Student.parents.through.objects.bulk_create([
+        Student.parents.through(student_id=student.id, parent_id=parent.id)
+        for position, student in enumerate(students)
+        for parent in parents[position * parents_per_student:(position + 1) * parents_per_student]
+    ])
+    return students
+
+
+def run_benchmark(attendances=500, parents_per_student=2, channels=('SMS', 'WHATSAPP'), backend='memory',
+                  mode='async', batch_size=None, unthrottled=False, stub_url=None, stub_options=None):
+    """
+    Queue and dispatch the notifications of `attendances` punches, then roll back.
+
+    Returns:
+        dict: Counts, enqueue and dispatch durations, outcomes per status,
+        provider request metrics, and the stub provider's counters when it
+        was started here
+    """
+    from . import provider_http
+    from .async_dispatch import dispatch_notifications_async
+    from .channel_backends import clear_sent_messages, sent_messages
+    from .models import Attendance, NotificationOutbox
+    from .outbox import dispatch_notifications, enqueue_notifications
+    from .stub_provider import StubProviderServer
+
+    if NotificationOutbox.objects.filter(status__in=['PENDING', 'PROCESSING']).exists():
+        # They would be claimed and sent through the benchmark backends
+        raise ValueError('The outbox has queued notifications; run the benchmark with an empty outbox')
+
+    stub = None
+    if backend == 'stub' and not stub_url:
+        stub = StubProviderServer(**(stub_options or {})).start()
+        stub_url = stub.url
+    overrides = {
+        **BACKENDS[backend],
+        'SMS_ENABLED': 'SMS' in channels,
+        'WHATSAPP_ENABLED': 'WHATSAPP' in channels,
+        'SMS_BATCH_WINDOW_SECONDS': 0,
+    }
+    if stub_url:
+        overrides['NOTIFICATION_STUB_URL'] = stub_url
+    if unthrottled:
+        overrides.update(
+            SMS_RATE_LIMIT_PER_SECOND=0, WHATSAPP_RATE_LIMIT_PER_SECOND=0,
+            SMS_STUB_RATE_LIMIT_PER_SECOND=0, WHATSAPP_STUB_RATE_LIMIT_PER_SECOND=0,
+        )
+    dispatch = dispatch_notifications_async if mode == 'async' else dispatch_notifications
+
+    try:
+        with override_settings(**overrides), transaction.atomic():
+            students = create_students(attendances, parents_per_student)
+            provider_http.provider_metrics(reset=True)
+            clear_sent_messages()
+
+            started = time.monotonic()
+            queued = 0
+            now = timezone.now()
+            for student in students:
+                attendance = Attendance.create_attendance(student, 'CHECK_OUT', now)
+                queued += enqueue_notifications(attendance, channels=channels, dispatch=False)
+            enqueued = time.monotonic()
+            # The services' debug output would dominate the timings
+            with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                statuses = dispatch(batch_size, DISPATCH_SECONDS)
+            finished = time.monotonic()
+
+            results = {
+                'attendances': len(students),
+                'notifications': queued,
+                'enqueue_seconds': enqueued - started,
+                'dispatch_seconds': finished - enqueued,
+                'statuses': statuses,
+                'providers': provider_http.provider_metrics(reset=True),
+                'backend_sends': len(sent_messages),
+                'stub': stub.stats() if stub else None,
+            }
+            transaction.set_rollback(True)
+    finally:
+        if stub:
+            stub.stop()
+    return results
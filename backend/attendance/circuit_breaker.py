@@ -0,0 +1,286 @@
+"""
+Circuit breakers for the notification providers, shared by all workers
+
+Each provider has a breaker that stops sending while the provider is failing:
+
+- closed: requests go through. Each outcome is counted in a window of
+  CIRCUIT_BREAKER_WINDOW_SECONDS; failures are requests without a response,
+  5xx responses and calls slower than CIRCUIT_BREAKER_SLOW_CALL_SECONDS.
+  Once the window has CIRCUIT_BREAKER_MIN_REQUESTS requests and the failure
+  ratio reaches CIRCUIT_BREAKER_FAILURE_RATIO, the breaker opens for
+  CIRCUIT_BREAKER_OPEN_SECONDS.
+- fatal provider errors (insufficient balance, suspended account, blocked
+  sender...) open it at once, for CIRCUIT_BREAKER_FATAL_OPEN_SECONDS.
+- open: requests are refused with CircuitOpen, carrying the time left. The
+  notification outbox parks the messages until then, without using up an
+  attempt.
+- half-open: when the open period ends, one request probes the provider
+  (others wait up to CIRCUIT_BREAKER_PROBE_SECONDS for its outcome). Success
+  closes the breaker, failure opens it again.
+
+State lives in Redis (<KEY_PREFIX>:<provider> and its :window counters) and
+is updated by Lua scripts on the Redis clock, so every worker sees a trip
+immediately. If Redis is unreachable, each process keeps a local breaker.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from .utils import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'circuit:provider'
+DEFAULTS = {
+    'WINDOW_SECONDS': 60,
+    'MIN_REQUESTS': 10,
+    'FAILURE_RATIO': 0.5,
+    'SLOW_CALL_SECONDS': 10,
+    'OPEN_SECONDS': 30,
+    'FATAL_OPEN_SECONDS': 600,
+    'PROBE_SECONDS': 45,
+}
+# How long an open breaker's state outlives its open period
+STATE_TTL_MS = 3600 * 1000
+
+# KEYS: state
+# ARGV: probe ms
+# Returns the milliseconds until a request may be made (0: go ahead)
+ALLOW_SCRIPT = """
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local circuit = redis.call('HMGET', KEYS[1], 'state', 'open_until', 'probe_until')
+if circuit[1] == 'open' then
+    local open_until = tonumber(circuit[2])
+    if now < open_until then
+        return open_until - now
+    end
+elseif circuit[1] == 'half_open' then
+    local probe_until = tonumber(circuit[3])
+    if now < probe_until then
+        return probe_until - now
+    end
+else
+    return 0
+end
+-- Open period over, or the last probe never reported back: this request probes
+redis.call('HSET', KEYS[1], 'state', 'half_open', 'probe_until', now + tonumber(ARGV[1]))
+return 0
+"""
+
+# KEYS: state, window
+# ARGV: outcome (ok, fail, fatal), window ms, min requests, failure ratio,
+#       open ms, fatal open ms, reason, state ttl ms
+# Returns 1 when this outcome opened the breaker
+RECORD_SCRIPT = """
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local outcome = ARGV[1]
+local state = redis.call('HGET', KEYS[1], 'state')
+local function open(duration)
+    redis.call('HSET', KEYS[1], 'state', 'open', 'open_until', now + duration, 'reason', ARGV[7])
+    redis.call('PEXPIRE', KEYS[1], duration + tonumber(ARGV[8]))
+    redis.call('DEL', KEYS[2])
+    if state == 'open' then
+        return 0
+    end
+    return 1
+end
+if outcome == 'fatal' then
+    return open(tonumber(ARGV[6]))
+end
+if state == 'half_open' then
+    if outcome == 'ok' then
+        redis.call('DEL', KEYS[1], KEYS[2])
+        return 0
+    end
+    return open(tonumber(ARGV[5]))
+end
+if state == 'open' then
+    return 0
+end
+local window_ms = tonumber(ARGV[2])
+local window = redis.call('HMGET', KEYS[2], 'start', 'total', 'failures')
+local start = tonumber(window[1])
+local total = tonumber(window[2]) or 0
+local failures = tonumber(window[3]) or 0
+if not start or now - start >= window_ms then
+    start, total, failures = now, 0, 0
+end
+total = total + 1
+if outcome == 'fail' then
+    failures = failures + 1
+end
+redis.call('HSET', KEYS[2], 'start', start, 'total', total, 'failures', failures)
+redis.call('PEXPIRE', KEYS[2], window_ms * 2)
+if total >= tonumber(ARGV[3]) and failures / total >= tonumber(ARGV[4]) then
+    return open(tonumber(ARGV[5]))
+end
+return 0
+"""
+
+
+class CircuitOpen(Exception):
+    """The provider's breaker is open: requests are refused until it probes again"""
+
+    def __init__(self, provider, retry_after, reason=''):
+        self.provider = provider
+        self.retry_after = retry_after
+        self.reason = reason
+        super().__init__(f'{provider} circuit open{f" ({reason})" if reason else ""}, retry in {retry_after:.1f}s')
+
+
+def get_setting(provider, name):
+    """<PROVIDER>_CIRCUIT_BREAKER_<NAME>, else CIRCUIT_BREAKER_<NAME>, else the default"""
+    default = getattr(settings, f'CIRCUIT_BREAKER_{name}', DEFAULTS[name])
+    return getattr(settings, f'{provider}_CIRCUIT_BREAKER_{name}', default)
+
+
+def is_enabled():
+    return getattr(settings, 'CIRCUIT_BREAKER_ENABLED', True)
+
+
+class LocalCircuit:
+    """In-process breaker used while Redis is unavailable (same rules as the scripts)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.state = 'closed'
+        self.open_until = self.probe_until = 0.0
+        self.reason = ''
+        self.window_start, self.total, self.failures = None, 0, 0
+
+    def allow(self, probe_seconds):
+        with self.lock:
+            now = time.monotonic()
+            if self.state == 'closed':
+                return 0.0
+            if self.state == 'open' and now < self.open_until:
+                return self.open_until - now
+            if self.state == 'half_open' and now < self.probe_until:
+                return self.probe_until - now
+            self.state, self.probe_until = 'half_open', now + probe_seconds
+            return 0.0
+
+    def record(self, outcome, provider, reason):
+        with self.lock:
+            now = time.monotonic()
+            if outcome == 'fatal':
+                return self._open(now, get_setting(provider, 'FATAL_OPEN_SECONDS'), reason)
+            if self.state == 'half_open':
+                if outcome == 'ok':
+                    self.reset()
+                    return False
+                return self._open(now, get_setting(provider, 'OPEN_SECONDS'), reason)
+            if self.state == 'open':
+                return False
+            if self.window_start is None or now - self.window_start >= get_setting(provider, 'WINDOW_SECONDS'):
+                self.window_start, self.total, self.failures = now, 0, 0
+            self.total += 1
+            if outcome == 'fail':
+                self.failures += 1
+            if (
+                self.total >= get_setting(provider, 'MIN_REQUESTS')
+                and self.failures / self.total >= get_setting(provider, 'FAILURE_RATIO')
+            ):
+                return self._open(now, get_setting(provider, 'OPEN_SECONDS'), reason)
+            return False
+
+    def _open(self, now, seconds, reason):
+        opened = self.state != 'open'
+        self.state, self.open_until, self.reason = 'open', now + seconds, reason
+        self.window_start, self.total, self.failures = None, 0, 0
+        return opened
+
+
+_local_circuits = {}
+_local_lock = threading.Lock()
+
+
+def _local_circuit(provider):
+    with _local_lock:
+        return _local_circuits.setdefault(provider, LocalCircuit())
+
+
+def before_request(provider):
+    """
+    Check the provider's breaker before a request.
+
+    Raises:
+        CircuitOpen: while the breaker is open, or half-open with a probe in flight
+    """
+    if not is_enabled():
+        return
+    probe_ms = int(get_setting(provider, 'PROBE_SECONDS') * 1000)
+    try:
+        client = get_redis_client()
+        wait = int(client.eval(ALLOW_SCRIPT, 1, f'{KEY_PREFIX}:{provider}', probe_ms)) / 1000
+        reason = client.hget(f'{KEY_PREFIX}:{provider}', 'reason') if wait else ''
+    except Exception as e:
+        logger.warning(f"Circuit breaker state unavailable, tracking {provider} in this process only: {e}")
+        circuit = _local_circuit(provider)
+        wait, reason = circuit.allow(probe_ms / 1000), circuit.reason
+    if wait:
+        raise CircuitOpen(provider, wait, reason or '')
+
+
+def _record(provider, outcome, reason):
+    if not is_enabled():
+        return
+    try:
+        opened = int(get_redis_client().eval(
+            RECORD_SCRIPT, 2, f'{KEY_PREFIX}:{provider}', f'{KEY_PREFIX}:{provider}:window',
+            outcome,
+            int(get_setting(provider, 'WINDOW_SECONDS') * 1000),
+            get_setting(provider, 'MIN_REQUESTS'),
+            get_setting(provider, 'FAILURE_RATIO'),
+            int(get_setting(provider, 'OPEN_SECONDS') * 1000),
+            int(get_setting(provider, 'FATAL_OPEN_SECONDS') * 1000),
+            reason,
+            STATE_TTL_MS,
+        ))
+    except Exception as e:
+        logger.warning(f"Circuit breaker state unavailable, tracking {provider} in this process only: {e}")
+        opened = _local_circuit(provider).record(outcome, provider, reason)
+    if opened:
+        logger.warning(f"{provider} circuit opened: {reason}")
+
+
+def record_request(provider, status_code, elapsed):
+    """Count a request's outcome (status_code None: no response)"""
+    if status_code is None:
+        _record(provider, 'fail', 'provider unreachable')
+    elif status_code >= 500:
+        _record(provider, 'fail', f'HTTP {status_code} responses')
+    elif elapsed >= get_setting(provider, 'SLOW_CALL_SECONDS'):
+        _record(provider, 'fail', f'slow responses ({elapsed:.1f}s)')
+    else:
+        # Reason given if the window's earlier failures trip the breaker on this request
+        _record(provider, 'ok', 'high failure rate')
+
+
+def trip(provider, reason):
+    """Open the breaker at once for a fatal provider error"""
+    _record(provider, 'fatal', reason)
+
+
+def reset(provider=None):
+    """Close breakers (all providers by default), e.g. after topping up the balance"""
+    providers = [provider] if provider else list(set(_local_circuits) | {'SMS', 'WHATSAPP'})
+    for name in providers:
+        _local_circuit(name).reset()
+        try:
+            get_redis_client().delete(f'{KEY_PREFIX}:{name}', f'{KEY_PREFIX}:{name}:window')
+        except Exception as e:
+            logger.warning(f"Could not reset the {name} circuit in Redis: {e}")
@@ -0,0 +1,267 @@
+"""
+Live per-branch attendance counters kept in Redis
+
+Counters are stored per local day and scope (a branch ID or 'all'):
+- <prefix>:best    hash of student_id -> best CHECK_IN status priority of the day
+- <prefix>:tally   hash of per-priority student counts, check-outs and total records
+- <prefix>:seen    set of the attendance IDs included in the counters
+- <prefix>:pending list of increments received while the tally is being rebuilt
+
+The keys of every scope of a day are listed in the day's index set
+(attendance:day:<date>:keys), so a day is invalidated without scanning Redis.
+
+Increments are applied atomically at ingest time (after the attendance row is
+committed). A missing tally (cache miss, day rollover, invalidation) is rebuilt
+from the database, then pending increments are replayed. Records are counted
+once by ID: IDs are not committed in order, so a record with a lower ID than
+the rebuilt ones may still arrive afterwards.
+"""
+import logging
+
+from django.db.models import Count, Max, Q
+
+from .utils import (
+    get_redis_client,
+    get_local_date,
+    status_priority_expression,
+)
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'attendance:day'
+KEY_TTL_SECONDS = 2 * 24 * 3600
+ALL_BRANCHES = 'all'
+
+STATUS_PRIORITY = {'ATTENDED': 3, 'LATE': 2, 'ABSENT': 1}
+
+# KEYS: best, tally, pending, seen, day index
+# ARGV: attendance_id, student_id, attendance_type, priority, ttl
+RECORD_SCRIPT = """
+redis.call('SADD', KEYS[5], KEYS[1], KEYS[2], KEYS[3], KEYS[4])
+redis.call('EXPIRE', KEYS[5], ARGV[5])
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    redis.call('RPUSH', KEYS[3], ARGV[1] .. '|' .. ARGV[2] .. '|' .. ARGV[3] .. '|' .. ARGV[4])
+    redis.call('EXPIRE', KEYS[3], ARGV[5])
+    return 0
+end
+if redis.call('SADD', KEYS[4], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('EXPIRE', KEYS[4], ARGV[5])
+redis.call('HINCRBY', KEYS[2], 'total_records', 1)
+if ARGV[3] == 'CHECK_OUT' then
+    redis.call('HINCRBY', KEYS[2], 'check_outs', 1)
+    return 1
+end
+local new = tonumber(ARGV[4])
+local old = redis.call('HGET', KEYS[1], ARGV[2])
+if not old then
+    redis.call('HSET', KEYS[1], ARGV[2], new)
+    redis.call('HINCRBY', KEYS[2], 'p' .. new, 1)
+elseif new > tonumber(old) then
+    redis.call('HSET', KEYS[1], ARGV[2], new)
+    redis.call('HINCRBY', KEYS[2], 'p' .. old, -1)
+    redis.call('HINCRBY', KEYS[2], 'p' .. new, 1)
+end
+return 1
+"""
+
+
+def day_index_key(day):
+    """Set listing the counter keys of every scope of a day"""
+    return f'{KEY_PREFIX}:{day.isoformat()}:keys'
+
+
+class AttendanceDayCounters:
+    """Redis-backed attendance counters for one local day and branch scope"""
+
+    def __init__(self, day, branch_id=None, client=None):
+        self.day = day
+        self.branch_id = branch_id
+        self.client = client or get_redis_client()
+        scope = branch_id if branch_id else ALL_BRANCHES
+        prefix = f'{KEY_PREFIX}:{day.isoformat()}:{scope}'
+        self.best_key = f'{prefix}:best'
+        self.tally_key = f'{prefix}:tally'
+        self.pending_key = f'{prefix}:pending'
+        self.seen_key = f'{prefix}:seen'
+        self.index_key = day_index_key(day)
+
+    def record(self, attendance_id, student_id, attendance_type, status):
+        """Atomically apply a newly ingested attendance record"""
+        self.apply(attendance_id, student_id, attendance_type, STATUS_PRIORITY.get(status, 0))
+
+    def apply(self, attendance_id, student_id, attendance_type, priority):
+        """Run the record script; returns 1 if the record was counted"""
+        return self.client.eval(
+            RECORD_SCRIPT, 5,
+            self.best_key, self.tally_key, self.pending_key, self.seen_key, self.index_key,
+            attendance_id, student_id, attendance_type, priority, KEY_TTL_SECONDS,
+        )
+
+    def summary(self):
+        """Get the day's summary, rebuilding the counters from the database on a miss"""
+        tally = self.client.hgetall(self.tally_key)
+        if not tally:
+            self.rebuild()
+            tally = self.client.hgetall(self.tally_key)
+        check_ins = self.client.hlen(self.best_key)
+        return {
+            'check_ins': check_ins,
+            'check_outs': int(tally.get('check_outs', 0)),
+            'attended': int(tally.get('p3', 0)),
+            'late': int(tally.get('p2', 0)),
+            'total_records': int(tally.get('total_records', 0)),
+        }
+
+    def rebuild(self):
+        """Load the counters from the database unless another process already did"""
+        summary, best, attendance_ids = load_day_counters(self.day, self.branch_id)
+
+        tally = {
+            'check_outs': summary['check_outs'],
+            'total_records': summary['total_records'],
+            'p0': 0, 'p1': 0, 'p2': 0, 'p3': 0,
+        }
+        for priority in best.values():
+            tally[f'p{priority}'] += 1
+
+        import redis
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(self.tally_key)
+                if pipe.exists(self.tally_key):
+                    pipe.unwatch()
+                    return
+                pipe.multi()
+                pipe.sadd(self.index_key, self.best_key, self.tally_key, self.pending_key, self.seen_key)
+                pipe.delete(self.best_key, self.seen_key)
+                if best:
+                    pipe.hset(self.best_key, mapping=best)
+                if attendance_ids:
+                    pipe.sadd(self.seen_key, *attendance_ids)
+                pipe.hset(self.tally_key, mapping=tally)
+                for key in (self.index_key, self.best_key, self.tally_key, self.seen_key):
+                    pipe.expire(key, KEY_TTL_SECONDS)
+                pipe.execute()
+            except redis.WatchError:
+                # Another process rebuilt the counters concurrently
+                return
+
+        # Replay increments that arrived while the tally was missing.
+        # Records already included in the rebuild are skipped by the seen set.
+        while True:
+            entry = self.client.lpop(self.pending_key)
+            if entry is None:
+                break
+            self.apply(*entry.split('|'))
+
+    def invalidate(self):
+        """Drop the counters so the next read rebuilds them from the database"""
+        self.client.delete(self.best_key, self.tally_key, self.pending_key, self.seen_key)
+
+
+def day_attendances(day, branch_id=None):
+    from .models import Attendance
+
+    attendances = Attendance.objects.filter(local_date=day)
+    if branch_id:
+        attendances = attendances.filter(branch_id=branch_id)
+    return attendances
+
+
+def compute_day_counters(day, branch_id=None):
+    """
+    Compute a day's attendance counters from the database with grouped queries.
+
+    Returns:
+        tuple: (summary dict, {student_id: best priority})
+    """
+    attendances = day_attendances(day, branch_id)
+
+    totals = attendances.aggregate(
+        total_records=Count('id'),
+        check_outs=Count('id', filter=Q(attendance_type='CHECK_OUT')),
+    )
+    best = {
+        row['student_id']: row['best']
+        for row in attendances.filter(attendance_type='CHECK_IN')
+        .values('student_id')
+        .annotate(best=Max(status_priority_expression()))
+        .order_by()
+    }
+    return summarize(best, totals['check_outs'], totals['total_records']), best
+
+
+def load_day_counters(day, branch_id=None):
+    """
+    Load a day's counters and the IDs of the records they include from one
+    query, so that the IDs match the counts exactly.
+
+    Returns:
+        tuple: (summary dict, {student_id: best priority}, [attendance IDs])
+    """
+    rows = (
+        day_attendances(day, branch_id)
+        .annotate(priority=status_priority_expression())
+        .values_list('id', 'student_id', 'attendance_type', 'priority')
+        .order_by()
+    )
+    best = {}
+    attendance_ids = []
+    check_outs = 0
+    for attendance_id, student_id, attendance_type, priority in rows:
+        attendance_ids.append(attendance_id)
+        if attendance_type == 'CHECK_OUT':
+            check_outs += 1
+        elif priority > best.get(student_id, -1):
+            best[student_id] = priority
+    return summarize(best, check_outs, len(attendance_ids)), best, attendance_ids
+
+
+def summarize(best, check_outs, total_records):
+    return {
+        'check_ins': len(best),
+        'check_outs': check_outs,
+        'attended': sum(1 for priority in best.values() if priority == 3),
+        'late': sum(1 for priority in best.values() if priority == 2),
+        'total_records': total_records,
+    }
+
+
+def get_day_summary(day, branch_id=None):
+    """
+    Get a day's attendance summary from the live counters.
+
+    Falls back to computing it from the database if Redis is unavailable.
+    """
+    try:
+        return AttendanceDayCounters(day, branch_id).summary()
+    except Exception as e:
+        logger.warning(f"Attendance counters unavailable, using database: {e}")
+        summary, _ = compute_day_counters(day, branch_id)
+        return summary
+
+
+def record_attendance(attendance):
+    """Apply a newly created attendance record to its day's counters"""
+    day = get_local_date(attendance.timestamp)
+    branch_id = attendance.branch_id
+    try:
+        for scope in {None, branch_id}:
+            AttendanceDayCounters(day, scope).record(
+                attendance.id, attendance.student_id, attendance.attendance_type, attendance.status
+            )
+    except Exception as e:
+        logger.warning(f"Failed to update attendance counters for record {attendance.id}: {e}")
+
+
+def invalidate_day(day):
+    """Drop every scope's counters for a day (after updates or deletions)"""
+    try:
+        client = get_redis_client()
+        index_key = day_index_key(day)
+        keys = client.smembers(index_key)
+        client.delete(index_key, *keys)
+    except Exception as e:
+        logger.warning(f"Failed to invalidate attendance counters for {day}: {e}")
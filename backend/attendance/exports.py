@@ -0,0 +1,134 @@
+"""
+Streaming CSV and XLSX exports for attendance reports and SMS logs
+
+CSV is streamed row by row through StreamingHttpResponse. XLSX is written with
+openpyxl's write_only workbook into a temporary file, so neither format holds the
+whole export in memory.
+"""
+import csv
+import tempfile
+
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from .utils import get_device_timezone
+
+EXPORT_CHUNK_SIZE = 2000
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+ATTENDANCE_REPORT_COLUMNS = [
+    ('Student Name', lambda row: row['student_name']),
+    ('Student ID', lambda row: row['student_id_number']),
+    ('Branch', lambda row: row['branch']['name']),
+    ('Grade', lambda row: row['grade']),
+    ('Level', lambda row: row['level']),
+    ('Class', lambda row: row['class_name']),
+    ('Status', lambda row: row['attendance_status']),
+    ('First Check In', lambda row: format_local_datetime(row['first_check_in'])),
+    ('Last Check Out', lambda row: format_local_datetime(row['last_check_out'])),
+    ('Check Ins', lambda row: row['check_in_count']),
+    ('Check Outs', lambda row: row['check_out_count']),
+]
+
+SMS_LOG_EXPORT_FIELDS = [
+    'created_at', 'student__first_name', 'student__last_name', 'student__student_id',
+    'parent__first_name', 'parent__last_name', 'channel', 'phone_number', 'status', 'message',
+    'error_message', 'message_id', 'sent_at', 'delivered_at',
+]
+
+SMS_LOG_COLUMNS = [
+    ('Created At', lambda row: format_local_datetime(row['created_at'])),
+    ('Student Name', lambda row: f"{row['student__first_name']} {row['student__last_name']}"),
+    ('Student ID', lambda row: row['student__student_id']),
+    ('Parent Name', lambda row: f"{row['parent__first_name']} {row['parent__last_name']}"),
+    ('Channel', lambda row: row['channel']),
+    ('Phone Number', lambda row: row['phone_number']),
+    ('Status', lambda row: row['status']),
+    ('Message', lambda row: row['message']),
+    ('Error', lambda row: row['error_message']),
+    ('Message ID', lambda row: row['message_id']),
+    ('Sent At', lambda row: format_local_datetime(row['sent_at'])),
+    ('Delivered At', lambda row: format_local_datetime(row['delivered_at'])),
+]
+
+
+def format_local_datetime(value):
+    """Format a datetime (or ISO string) in the device timezone for spreadsheets"""
+    if not value:
+        return ''
+    if isinstance(value, str):
+        from datetime import datetime
+        value = datetime.fromisoformat(value)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value.astimezone(get_device_timezone()).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class Echo:
+    """File-like object that returns what is written, for streaming csv.writer output"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows, columns, filename):
+    """Stream rows as a CSV download"""
+    writer = csv.writer(Echo())
+
+    def generate():
+        # UTF-8 BOM so Excel opens Arabic names correctly
+        yield '\ufeff'
+        yield writer.writerow([header for header, _ in columns])
+        for row in rows:
+            yield writer.writerow([value(row) for _, value in columns])
+
+    response = StreamingHttpResponse(generate(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+def write_csv(rows, columns, output):
+    """Write rows to a binary file-like object as UTF-8 CSV"""
+    writer = csv.writer(Echo())
+    output.write('\ufeff'.encode('utf-8'))
+    output.write(writer.writerow([header for header, _ in columns]).encode('utf-8'))
+    for row in rows:
+        output.write(writer.writerow([value(row) for _, value in columns]).encode('utf-8'))
+
+
+def write_xlsx(rows, columns, output, sheet_title='Report'):
+    """Write rows to a file-like object as an XLSX workbook using constant memory"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_title)
+    sheet.append([header for header, _ in columns])
+    for row in rows:
+        sheet.append([value(row) for _, value in columns])
+    workbook.save(output)
+
+
+def xlsx_response(rows, columns, filename, sheet_title='Report'):
+    """Return rows as an XLSX download built in a temporary file"""
+    output = tempfile.TemporaryFile()
+    write_xlsx(rows, columns, output, sheet_title)
+    output.seek(0)
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=f'{filename}.xlsx',
+        content_type=XLSX_CONTENT_TYPE,
+    )
+
+
+def export_response(rows, columns, filename, file_format='csv', sheet_title='Report'):
+    """Build a CSV or XLSX download response for the requested format"""
+    if file_format == 'xlsx':
+        return xlsx_response(rows, columns, filename, sheet_title)
+    return stream_csv(rows, columns, filename)
+
+
+def iter_sms_log_rows(queryset):
+    """Read SMS log export rows with a server-side cursor"""
+    return queryset.values(*SMS_LOG_EXPORT_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
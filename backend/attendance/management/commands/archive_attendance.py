@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from attendance.archive import get_school_year_cutoff, get_school_year_start, run_archive
+from attendance.models import Attendance, SMSLog
+
+
+class Command(BaseCommand):
+    help = (
+        'Move attendance records and SMS logs of closed school years into the archive tables. '
+        'Runs in batches and can be interrupted and started again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--before-school-year',
+            type=int,
+            help='Archive school years starting before this year (default: the current school year, '
+                 'i.e. every closed school year)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help=f'Rows moved per batch (default: {getattr(settings, "ARCHIVE_BATCH_SIZE", 5000)})',
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            default=None,
+            help='Stop after this many batches; run again to continue',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the rows that would be archived',
+        )
+
+    def handle(self, *args, **options):
+        current_year = get_school_year_start().year
+        school_year = options['before_school_year'] or current_year
+        if school_year > current_year:
+            raise CommandError(f'School year {school_year} has not started yet, only closed school years can be archived')
+
+        cutoff = get_school_year_cutoff(school_year)
+        self.stdout.write(f'Archiving attendance and SMS logs recorded before {cutoff.isoformat()}')
+
+        if options['dry_run']:
+            attendances = Attendance.objects.filter(timestamp__lt=cutoff).count()
+            sms_logs = SMSLog.objects.filter(Q(created_at__lt=cutoff) | Q(attendance__timestamp__lt=cutoff)).count()
+            self.stdout.write(f'Would archive {attendances} attendance record(s) and {sms_logs} SMS log(s)')
+            return
+
+        def progress(run):
+            if options['verbosity'] >= 2:
+                self.stdout.write(
+                    f'  {run.sms_logs_archived} SMS log(s), {run.attendances_archived} attendance record(s) archived'
+                )
+
+        run = run_archive(cutoff, options['batch_size'], options['max_batches'], progress)
+
+        message = (
+            f'{run.attendances_archived} attendance record(s) and {run.sms_logs_archived} SMS log(s) archived'
+        )
+        if run.status == 'COMPLETED':
+            self.stdout.write(self.style.SUCCESS(f'Archive complete: {message}'))
+        else:
+            self.stdout.write(self.style.WARNING(f'Archive paused: {message}. Run again to continue.'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from attendance.backfill import DEFAULT_BATCH_SIZE, backfill_attendance
+
+
+class Command(BaseCommand):
+    help = 'Backfill denormalized columns (device-local date, student placement snapshot) on attendance records in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Number of IDs updated per transaction (default: {DEFAULT_BATCH_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        def progress(model, updated):
+            if options['verbosity'] >= 2:
+                self.stdout.write(f'  {model.__name__}: {updated} row(s) updated')
+
+        results = backfill_attendance(options['batch_size'], progress)
+        for name, updated in results.items():
+            self.stdout.write(f'{name}: {updated} row(s) updated')
+        self.stdout.write(self.style.SUCCESS('Backfill complete'))
@@ -0,0 +1,108 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.benchmark import BACKENDS, run_benchmark
+from attendance.management.commands.run_provider_stub import add_stub_arguments, stub_options
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure end-to-end notification throughput (queueing and dispatch) with synthetic students, '
+        'against in-memory or local stub providers. Benchmark data is rolled back, and stub providers '
+        'have rate limits and circuit breakers of their own, apart from the real providers\'.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--attendances', type=int, default=500, help='Punches to notify, one per synthetic student (default: 500)',
+        )
+        parser.add_argument(
+            '--parents', type=int, default=2, help='Parents per student (default: 2)',
+        )
+        parser.add_argument(
+            '--channel',
+            choices=['SMS', 'WHATSAPP'],
+            action='append',
+            dest='channels',
+            help='Channel to notify on; can be repeated (default: both)',
+        )
+        parser.add_argument(
+            '--backend',
+            choices=sorted(BACKENDS),
+            default='memory',
+            help='In-memory backends, or the provider clients against a stub provider (default: memory)',
+        )
+        parser.add_argument(
+            '--mode',
+            choices=['async', 'sync'],
+            default=None,
+            help='Dispatcher to benchmark (default: NOTIFICATION_DISPATCH_MODE)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=None, help='Notifications claimed per batch (default: the dispatcher\'s)',
+        )
+        parser.add_argument(
+            '--unthrottled', action='store_true', help='Lift the provider rate limits for the run',
+        )
+        parser.add_argument(
+            '--stub-url',
+            default=None,
+            help='Use a stub provider already running there (run_provider_stub) instead of starting one',
+        )
+        add_stub_arguments(parser)
+
+    def handle(self, *args, **options):
+        channels = tuple(dict.fromkeys(options['channels'] or ['SMS', 'WHATSAPP']))
+        mode = options['mode'] or getattr(settings, 'NOTIFICATION_DISPATCH_MODE', 'async')
+        self.stdout.write(
+            f"Benchmarking {options['attendances']} punch(es) x {options['parents']} parent(s) on "
+            f"{', '.join(channels)}: {options['backend']} backend, {mode} dispatch"
+        )
+        try:
+            results = run_benchmark(
+                attendances=options['attendances'],
+                parents_per_student=options['parents'],
+                channels=channels,
+                backend=options['backend'],
+                mode=mode,
+                batch_size=options['batch_size'],
+                unthrottled=options['unthrottled'],
+                stub_url=options['stub_url'],
+                stub_options=stub_options(options),
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        notifications = results['notifications']
+        enqueue_seconds, dispatch_seconds = results['enqueue_seconds'], results['dispatch_seconds']
+        statuses = results['statuses']
+        self.stdout.write(
+            f"Queued {notifications} notification(s) for {results['attendances']} punch(es) in {enqueue_seconds:.2f}s "
+            f"({rate(results['attendances'], enqueue_seconds)} punches/s)"
+        )
+        self.stdout.write(
+            f"Dispatched in {dispatch_seconds:.2f}s ({rate(notifications, dispatch_seconds)} notifications/s): "
+            f"{statuses['SENT']} sent, {statuses['PENDING']} to retry, {statuses['DEAD']} dead-lettered"
+        )
+        self.stdout.write(
+            f"End to end: {rate(notifications, enqueue_seconds + dispatch_seconds)} notifications/s"
+        )
+        for provider, metrics in sorted(results['providers'].items()):
+            self.stdout.write(
+                f"  {provider}: {metrics['requests']} request(s), {metrics['errors']} without response, "
+                f"{metrics['retries']} retried, responses {metrics['statuses']}, "
+                f"avg {metrics['avg_ms']} ms, max {metrics['max_ms']} ms"
+            )
+        if options['backend'] == 'memory':
+            self.stdout.write(f"  In-memory backends: {results['backend_sends']} send(s)")
+        if results['stub']:
+            stub = results['stub']
+            self.stdout.write(
+                f"  Stub provider: {stub['requests']} request(s) for {stub['numbers']} number(s), "
+                f"{stub['errors']} simulated error(s), at most {stub['max_in_flight']} in flight"
+            )
+        self.stdout.write(self.style.SUCCESS('Benchmark complete, data rolled back'))
+
+
+def rate(count, seconds):
+    return f'{count / seconds:.0f}' if seconds else '-'
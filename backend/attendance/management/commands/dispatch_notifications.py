@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from attendance.async_dispatch import dispatch_notifications_async
+from attendance.circuit_breaker import reset as reset_circuits
+from attendance.outbox import DEFAULT_BATCH_SIZE, dispatch_notifications, requeue_dead_notifications
+
+
+class Command(BaseCommand):
+    help = 'Send queued attendance notifications from the outbox (safe to run alongside Celery workers)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode',
+            choices=['async', 'sync'],
+            default=None,
+            help='Send a batch concurrently (async) or one request at a time (default: NOTIFICATION_DISPATCH_MODE)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help=f'Notifications claimed per batch (default: {DEFAULT_BATCH_SIZE}, or NOTIFICATION_ASYNC_BATCH_SIZE in async mode)',
+        )
+        parser.add_argument(
+            '--max-seconds',
+            type=int,
+            default=300,
+            help='Stop claiming new batches after this many seconds (default: 300)',
+        )
+        parser.add_argument(
+            '--requeue-dead',
+            action='store_true',
+            help='Give dead-lettered notifications a fresh set of attempts first',
+        )
+        parser.add_argument(
+            '--reset-circuits',
+            action='store_true',
+            help='Close open provider circuit breakers first (e.g. after topping up the SMS balance)',
+        )
+
+    def handle(self, *args, **options):
+        if options['reset_circuits']:
+            reset_circuits()
+            self.stdout.write('Closed provider circuit breakers')
+
+        if options['requeue_dead']:
+            requeued = requeue_dead_notifications()
+            self.stdout.write(f'Requeued {requeued} dead-lettered notification(s)')
+
+        mode = options['mode'] or getattr(settings, 'NOTIFICATION_DISPATCH_MODE', 'async')
+        dispatch = dispatch_notifications_async if mode == 'async' else dispatch_notifications
+        results = dispatch(options['batch_size'], options['max_seconds'])
+        self.stdout.write(
+            f"{results['SENT']} sent, {results['PENDING']} to retry, {results['DEAD']} dead-lettered"
+        )
+        self.stdout.write(self.style.SUCCESS('Dispatch complete'))
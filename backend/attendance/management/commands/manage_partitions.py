@@ -0,0 +1,86 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.partitioning import (
+    DEFAULT_MONTHS_AHEAD,
+    PARTITIONED_TABLES,
+    detach_partition,
+    ensure_future_partitions,
+    is_partitioned,
+    list_partitions,
+)
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming monthly partitions and detach old ones for attendance and SMS logs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=DEFAULT_MONTHS_AHEAD,
+            help=f'Number of future months to keep partitions for (default: {DEFAULT_MONTHS_AHEAD})',
+        )
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help='List existing partitions and exit',
+        )
+        parser.add_argument(
+            '--detach-before',
+            type=str,
+            help='Detach monthly partitions for months before this month (YYYY-MM)',
+        )
+        parser.add_argument(
+            '--detach-legacy',
+            action='store_true',
+            help='Also detach the legacy partition holding rows from before partitioning',
+        )
+        parser.add_argument(
+            '--drop',
+            action='store_true',
+            help='Drop detached partitions instead of keeping them as standalone tables',
+        )
+
+    def handle(self, *args, **options):
+        tables = [table for table in PARTITIONED_TABLES if is_partitioned(table)]
+        if not tables:
+            raise CommandError('Attendance tables are not partitioned (run migrations on PostgreSQL)')
+
+        if options['list']:
+            for table in tables:
+                self.stdout.write(self.style.MIGRATE_HEADING(table))
+                for partition in list_partitions(table):
+                    self.stdout.write(f"  {partition['name']}: {partition['bound']}")
+            return
+
+        created = ensure_future_partitions(options['months_ahead'])
+        for name in created:
+            self.stdout.write(f'Created partition {name}')
+
+        detach_before = None
+        if options['detach_before']:
+            try:
+                detach_before = date.fromisoformat(f"{options['detach_before']}-01")
+            except ValueError:
+                raise CommandError('--detach-before must be in YYYY-MM format')
+
+        detached = 0
+        if detach_before or options['detach_legacy']:
+            for table in tables:
+                for partition in list_partitions(table):
+                    if partition['bound'] == 'DEFAULT':
+                        continue
+                    if partition['month'] is None:
+                        should_detach = options['detach_legacy']
+                    else:
+                        should_detach = detach_before is not None and partition['month'] < detach_before
+                    if should_detach:
+                        detach_partition(table, partition['name'], drop=options['drop'])
+                        self.stdout.write(f"Detached partition {partition['name']}")
+                        detached += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Partitions up to date: {len(created)} created, {detached} detached')
+        )
@@ -0,0 +1,43 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.absences import ABSENCE_BATCH_SIZE, materialize_absence_range
+from attendance.utils import get_local_date
+
+
+class Command(BaseCommand):
+    help = (
+        'Record daily absences (students without an attended or late check-in) for a range of school days. '
+        'Idempotent: days can be recorded again after late device syncs.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date-from',
+            help='First day to record, YYYY-MM-DD (default: today)',
+        )
+        parser.add_argument(
+            '--date-to',
+            help='Last day to record, YYYY-MM-DD (default: --date-from)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=ABSENCE_BATCH_SIZE,
+            help=f'Absence rows inserted per statement (default: {ABSENCE_BATCH_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            date_from = date.fromisoformat(options['date_from']) if options['date_from'] else get_local_date()
+            date_to = date.fromisoformat(options['date_to']) if options['date_to'] else date_from
+        except ValueError as e:
+            raise CommandError(f'Invalid date: {e}')
+        if date_from > date_to:
+            raise CommandError('--date-from must be on or before --date-to')
+
+        results = materialize_absence_range(date_from, date_to, options['batch_size'])
+        for day, recorded in results.items():
+            self.stdout.write(f'{day.isoformat()}: {recorded} absence(s)')
+        self.stdout.write(self.style.SUCCESS(f'Recorded absences for {len(results)} school day(s)'))
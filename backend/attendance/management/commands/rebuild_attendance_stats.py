@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from attendance.student_stats import rebuild_student_stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute per-student attendance statistics for the current school year from attendance '
+        'records and recorded absences (backfill, or after materializing past days)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--student-id',
+            type=int,
+            action='append',
+            dest='student_ids',
+            help='Rebuild only this student (database ID); can be repeated (default: every active student)',
+        )
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_student_stats(options['student_ids'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt attendance statistics for {rebuilt} student(s)'))
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+
+from attendance.stub_provider import StubProviderServer
+
+
+class Command(BaseCommand):
+    help = (
+        'Serve a local stub of the Mora SMS and WhatsApp Cloud APIs with simulated latency and errors, '
+        'for load tests with MoraStubBackend/WhatsAppStubBackend (NOTIFICATION_STUB_URL)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+        parser.add_argument('--port', type=int, default=8025, help='Port to listen on (default: 8025)')
+        add_stub_arguments(parser)
+
+    def handle(self, *args, **options):
+        server = StubProviderServer((options['host'], options['port']), **stub_options(options))
+        self.stdout.write(f'Stub provider listening on {server.url} (Ctrl-C to stop)')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        stats = server.stats()
+        self.stdout.write(
+            f"{stats['requests']} request(s) for {stats['numbers']} number(s), {stats['errors']} simulated error(s), "
+            f"at most {stats['max_in_flight']} in flight"
+        )
+
+
+def add_stub_arguments(parser):
+    parser.add_argument(
+        '--latency-ms', type=float, default=50, help='Simulated provider latency in milliseconds (default: 50)',
+    )
+    parser.add_argument(
+        '--jitter-ms', type=float, default=0, help='Random extra latency of up to this many milliseconds (default: 0)',
+    )
+    parser.add_argument(
+        '--error-rate', type=float, default=0, help='Share of requests that fail, from 0 to 1 (default: 0)',
+    )
+    parser.add_argument(
+        '--error-status', type=int, default=503, help='HTTP status of failed requests (default: 503)',
+    )
+    parser.add_argument(
+        '--error-code',
+        type=int,
+        default=None,
+        help='Fail with this provider error code instead of an HTTP error (e.g. 105: insufficient SMS balance)',
+    )
+
+
+def stub_options(options):
+    return {
+        'latency_ms': options['latency_ms'],
+        'jitter_ms': options['jitter_ms'],
+        'error_rate': options['error_rate'],
+        'error_status': options['error_status'],
+        'error_code': options['error_code'],
+    }
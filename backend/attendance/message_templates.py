@@ -0,0 +1,110 @@
+"""
+Compiled SMS message templates
+
+AttendanceSettings.sms_template is parsed once per template text into literal
+and placeholder segments (cached per process), so rendering a message is a
+join rather than a str.format parse. Templates are validated when settings
+are saved; only the placeholders in PLACEHOLDERS are allowed.
+
+render_messages() renders a whole batch of (attendance, parent) pairs with
+one settings lookup and one local-time string per attendance record.
+"""
+import logging
+from functools import lru_cache
+from string import Formatter
+
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from .utils import get_device_timezone
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDERS = ('parent_name', 'student_name', 'time_attended')
+TIME_FORMAT = '%I:%M %p'
+DEFAULT_PARENT_NAME = 'Parent'
+
+
+class CompiledTemplate:
+    """A parsed template: alternating literal text and placeholder names"""
+
+    def __init__(self, segments):
+        self.segments = segments
+        self.placeholders = {name for is_placeholder, name in segments if is_placeholder}
+
+    def render(self, values):
+        return ''.join(values[text] if is_placeholder else text for is_placeholder, text in self.segments)
+
+
+@lru_cache(maxsize=16)
+def compile_template(template):
+    """
+    Parse a message template.
+
+    Raises:
+        ValidationError: for malformed braces, or placeholders other than
+        PLACEHOLDERS (including positional, indexed, converted or formatted ones)
+    """
+    segments = []
+    try:
+        for literal, name, format_spec, conversion in Formatter().parse(template):
+            if literal:
+                segments.append((False, literal))
+            if name is None:
+                continue
+            if name not in PLACEHOLDERS or format_spec or conversion:
+                allowed = ', '.join(f'{{{placeholder}}}' for placeholder in PLACEHOLDERS)
+                raise ValidationError(
+                    f"Unknown placeholder {{{name}}} in SMS template. Available variables: {allowed}"
+                )
+            segments.append((True, name))
+    except ValueError as e:
+        raise ValidationError(f"Invalid SMS template: {e}")
+    return CompiledTemplate(tuple(segments))
+
+
+def validate_template(template):
+    """Raise ValidationError unless the template compiles"""
+    compile_template(template)
+
+
+def get_compiled_template(attendance_settings=None):
+    """The compiled SMS template of the settings, or the default one if the stored template is invalid"""
+    from .models import AttendanceSettings
+
+    attendance_settings = attendance_settings or AttendanceSettings.get_settings()
+    try:
+        return compile_template(attendance_settings.sms_template)
+    except ValidationError as e:
+        # Saved before templates were validated: send the default text rather than nothing
+        logger.error(f"Stored SMS template is invalid, using the default template: {e.messages[0]}")
+        return compile_template(AttendanceSettings._meta.get_field('sms_template').default)
+
+
+def local_time_string(timestamp, device_tz=None):
+    """Time of a punch as shown on the device (local time, e.g. 07:45 AM)"""
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+    return timestamp.astimezone(device_tz or get_device_timezone()).strftime(TIME_FORMAT)
+
+
+def render_messages(recipients, attendance_settings=None):
+    """
+    Render the SMS text of each (attendance, parent) pair, in order.
+
+    The template is looked up and compiled once and each attendance record's
+    local time is formatted once, however many parents it has.
+    """
+    template = get_compiled_template(attendance_settings)
+    device_tz = get_device_timezone()
+    times = {}
+    messages = []
+    for attendance, parent in recipients:
+        if attendance.id not in times:
+            times[attendance.id] = local_time_string(attendance.timestamp, device_tz)
+        messages.append(template.render({
+            'parent_name': parent.first_name if parent and parent.first_name else DEFAULT_PARENT_NAME,
+            'student_name': attendance.student.full_name,
+            'time_attended': times[attendance.id],
+        }))
+    return messages
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('attendance', '0007_alter_fingerprintdevice_unique_together_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filter_hash', models.CharField(help_text='SHA-256 of the normalized filters and format', max_length=64, unique=True)),
+                ('filters', models.JSONField(help_text='Normalized report filters (branch, grade, level, class, dates)')),
+                ('file_format', models.CharField(choices=[('json', 'JSON'), ('csv', 'CSV'), ('xlsx', 'XLSX')], default='json', max_length=10)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('result', models.JSONField(blank=True, help_text='Report data for JSON jobs', null=True)),
+                ('file', models.FileField(blank=True, help_text='Generated export file for CSV/XLSX jobs', upload_to='reports/')),
+                ('error_message', models.TextField(blank=True)),
+                ('expires_at', models.DateTimeField(blank=True, help_text='When the cached result expires (empty = never, for past-day reports)', null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='report_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Report Job',
+                'verbose_name_plural': 'Report Jobs',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,267 @@
+# Converts attendance_attendance and attendance_smslog into tables partitioned by
+# month on timestamp / created_at (PostgreSQL declarative range partitioning).
+#
+# The existing table is kept as-is and attached as a single "legacy" partition
+# covering everything before the start of next month, so no rows are copied:
+#   1. Build the (id, <partition key>) unique index CONCURRENTLY and validate a
+#      CHECK constraint matching the legacy partition bound. Both only take locks
+#      that allow reads and writes. Rows already dated past the bound (a device
+#      clock far ahead) are moved aside into <table>_p_stray first. The step can
+#      be re-run after an interruption.
+#   2. In one short transaction: rename the table, create the partitioned parent
+#      with the same columns, indexes and foreign keys, create the next monthly
+#      partitions and ATTACH the legacy table (no scan thanks to step 1). Rows
+#      moved aside are inserted back through the parent, beyond the monthly
+#      partitions into a DEFAULT partition.
+#
+# Reversing copies the rows back into a plain table with an id primary key.
+#
+# Partitioned tables need the partition key in every unique constraint, so the
+# primary keys become (id, <partition key>) and the SMS log -> attendance foreign
+# key is no longer enforced by the database (Django still handles the cascade).
+
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import migrations, models, transaction
+import django.db.models.deletion
+
+PARTITIONED_TABLES = [
+    ('attendance_attendance', 'timestamp'),
+    ('attendance_smslog', 'created_at'),
+]
+MONTHS_AHEAD = 3
+
+
+def add_months(year, month, count):
+    month_index = year * 12 + (month - 1) + count
+    return month_index // 12, month_index % 12 + 1
+
+
+def month_start(year, month):
+    return datetime(year, month, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_table(cursor, table, key):
+    legacy = f'{table}_p_legacy'
+    stray = f'{table}_p_stray'
+    quoted_key = f'"{key}"'
+
+    cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s", [table])
+    row = cursor.fetchone()
+    if row is None or row[0] == 'p':
+        # Missing or already partitioned
+        return
+
+    now = datetime.now(dt_timezone.utc)
+    cutoff_year, cutoff_month = add_months(now.year, now.month, 1)
+    cutoff = month_start(cutoff_year, cutoff_month)
+
+    # Step 1: non-blocking preparation
+    cursor.execute(
+        """
+        SELECT x.indisvalid
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = %s::regclass AND i.relname = %s
+        """,
+        [table, f'{legacy}_pkey'],
+    )
+    row = cursor.fetchone()
+    if row is not None and not row[0]:
+        # Left invalid by an interrupted CREATE INDEX CONCURRENTLY
+        cursor.execute(f'DROP INDEX CONCURRENTLY "{legacy}_pkey"')
+    cursor.execute(
+        f'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS "{legacy}_pkey" ON "{table}" (id, {quoted_key})'
+    )
+    cursor.execute(
+        f'ALTER TABLE "{table}" DROP CONSTRAINT IF EXISTS "{legacy}_bound_check", '
+        f'ADD CONSTRAINT "{legacy}_bound_check" CHECK ({quoted_key} IS NOT NULL AND {quoted_key} < %s) NOT VALID',
+        [cutoff],
+    )
+    # The constraint already holds off new rows past the cutoff; move the existing
+    # ones aside so validation succeeds
+    cursor.execute(f'CREATE TABLE IF NOT EXISTS "{stray}" (LIKE "{table}")')
+    with transaction.atomic(using=cursor.db.alias):
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM "{table}" WHERE {quoted_key} IS NULL OR {quoted_key} >= %s RETURNING *) '
+            f'INSERT INTO "{stray}" SELECT * FROM moved',
+            [cutoff],
+        )
+    cursor.execute(f'ALTER TABLE "{table}" VALIDATE CONSTRAINT "{legacy}_bound_check"')
+
+    # Step 2: swap in the partitioned parent
+    with transaction.atomic(using=cursor.db.alias):
+        cursor.execute(f'LOCK TABLE "{table}" IN ACCESS EXCLUSIVE MODE')
+
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM "{table}"')
+        next_id = cursor.fetchone()[0] + 1
+        if sequence:
+            cursor.execute(f'SELECT last_value FROM {sequence}')
+            next_id = max(next_id, cursor.fetchone()[0] + 1)
+
+        cursor.execute(
+            "SELECT attidentity FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'id'",
+            [table],
+        )
+        if cursor.fetchone()[0]:
+            # Identity sequences belong to their table; replace it with a plain sequence
+            cursor.execute(f'ALTER TABLE "{table}" ALTER COLUMN id DROP IDENTITY')
+        else:
+            cursor.execute(f'ALTER TABLE "{table}" ALTER COLUMN id DROP DEFAULT')
+            if sequence:
+                cursor.execute(f'DROP SEQUENCE {sequence}')
+        cursor.execute(f'CREATE SEQUENCE "{table}_id_seq" START WITH {next_id}')
+
+        # Collect indexes and foreign keys before renaming
+        cursor.execute(
+            """
+            SELECT i.relname, pg_get_indexdef(i.oid)
+            FROM pg_index x
+            JOIN pg_class i ON i.oid = x.indexrelid
+            WHERE x.indrelid = %s::regclass AND NOT x.indisprimary AND i.relname <> %s
+            """,
+            [table, f'{legacy}_pkey'],
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            """
+            SELECT conname, pg_get_constraintdef(oid)
+            FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype = 'f'
+            """,
+            [table],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'",
+            [table],
+        )
+        primary_key = cursor.fetchone()[0]
+
+        # The legacy table's primary key becomes (id, key)
+        cursor.execute(
+            f'ALTER TABLE "{table}" DROP CONSTRAINT "{primary_key}", '
+            f'ADD CONSTRAINT "{legacy}_pkey" PRIMARY KEY USING INDEX "{legacy}_pkey"'
+        )
+        cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{legacy}"')
+        for index_name, _ in indexes:
+            cursor.execute(f'ALTER INDEX "{index_name}" RENAME TO "{index_name[:55]}_legacy"')
+
+        # Partitioned parent with the same columns, indexes and foreign keys
+        cursor.execute(
+            f'CREATE TABLE "{table}" (LIKE "{legacy}" INCLUDING DEFAULTS) PARTITION BY RANGE ({quoted_key})'
+        )
+        cursor.execute(f'ALTER TABLE "{table}" ALTER COLUMN id SET DEFAULT nextval(\'"{table}_id_seq"\')')
+        cursor.execute(f'ALTER SEQUENCE "{table}_id_seq" OWNED BY "{table}".id')
+        cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY (id, {quoted_key})')
+        for index_name, definition in indexes:
+            parent_definition = definition.replace(f' ON public.{table} ', f' ON ONLY public."{table}" ', 1)
+            parent_definition = parent_definition.replace(f' ON {table} ', f' ON ONLY "{table}" ', 1)
+            cursor.execute(parent_definition)
+        for constraint_name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{constraint_name}" {definition}')
+
+        # Attach the legacy table; the validated CHECK constraint avoids a scan
+        cursor.execute(
+            f'ALTER TABLE "{table}" ATTACH PARTITION "{legacy}" FOR VALUES FROM (MINVALUE) TO (%s)',
+            [cutoff],
+        )
+        for index_name, _ in indexes:
+            cursor.execute(f'ALTER INDEX "{index_name}" ATTACH PARTITION "{index_name[:55]}_legacy"')
+        cursor.execute(f'ALTER TABLE "{legacy}" DROP CONSTRAINT "{legacy}_bound_check"')
+
+        # Monthly partitions from next month onwards
+        for offset in range(MONTHS_AHEAD):
+            year, month = add_months(cutoff_year, cutoff_month, offset)
+            next_year, next_month = add_months(year, month, 1)
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS "{table}_p{year:04d}_{month:02d}" PARTITION OF "{table}" '
+                f'FOR VALUES FROM (%s) TO (%s)',
+                [month_start(year, month), month_start(next_year, next_month)],
+            )
+
+        # Rows moved aside in step 1
+        cursor.execute(f'SELECT EXISTS (SELECT 1 FROM "{stray}")')
+        if cursor.fetchone()[0]:
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS "{table}_p_default" PARTITION OF "{table}" DEFAULT')
+            cursor.execute(f'INSERT INTO "{table}" SELECT * FROM "{stray}"')
+        cursor.execute(f'DROP TABLE "{stray}"')
+
+
+def unpartition_table(cursor, table):
+    cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s", [table])
+    row = cursor.fetchone()
+    if row is None or row[0] != 'p':
+        return
+    copy = f'{table}_unpartitioned'
+
+    with transaction.atomic(using=cursor.db.alias):
+        cursor.execute(f'LOCK TABLE "{table}" IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(
+            """
+            SELECT i.relname, pg_get_indexdef(i.oid)
+            FROM pg_index x
+            JOIN pg_class i ON i.oid = x.indexrelid
+            WHERE x.indrelid = %s::regclass AND NOT x.indisprimary
+            """,
+            [table],
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            """
+            SELECT conname, pg_get_constraintdef(oid)
+            FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype = 'f'
+            """,
+            [table],
+        )
+        foreign_keys = cursor.fetchall()
+
+        cursor.execute(f'CREATE TABLE "{copy}" (LIKE "{table}" INCLUDING DEFAULTS)')
+        cursor.execute(f'INSERT INTO "{copy}" SELECT * FROM "{table}"')
+        # Keep the id sequence when the partitioned table and its partitions are dropped
+        cursor.execute(f'ALTER SEQUENCE "{table}_id_seq" OWNED BY NONE')
+        cursor.execute(f'DROP TABLE "{table}"')
+        cursor.execute(f'ALTER TABLE "{copy}" RENAME TO "{table}"')
+        cursor.execute(f'ALTER SEQUENCE "{table}_id_seq" OWNED BY "{table}".id')
+        cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY (id)')
+        for _, definition in indexes:
+            cursor.execute(definition.replace(' ON ONLY ', ' ON ', 1))
+        for constraint_name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{constraint_name}" {definition}')
+
+
+def partition_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table, key in PARTITIONED_TABLES:
+            partition_table(cursor, table, key)
+
+
+def unpartition_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table, _ in PARTITIONED_TABLES:
+            unpartition_table(cursor, table)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('attendance', '0008_report_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='smslog',
+            name='attendance',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='sms_logs', to='attendance.attendance'),
+        ),
+        migrations.RunPython(partition_tables, unpartition_tables),
+    ]
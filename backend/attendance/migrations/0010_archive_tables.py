@@ -0,0 +1,100 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_userprofile'),
+        ('attendance', '0009_partition_attendance_and_smslog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cutoff', models.DateTimeField(help_text='Rows recorded before this instant are archived (start of a school year)', unique=True)),
+                ('status', models.CharField(choices=[('RUNNING', 'Running'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], default='RUNNING', max_length=20)),
+                ('sms_logs_archived', models.PositiveIntegerField(default=0)),
+                ('attendances_archived', models.PositiveIntegerField(default=0)),
+                ('error_message', models.TextField(blank=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Archive Run',
+                'verbose_name_plural': 'Archive Runs',
+                'ordering': ['-cutoff'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SMSLogArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('attendance_id', models.BigIntegerField(help_text='ID of the (archived) attendance record')),
+                ('phone_number', models.CharField(max_length=20)),
+                ('message', models.TextField()),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('SENT', 'Sent'), ('FAILED', 'Failed')], max_length=20)),
+                ('api_response', models.JSONField(blank=True, null=True)),
+                ('error_message', models.TextField(blank=True)),
+                ('message_id', models.CharField(blank=True, max_length=255)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('parent', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_sms_logs', to='core.parent')),
+                ('student', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_sms_logs', to='core.student')),
+            ],
+            options={
+                'verbose_name': 'Archived SMS Log',
+                'verbose_name_plural': 'Archived SMS Logs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['student', 'created_at'], name='attendance__student_16e637_idx'), models.Index(fields=['created_at'], name='attendance__created_04848f_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AttendanceArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('attendance_type', models.CharField(choices=[('CHECK_IN', 'Check In'), ('CHECK_OUT', 'Check Out')], max_length=10)),
+                ('timestamp', models.DateTimeField()),
+                ('status', models.CharField(blank=True, choices=[('ATTENDED', 'Attended'), ('LATE', 'Late'), ('ABSENT', 'Absent')], max_length=10, null=True)),
+                ('is_synced', models.BooleanField(default=False)),
+                ('notes', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('device', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_attendances', to='attendance.fingerprintdevice')),
+                ('student', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_attendances', to='core.student')),
+            ],
+            options={
+                'verbose_name': 'Archived Attendance',
+                'verbose_name_plural': 'Archived Attendances',
+                'ordering': ['-timestamp'],
+                'indexes': [models.Index(fields=['student', 'timestamp'], name='attendance__student_aae0a7_idx'), models.Index(fields=['timestamp'], name='attendance__timesta_d6fcd1_idx')],
+            },
+        ),
+        # Archived SMS message text and provider responses are rarely read: store
+        # them with lz4 TOAST compression where the server supports it (PostgreSQL 14+)
+        migrations.RunSQL(
+            sql="""
+            DO $$
+            BEGIN
+                IF current_setting('server_version_num')::int >= 140000 THEN
+                    ALTER TABLE attendance_smslogarchive
+                        ALTER COLUMN api_response SET COMPRESSION lz4,
+                        ALTER COLUMN message SET COMPRESSION lz4;
+                END IF;
+            EXCEPTION WHEN feature_not_supported OR invalid_parameter_value THEN
+                RAISE NOTICE 'lz4 compression not available, using default compression';
+            END
+            $$;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0010_archive_tables'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='attendance',
+            name='attendance__timesta_6c8532_idx',
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['timestamp', 'id'], name='attendance__timesta_cdf7e8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='smslog',
+            index=models.Index(fields=['created_at', 'id'], name='attendance__created_2c1c95_idx'),
+        ),
+    ]
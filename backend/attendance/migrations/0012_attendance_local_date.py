@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 10000
+
+
+def backfill_local_date(apps, schema_editor):
+    """Fill local_date in ID batches (re-runnable later with manage.py backfill_attendance)"""
+    connection = schema_editor.connection
+    timezone_name = settings.TIME_ZONE or 'Asia/Riyadh'
+    for model_name in ('Attendance', 'AttendanceArchive'):
+        table = connection.ops.quote_name(apps.get_model('attendance', model_name)._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT MIN(id), MAX(id) FROM {table} WHERE local_date IS NULL')
+            min_id, max_id = cursor.fetchone()
+            if min_id is None:
+                continue
+            for start in range(min_id, max_id + 1, BATCH_SIZE):
+                cursor.execute(
+                    f"""
+                    UPDATE {table} SET local_date = (timestamp AT TIME ZONE %s)::date
+                    WHERE id >= %s AND id < %s AND local_date IS NULL
+                    """,
+                    [timezone_name, start, start + BATCH_SIZE],
+                )
+
+
+class Migration(migrations.Migration):
+
+    # Backfill batches commit one by one
+    atomic = False
+
+    dependencies = [
+        ('attendance', '0011_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendance',
+            name='local_date',
+            field=models.DateField(blank=True, editable=False, help_text='Calendar date of the timestamp in the device timezone', null=True),
+        ),
+        migrations.AddField(
+            model_name='attendancearchive',
+            name='local_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_local_date, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['student', 'local_date'], name='attendance__student_d37b1e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['local_date', 'attendance_type', 'status'], name='attendance__local_d_6155cb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attendancearchive',
+            index=models.Index(fields=['student', 'local_date'], name='attendance__student_bae9ef_idx'),
+        ),
+    ]
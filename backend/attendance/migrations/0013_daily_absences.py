@@ -0,0 +1,56 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_userprofile'),
+        ('attendance', '0012_attendance_local_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AbsenceRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(help_text='School day in the device timezone', unique=True)),
+                ('status', models.CharField(choices=[('RUNNING', 'Running'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], default='RUNNING', max_length=20)),
+                ('absences_recorded', models.PositiveIntegerField(default=0)),
+                ('error_message', models.TextField(blank=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Absence Run',
+                'verbose_name_plural': 'Absence Runs',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyAbsence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(help_text='School day in the device timezone')),
+                ('grade', models.CharField(choices=[('KINDERGARTEN', 'Kindergarten'), ('PRIMARY', 'Primary'), ('INTERMEDIATE', 'Intermediate'), ('SECONDARY', 'Secondary'), ('AMERICAN_DIPLOMA', 'American Diploma')], max_length=20)),
+                ('level', models.IntegerField(blank=True, null=True)),
+                ('class_name', models.CharField(blank=True, max_length=2)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('branch', models.ForeignKey(help_text="Student's branch when the absence was recorded", on_delete=django.db.models.deletion.CASCADE, related_name='absences', to='core.branch')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='absences', to='core.student')),
+            ],
+            options={
+                'verbose_name': 'Daily Absence',
+                'verbose_name_plural': 'Daily Absences',
+                'ordering': ['-date', 'student_id'],
+                'indexes': [models.Index(fields=['date', 'branch', 'grade'], name='attendance__date_63f784_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyabsence',
+            constraint=models.UniqueConstraint(fields=('student', 'date'), name='unique_daily_absence'),
+        ),
+    ]
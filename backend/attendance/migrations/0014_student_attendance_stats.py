@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_userprofile'),
+        ('attendance', '0013_daily_absences'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentAttendanceStats',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='attendance_stats', serialize=False, to='core.student')),
+                ('school_year_start', models.DateField(help_text='First day of the school year the counters cover')),
+                ('days_present', models.PositiveIntegerField(default=0, help_text='School days attended on time')),
+                ('days_late', models.PositiveIntegerField(default=0, help_text='School days attended late')),
+                ('days_absent', models.PositiveIntegerField(default=0, help_text='Recorded absences')),
+                ('current_streak', models.PositiveIntegerField(default=0, help_text='Consecutive counted school days with the streak status')),
+                ('streak_status', models.CharField(blank=True, choices=[('PRESENT', 'Present'), ('ABSENT', 'Absent')], max_length=10)),
+                ('last_day_status', models.CharField(blank=True, choices=[('ATTENDED', 'Attended'), ('LATE', 'Late'), ('ABSENT', 'Absent')], help_text='Outcome of the last counted day', max_length=10)),
+                ('last_counted_date', models.DateField(blank=True, help_text='Last school day included in the counters', null=True)),
+                ('last_seen', models.DateTimeField(blank=True, help_text='Latest attendance record of the student', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Student Attendance Stats',
+                'verbose_name_plural': 'Student Attendance Stats',
+                'indexes': [models.Index(fields=['streak_status', 'current_streak'], name='attendance__streak__0fdbb3_idx')],
+            },
+        ),
+    ]
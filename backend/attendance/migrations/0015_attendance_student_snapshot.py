@@ -0,0 +1,98 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 10000
+
+
+def backfill_student_snapshots(apps, schema_editor):
+    """
+    Copy each student's current placement onto existing records in ID batches
+    (re-runnable later with manage.py backfill_attendance). Placement history
+    is not kept, so older records get the placement at migration time.
+    """
+    connection = schema_editor.connection
+    student_table = connection.ops.quote_name(apps.get_model('core', 'Student')._meta.db_table)
+    for model_name in ('Attendance', 'AttendanceArchive'):
+        table = connection.ops.quote_name(apps.get_model('attendance', model_name)._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT MIN(id), MAX(id) FROM {table} WHERE grade = ''")
+            min_id, max_id = cursor.fetchone()
+            if min_id is None:
+                continue
+            for start in range(min_id, max_id + 1, BATCH_SIZE):
+                cursor.execute(
+                    f"""
+                    UPDATE {table} AS record
+                    SET branch_id = student.branch_id, grade = student.grade,
+                        level = student.level, class_name = student.class_name
+                    FROM {student_table} AS student
+                    WHERE record.student_id = student.id
+                      AND record.id >= %s AND record.id < %s AND record.grade = ''
+                    """,
+                    [start, start + BATCH_SIZE],
+                )
+
+
+class Migration(migrations.Migration):
+
+    # Backfill batches commit one by one
+    atomic = False
+
+    dependencies = [
+        ('core', '0008_search_documents'),
+        ('attendance', '0014_student_attendance_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendance',
+            name='branch',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, help_text="Student's branch on the day of the record", null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='attendances', to='core.branch'),
+        ),
+        migrations.AddField(
+            model_name='attendance',
+            name='class_name',
+            field=models.CharField(blank=True, editable=False, help_text="Student's class on the day of the record", max_length=2),
+        ),
+        migrations.AddField(
+            model_name='attendance',
+            name='grade',
+            field=models.CharField(blank=True, choices=[('KINDERGARTEN', 'Kindergarten'), ('PRIMARY', 'Primary'), ('INTERMEDIATE', 'Intermediate'), ('SECONDARY', 'Secondary'), ('AMERICAN_DIPLOMA', 'American Diploma')], editable=False, help_text="Student's grade on the day of the record", max_length=20),
+        ),
+        migrations.AddField(
+            model_name='attendance',
+            name='level',
+            field=models.IntegerField(blank=True, editable=False, help_text="Student's level on the day of the record", null=True),
+        ),
+        migrations.AddField(
+            model_name='attendancearchive',
+            name='branch',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_attendances', to='core.branch'),
+        ),
+        migrations.AddField(
+            model_name='attendancearchive',
+            name='class_name',
+            field=models.CharField(blank=True, max_length=2),
+        ),
+        migrations.AddField(
+            model_name='attendancearchive',
+            name='grade',
+            field=models.CharField(blank=True, choices=[('KINDERGARTEN', 'Kindergarten'), ('PRIMARY', 'Primary'), ('INTERMEDIATE', 'Intermediate'), ('SECONDARY', 'Secondary'), ('AMERICAN_DIPLOMA', 'American Diploma')], max_length=20),
+        ),
+        migrations.AddField(
+            model_name='attendancearchive',
+            name='level',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_student_snapshots, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['branch', 'local_date'], name='attendance__branch__7f7bff_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['local_date', 'branch', 'grade', 'level', 'class_name'], name='attendance__local_d_b66960_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_search_documents'),
+        ('attendance', '0015_attendance_student_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idempotency_key', models.CharField(help_text='Channel, attendance and parent; a notification is queued once', max_length=100, unique=True)),
+                ('channel', models.CharField(choices=[('SMS', 'SMS'), ('WHATSAPP', 'WhatsApp')], max_length=20)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('SENT', 'Sent'), ('DEAD', 'Dead letter')], default='PENDING', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='Send attempts so far')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, help_text='When the notification is due (or its claim expires)')),
+                ('last_error', models.TextField(blank=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('attendance', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='attendance.attendance')),
+                ('parent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='core.parent')),
+            ],
+            options={
+                'verbose_name': 'Notification Outbox Entry',
+                'verbose_name_plural': 'Notification Outbox',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(condition=models.Q(('status__in', ['PENDING', 'PROCESSING'])), fields=['next_attempt_at'], name='attendance_outbox_due_idx'), models.Index(fields=['status', 'updated_at'], name='attendance__status_6b375b_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0016_notification_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='smslog',
+            name='channel',
+            field=models.CharField(choices=[('SMS', 'SMS'), ('WHATSAPP', 'WhatsApp')], default='SMS', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='smslogarchive',
+            name='channel',
+            field=models.CharField(choices=[('SMS', 'SMS'), ('WHATSAPP', 'WhatsApp')], default='SMS', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='smslog',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('SENT', 'Sent'), ('DELIVERED', 'Delivered'), ('FAILED', 'Failed')], default='PENDING', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='smslogarchive',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('SENT', 'Sent'), ('DELIVERED', 'Delivered'), ('FAILED', 'Failed')], max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='smslog',
+            index=models.Index(condition=models.Q(('message_id', ''), _negated=True), fields=['message_id'], name='attendance_smslog_msgid_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Adds a DEFAULT partition to attendance_attendance and attendance_smslog, so
+# rows outside the created monthly partitions (the ensure_partitions task
+# stopped running, a device clock far in the future) are stored instead of
+# failing the insert. attendance.partitioning moves them into their month's
+# partition when it is created.
+
+from django.db import migrations
+
+PARTITIONED_TABLES = ['attendance_attendance', 'attendance_smslog']
+
+
+def is_partitioned(cursor, table):
+    cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s", [table])
+    row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def create_default_partitions(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table in PARTITIONED_TABLES:
+            if is_partitioned(cursor, table):
+                cursor.execute(f'CREATE TABLE IF NOT EXISTS "{table}_p_default" PARTITION OF "{table}" DEFAULT')
+
+
+def drop_default_partitions(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table in PARTITIONED_TABLES:
+            default = f'{table}_p_default'
+            cursor.execute("SELECT to_regclass(%s)", [f'"{default}"'])
+            if cursor.fetchone()[0] is None:
+                continue
+            cursor.execute(f'SELECT EXISTS (SELECT 1 FROM "{default}")')
+            if cursor.fetchone()[0]:
+                # Its rows have no other partition to go to; reversing 0009 copies them back
+                continue
+            cursor.execute(f'DROP TABLE "{default}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0017_delivery_receipts'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_default_partitions, drop_default_partitions),
+    ]
@@ -1,8 +1,10 @@
 from django.db import models
 from django.core.validators import RegexValidator
 from django.core.exceptions import ValidationError
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from django.utils import timezone
 from core.models import Grade, Student, Branch, Parent
 
 
@@ -114,6 +116,21 @@ class Attendance(models.Model):
     )
     attendance_type = models.CharField(max_length=10, choices=ATTENDANCE_TYPE_CHOICES)
     timestamp = models.DateTimeField(help_text="Attendance timestamp from device")
+    local_date = models.DateField(null=True, blank=True, editable=False, help_text="Calendar date of the timestamp in the device timezone")
+    # Student placement when the record was taken (copied on insert, see save())
+    branch = models.ForeignKey(
+        Branch,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=False,
+        related_name='attendances',
+        help_text="Student's branch on the day of the record"
+    )
+    grade = models.CharField(max_length=20, choices=Grade.choices, blank=True, editable=False, help_text="Student's grade on the day of the record")
+    level = models.IntegerField(null=True, blank=True, editable=False, help_text="Student's level on the day of the record")
+    class_name = models.CharField(max_length=2, blank=True, editable=False, help_text="Student's class on the day of the record")
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, null=True, blank=True, help_text="Attendance status: Attended, Late, or Absent")
     is_synced = models.BooleanField(default=False, help_text="Whether this record was synced from device")
     notes = models.TextField(blank=True, help_text="Additional notes")
@@ -125,13 +142,40 @@ class Attendance(models.Model):
         verbose_name_plural = 'Attendances'
         indexes = [
             models.Index(fields=['student', 'timestamp']),
-            models.Index(fields=['timestamp']),
+            # Keyset pagination order
+            models.Index(fields=['timestamp', 'id']),
             models.Index(fields=['attendance_type', 'timestamp']),
+            # Day-bounded queries (reports, register, daily summaries)
+            models.Index(fields=['student', 'local_date']),
+            models.Index(fields=['local_date', 'attendance_type', 'status']),
+            # Placement filters on the snapshot columns, without joining the student
+            models.Index(fields=['branch', 'local_date']),
+            models.Index(fields=['local_date', 'branch', 'grade', 'level', 'class_name']),
         ]
 
     def __str__(self):
         return f"{self.student.full_name} - {self.attendance_type} - {self.timestamp}"
 
+    def snapshot_student(self):
+        """Copy the student's current branch, grade, level and class onto the record"""
+        student = self.student
+        self.branch_id = student.branch_id
+        self.grade = student.grade
+        self.level = student.level
+        self.class_name = student.class_name or ''
+
+    def save(self, *args, **kwargs):
+        """Keep local_date in sync with the timestamp and snapshot the student's placement on insert"""
+        if self._state.adding and self.student_id and not self.grade:
+            self.snapshot_student()
+        if self.timestamp:
+            from .utils import get_local_date
+            self.local_date = get_local_date(self.timestamp)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'timestamp' in update_fields and 'local_date' not in update_fields:
+                kwargs['update_fields'] = [*update_fields, 'local_date']
+        super().save(*args, **kwargs)
+
     @classmethod
     def create_attendance(cls, student, attendance_type, timestamp, device=None):
         """Create attendance record with automatic device assignment"""
@@ -172,12 +216,21 @@ class SMSLog(models.Model):
     STATUS_CHOICES = [
         ('PENDING', 'Pending'),
         ('SENT', 'Sent'),
+        ('DELIVERED', 'Delivered'),
         ('FAILED', 'Failed'),
     ]
+    CHANNEL_CHOICES = [
+        ('SMS', 'SMS'),
+        ('WHATSAPP', 'WhatsApp'),
+    ]
 
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='sms_logs')
     parent = models.ForeignKey(Parent, on_delete=models.CASCADE, related_name='sms_logs')
-    attendance = models.ForeignKey(Attendance, on_delete=models.CASCADE, related_name='sms_logs')
+    # Not enforced by the database: attendance is partitioned by month (see migration 0009)
+    attendance = models.ForeignKey(
+        Attendance, on_delete=models.CASCADE, related_name='sms_logs', db_constraint=False
+    )
+    channel = models.CharField(max_length=20, choices=CHANNEL_CHOICES, default='SMS')
     phone_number = models.CharField(max_length=20, help_text="Phone number SMS was sent to")
     message = models.TextField(help_text="SMS message content")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
@@ -197,6 +250,12 @@ class SMSLog(models.Model):
             models.Index(fields=['student', 'created_at']),
             models.Index(fields=['status', 'created_at']),
             models.Index(fields=['attendance']),
+            # Keyset pagination order
+            models.Index(fields=['created_at', 'id']),
+            # Delivery receipts are matched by provider message ID
+            models.Index(
+                fields=['message_id'], name='attendance_smslog_msgid_idx', condition=~models.Q(message_id='')
+            ),
         ]
 
     def __str__(self):
@@ -208,6 +267,7 @@ class SMSLog(models.Model):
         status_map = {
             'PENDING': 'Pending',
             'SENT': 'Sent',
+            'DELIVERED': 'Delivered',
             'FAILED': 'Failed',
         }
         return status_map.get(self.status, self.status)
@@ -244,6 +304,11 @@ class AttendanceSettings(models.Model):
             raise ValidationError("Lateness start time must be after attendance end time")
         if self.lateness_start_time >= self.lateness_end_time:
             raise ValidationError("Lateness start time must be before end time")
+        from .message_templates import validate_template
+        try:
+            validate_template(self.sms_template)
+        except ValidationError as e:
+            raise ValidationError({'sms_template': e.messages})
 
     def get_sync_frequency_seconds(self):
         """Get total sync frequency in seconds"""
@@ -327,6 +392,326 @@ class AttendanceSettings(models.Model):
             return 'ABSENT'
 
 
+class ReportJob(models.Model):
+    """Background attendance report job, cached by a hash of its normalized filters"""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('COMPLETED', 'Completed'),
+        ('FAILED', 'Failed'),
+    ]
+
+    FORMAT_CHOICES = [
+        ('json', 'JSON'),
+        ('csv', 'CSV'),
+        ('xlsx', 'XLSX'),
+    ]
+
+    filter_hash = models.CharField(max_length=64, unique=True, help_text="SHA-256 of the normalized filters and format")
+    filters = models.JSONField(help_text="Normalized report filters (branch, grade, level, class, dates)")
+    file_format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='json')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    result = models.JSONField(null=True, blank=True, help_text="Report data for JSON jobs")
+    file = models.FileField(upload_to='reports/', blank=True, help_text="Generated export file for CSV/XLSX jobs")
+    error_message = models.TextField(blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True, help_text="When the cached result expires (empty = never, for past-day reports)")
+    requested_by = models.ForeignKey('auth.User', on_delete=models.SET_NULL, null=True, blank=True, related_name='report_jobs')
+    completed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Report Job'
+        verbose_name_plural = 'Report Jobs'
+
+    def __str__(self):
+        return f"Report {self.file_format} {self.filters.get('date_from')}..{self.filters.get('date_to')} - {self.status}"
+
+    @property
+    def is_expired(self):
+        from django.utils import timezone
+        return self.expires_at is not None and self.expires_at <= timezone.now()
+
+    @property
+    def is_reusable(self):
+        """Whether an identical request can attach to this job instead of starting a new one"""
+        from datetime import timedelta
+        from django.conf import settings
+        from django.utils import timezone
+
+        if self.status in ('PENDING', 'RUNNING'):
+            # A job stuck this long lost its worker and must be restarted
+            stale_after = timedelta(seconds=getattr(settings, 'REPORT_JOB_STALE_SECONDS', 1800))
+            return self.updated_at > timezone.now() - stale_after
+        return self.status == 'COMPLETED' and not self.is_expired
+
+
+
+class AttendanceArchive(models.Model):
+    """Attendance record moved out of the hot table once its school year closed"""
+    # Keeps the original attendance ID
+    id = models.BigIntegerField(primary_key=True)
+    student = models.ForeignKey(
+        Student, on_delete=models.CASCADE, related_name='archived_attendances', db_constraint=False
+    )
+    device = models.ForeignKey(
+        FingerprintDevice,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='archived_attendances',
+        db_constraint=False,
+    )
+    attendance_type = models.CharField(max_length=10, choices=Attendance.ATTENDANCE_TYPE_CHOICES)
+    timestamp = models.DateTimeField()
+    local_date = models.DateField(null=True, blank=True)
+    branch = models.ForeignKey(
+        Branch, on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_attendances', db_constraint=False
+    )
+    grade = models.CharField(max_length=20, choices=Grade.choices, blank=True)
+    level = models.IntegerField(null=True, blank=True)
+    class_name = models.CharField(max_length=2, blank=True)
+    status = models.CharField(max_length=10, choices=Attendance.STATUS_CHOICES, null=True, blank=True)
+    is_synced = models.BooleanField(default=False)
+    notes = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-timestamp']
+        verbose_name = 'Archived Attendance'
+        verbose_name_plural = 'Archived Attendances'
+        indexes = [
+            models.Index(fields=['student', 'timestamp']),
+            models.Index(fields=['timestamp']),
+            models.Index(fields=['student', 'local_date']),
+        ]
+
+    def __str__(self):
+        return f"{self.student_id} - {self.attendance_type} - {self.timestamp} (archived)"
+
+
+class SMSLogArchive(models.Model):
+    """SMS log moved out of the hot table once its school year closed"""
+    # Keeps the original SMS log ID
+    id = models.BigIntegerField(primary_key=True)
+    student = models.ForeignKey(
+        Student, on_delete=models.CASCADE, related_name='archived_sms_logs', db_constraint=False
+    )
+    parent = models.ForeignKey(
+        Parent, on_delete=models.CASCADE, related_name='archived_sms_logs', db_constraint=False
+    )
+    attendance_id = models.BigIntegerField(help_text="ID of the (archived) attendance record")
+    channel = models.CharField(max_length=20, choices=SMSLog.CHANNEL_CHOICES, default='SMS')
+    phone_number = models.CharField(max_length=20)
+    message = models.TextField()
+    status = models.CharField(max_length=20, choices=SMSLog.STATUS_CHOICES)
+    api_response = models.JSONField(null=True, blank=True)
+    error_message = models.TextField(blank=True)
+    message_id = models.CharField(max_length=255, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Archived SMS Log'
+        verbose_name_plural = 'Archived SMS Logs'
+        indexes = [
+            models.Index(fields=['student', 'created_at']),
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"SMS to {self.phone_number} for student {self.student_id} - {self.status} (archived)"
+
+
+class ArchiveRun(models.Model):
+    """Checkpoint of an archival run moving rows recorded before a cutoff"""
+    STATUS_CHOICES = [
+        ('RUNNING', 'Running'),
+        ('COMPLETED', 'Completed'),
+        ('FAILED', 'Failed'),
+    ]
+
+    cutoff = models.DateTimeField(unique=True, help_text="Rows recorded before this instant are archived (start of a school year)")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='RUNNING')
+    sms_logs_archived = models.PositiveIntegerField(default=0)
+    attendances_archived = models.PositiveIntegerField(default=0)
+    error_message = models.TextField(blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-cutoff']
+        verbose_name = 'Archive Run'
+        verbose_name_plural = 'Archive Runs'
+
+    def __str__(self):
+        return f"Archive before {self.cutoff} - {self.status}"
+
+
+class DailyAbsence(models.Model):
+    """
+    Materialized absence of an active student on a school day.
+
+    A student is absent when they have no ATTENDED or LATE check-in that day.
+    Rows are written in bulk by the end-of-day job (see attendance.absences)
+    and the student's branch, grade, level and class are copied in, so absence
+    lists and counts are indexed lookups instead of anti-joins on the roster.
+    """
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='absences')
+    date = models.DateField(help_text="School day in the device timezone")
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='absences', help_text="Student's branch when the absence was recorded")
+    grade = models.CharField(max_length=20, choices=Grade.choices)
+    level = models.IntegerField(null=True, blank=True)
+    class_name = models.CharField(max_length=2, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-date', 'student_id']
+        verbose_name = 'Daily Absence'
+        verbose_name_plural = 'Daily Absences'
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'date'], name='unique_daily_absence'),
+        ]
+        indexes = [
+            models.Index(fields=['date', 'branch', 'grade']),
+        ]
+
+    def __str__(self):
+        return f"{self.student.full_name} - absent - {self.date}"
+
+
+class AbsenceRun(models.Model):
+    """Marker of a school day whose absences have been materialized"""
+    STATUS_CHOICES = [
+        ('RUNNING', 'Running'),
+        ('COMPLETED', 'Completed'),
+        ('FAILED', 'Failed'),
+    ]
+
+    date = models.DateField(unique=True, help_text="School day in the device timezone")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='RUNNING')
+    absences_recorded = models.PositiveIntegerField(default=0)
+    error_message = models.TextField(blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-date']
+        verbose_name = 'Absence Run'
+        verbose_name_plural = 'Absence Runs'
+
+    def __str__(self):
+        return f"Absences for {self.date} - {self.status}"
+
+
+class StudentAttendanceStats(models.Model):
+    """
+    Running attendance counters of a student for the current school year.
+
+    Updated incrementally when check-ins are ingested and by the end-of-day
+    absence job (see attendance.student_stats), so a student's rate, late
+    count and current streak are read from one row.
+    """
+    STREAK_CHOICES = [
+        ('PRESENT', 'Present'),
+        ('ABSENT', 'Absent'),
+    ]
+
+    student = models.OneToOneField(Student, on_delete=models.CASCADE, primary_key=True, related_name='attendance_stats')
+    school_year_start = models.DateField(help_text="First day of the school year the counters cover")
+    days_present = models.PositiveIntegerField(default=0, help_text="School days attended on time")
+    days_late = models.PositiveIntegerField(default=0, help_text="School days attended late")
+    days_absent = models.PositiveIntegerField(default=0, help_text="Recorded absences")
+    current_streak = models.PositiveIntegerField(default=0, help_text="Consecutive counted school days with the streak status")
+    streak_status = models.CharField(max_length=10, choices=STREAK_CHOICES, blank=True)
+    last_day_status = models.CharField(max_length=10, choices=Attendance.STATUS_CHOICES, blank=True, help_text="Outcome of the last counted day")
+    last_counted_date = models.DateField(null=True, blank=True, help_text="Last school day included in the counters")
+    last_seen = models.DateTimeField(null=True, blank=True, help_text="Latest attendance record of the student")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Student Attendance Stats'
+        verbose_name_plural = 'Student Attendance Stats'
+        indexes = [
+            # At-risk lists: longest current absence streaks
+            models.Index(fields=['streak_status', 'current_streak']),
+        ]
+
+    def __str__(self):
+        return f"{self.student.full_name} - {self.days_counted} day(s) counted"
+
+    @property
+    def days_counted(self):
+        return self.days_present + self.days_late + self.days_absent
+
+    @property
+    def attendance_rate(self):
+        """Share of counted school days attended (on time or late), in percent"""
+        if not self.days_counted:
+            return 0
+        return round((self.days_present + self.days_late) / self.days_counted * 100, 2)
+
+
+class NotificationOutbox(models.Model):
+    """
+    Attendance notification waiting to be sent to one parent on one channel.
+
+    Rows are written in the same transaction as the attendance record and
+    drained by dispatch workers (see attendance.outbox), so a notification is
+    never lost between the insert and the send, and failed sends are retried.
+    """
+    CHANNEL_CHOICES = [
+        ('SMS', 'SMS'),
+        ('WHATSAPP', 'WhatsApp'),
+    ]
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('PROCESSING', 'Processing'),
+        ('SENT', 'Sent'),
+        ('DEAD', 'Dead letter'),
+    ]
+
+    idempotency_key = models.CharField(max_length=100, unique=True, help_text="Channel, attendance and parent; a notification is queued once")
+    channel = models.CharField(max_length=20, choices=CHANNEL_CHOICES)
+    # Not enforced by the database: attendance is partitioned by month (see migration 0009)
+    attendance = models.ForeignKey(
+        Attendance, on_delete=models.CASCADE, related_name='notifications', db_constraint=False
+    )
+    parent = models.ForeignKey(Parent, on_delete=models.CASCADE, related_name='notifications')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0, help_text="Send attempts so far")
+    next_attempt_at = models.DateTimeField(default=timezone.now, help_text="When the notification is due (or its claim expires)")
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Notification Outbox Entry'
+        verbose_name_plural = 'Notification Outbox'
+        indexes = [
+            # Dispatcher queue: due pending rows and expired claims
+            models.Index(
+                fields=['next_attempt_at'],
+                condition=models.Q(status__in=['PENDING', 'PROCESSING']),
+                name='attendance_outbox_due_idx',
+            ),
+            models.Index(fields=['status', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.channel} to parent {self.parent_id} for attendance {self.attendance_id} - {self.status}"
+
 @receiver(post_save, sender=AttendanceSettings)
 def update_periodic_task(sender, instance, **kwargs):
     """Update Celery Beat periodic task when sync frequency changes"""
@@ -365,3 +750,52 @@ def update_periodic_task(sender, instance, **kwargs):
         # Don't fail if Celery Beat tables don't exist
         pass
 
+
+
+@receiver(post_save, sender=Attendance)
+def update_attendance_counters(sender, instance, created, **kwargs):
+    """Keep the live daily counters in sync once the attendance row is committed"""
+    from .counters import record_attendance, invalidate_day
+    from .utils import get_local_date
+
+    if created:
+        transaction.on_commit(lambda: record_attendance(instance))
+    else:
+        day = get_local_date(instance.timestamp)
+        transaction.on_commit(lambda: invalidate_day(day))
+
+
+@receiver(post_save, sender=Attendance)
+def clear_materialized_absence(sender, instance, **kwargs):
+    """A check-in synced after the end-of-day job cancels that day's absence"""
+    if instance.attendance_type == 'CHECK_IN' and instance.status in ('ATTENDED', 'LATE') and instance.local_date:
+        DailyAbsence.objects.filter(student_id=instance.student_id, date=instance.local_date).delete()
+
+
+@receiver(post_save, sender=Attendance)
+def update_student_stats(sender, instance, created, **kwargs):
+    """Count a newly ingested record in the student's running statistics"""
+    from .student_stats import record_attendance_stats
+
+    if created:
+        transaction.on_commit(lambda: record_attendance_stats(instance))
+
+
+@receiver(post_delete, sender=Attendance)
+def invalidate_attendance_counters(sender, instance, **kwargs):
+    """Drop the live counters of the deleted record's day"""
+    from .counters import invalidate_day
+    from .utils import get_local_date
+
+    day = get_local_date(instance.timestamp)
+    transaction.on_commit(lambda: invalidate_day(day))
+
+
+@receiver(post_save, sender=AttendanceSettings)
+def invalidate_today_counters(sender, instance, **kwargs):
+    """Attendance windows affect statuses, so rebuild today's counters"""
+    from .counters import invalidate_day
+    from .utils import get_local_date
+
+    day = get_local_date()
+    transaction.on_commit(lambda: invalidate_day(day))
@@ -2,542 +2,293 @@
 WhatsApp and SMS notification services for attendance alerts
 - WhatsApp: Meta WhatsApp Cloud API
 - SMS: Mora SMS API
+
+Both channels share NotificationService: the parent fan-out, grouping of
+identical texts into submissions, error handling and logging. A channel only
+renders its messages; the provider calls are made by the channel's backend
+(see attendance.channel_backends), so a channel can be pointed at an
+in-memory or local stub provider without code changes.
 """
-from typing import List, Dict, Optional
-import requests
-import pytz
+import logging
+import time
+from typing import List, Dict, Optional, Tuple
 from django.conf import settings
 from django.utils import timezone
 from core.models import Student, Parent
 from .models import Attendance, SMSLog
+from .channel_backends import ChannelBackend, get_backend
 
+logger = logging.getLogger(__name__)
 
-class WhatsAppNotificationService:
-    """Service for sending WhatsApp messages to parents about student attendance using Meta WhatsApp Cloud API"""
-    
-    def __init__(self):
-        self.enabled = getattr(settings, 'WHATSAPP_ENABLED', False)
-        self.access_token = getattr(settings, 'WHATSAPP_ACCESS_TOKEN', None)
-        self.phone_number_id = getattr(settings, 'WHATSAPP_PHONE_NUMBER_ID', None)
-        self.api_version = getattr(settings, 'WHATSAPP_API_VERSION', None) or 'v22.0'
-        # Option to use local format (without country code) if numbers are added to allowed list in local format
-        self.use_local_format = getattr(settings, 'WHATSAPP_USE_LOCAL_FORMAT', False)
-        
-    def _format_phone_number(self, phone: str) -> str:
-        """Format phone number for WhatsApp API
-        
-        Send the number exactly as stored in database (e.g., +201011170770)
-        Only remove spaces and 'whatsapp:' prefix, keep + sign and all other characters
-        """
-        # Remove only spaces and 'whatsapp:' prefix, keep everything else including +
-        phone_number = phone.replace(' ', '').replace('whatsapp:', '').strip()
-        
-        # Return the number exactly as stored (with + sign if present)
-        return phone_number
-    
-    def _send_whatsapp_message(self, to: str, message: str) -> Dict:
-        """Send WhatsApp message using Meta WhatsApp Cloud API"""
+# Result of a submission not started because it could outlast the claim on its outbox rows
+LEASE_EXPIRING = {
+    'success': False, 'error': 'Claim on the notification about to expire, released for another attempt',
+    'status': 'FAILED', 'retriable': True, 'retry_after': 0,
+}
+
+
+def resolve_recipients(attendances: List[Attendance]) -> Dict[int, List[Parent]]:
+    """Parents to notify per attendance record, for any number of records in one query"""
+    links = (
+        Student.parents.through.objects
+        .filter(student_id__in={attendance.student_id for attendance in attendances})
+        .select_related('parent')
+        .order_by('parent_id')
+    )
+    parents_by_student = {}
+    for link in links:
+        parents_by_student.setdefault(link.student_id, []).append(link.parent)
+    return {attendance.id: parents_by_student.get(attendance.student_id, []) for attendance in attendances}
+
+
+class NotificationService:
+    """Sends attendance notifications of one channel to parents through the channel's backend"""
+
+    channel = None
+    label = None
+
+    def __init__(self, backend: Optional[ChannelBackend] = None):
+        self.enabled = getattr(settings, f'{self.channel}_ENABLED', False)
+        self.backend = backend or get_backend(self.channel)
+
+    def check_configuration(self) -> Optional[Dict]:
+        """Failure result when sending is disabled or the backend is not configured, else None"""
         if not self.enabled:
-            return {'success': False, 'error': 'WhatsApp notifications are disabled'}
-        
-        if not all([self.access_token, self.phone_number_id]):
-            return {'success': False, 'error': 'WhatsApp API credentials not configured'}
-        
-        try:
-            # Format phone number to international format
-            phone_number = self._format_phone_number(to)
-            print(f"📱 Formatted phone number: {to} -> {phone_number}")
-            
-            # WhatsApp Cloud API endpoint
-            url = f'https://graph.facebook.com/{self.api_version}/{self.phone_number_id}/messages'
-            
-            # Headers
-            headers = {
-                'Authorization': f'Bearer {self.access_token}',
-                'Content-Type': 'application/json'
-            }
-            
-            # Request body for text message
-            payload = {
-                'messaging_product': 'whatsapp',
-                'to': phone_number,
-                'type': 'text',
-                'text': {
-                    'body': message
-                }
-            }
-            
-            # Send request
-            response = requests.post(url, json=payload, headers=headers)
-            
-            # Log response for debugging
-            print(f"📡 WhatsApp API Response Status: {response.status_code}")
-            
-            if response.status_code != 200:
-                error_data = response.json() if response.content else {}
-                error_msg = error_data.get('error', {}).get('message', f'HTTP {response.status_code}: {response.text}')
-                print(f"✗ WhatsApp API Error: {error_msg}")
-                return {'success': False, 'error': f'WhatsApp API error: {error_msg}'}
-            
-            response.raise_for_status()
-            result = response.json()
-            
-            # Extract important info from response
-            message_id = result.get('messages', [{}])[0].get('id') if result.get('messages') else None
-            contacts = result.get('contacts', [])
-            wa_id = contacts[0].get('wa_id') if contacts else None
-            
-            print(f"  WhatsApp API Success:")
-            print(f"  Message ID: {message_id}")
-            print(f"  Input number: {phone_number}")
-            print(f"  WhatsApp ID (wa_id): {wa_id}")
-            print(f"  Full response: {result}")
-            
-            # Check if wa_id matches our input - if not, there might be a format issue
-            if wa_id and wa_id != phone_number:
-                print(f"⚠ Warning: wa_id ({wa_id}) doesn't match input ({phone_number}) - format might be incorrect")
-            
-            return {
-                'success': True,
-                'message_id': message_id,
-                'wa_id': wa_id,
-                'status': 'sent',
-                'input_number': phone_number
-            }
-        except requests.exceptions.RequestException as e:
-            error_msg = str(e)
-            if hasattr(e, 'response') and e.response is not None:
-                try:
-                    error_data = e.response.json()
-                    error_msg = error_data.get('error', {}).get('message', str(e))
-                    print(f"✗ WhatsApp API Request Exception: {error_msg}")
-                except (ValueError, KeyError):
-                    error_msg = e.response.text or str(e)
-                    print(f"✗ WhatsApp API Request Exception (raw): {error_msg}")
+            return {'success': False, 'error': f'{self.label} notifications are disabled', 'retriable': True}
+        return self.backend.check_configuration()
+
+    def render_messages(self, recipients: List[Tuple[Attendance, Parent]]) -> List[str]:
+        """Message text for each (attendance, parent) recipient"""
+        raise NotImplementedError
+
+    def plan_batch(self, recipients: List[Tuple[Attendance, Parent]]) -> Tuple[List[Optional[Dict]], List[Tuple[str, List[int]]]]:
+        """
+        Group recipients into submissions, one per distinct message text (split
+        at the backend's max_recipients numbers).
+
+        Returns the results known without sending (parents without a phone
+        number, None for the others) and the submissions as (message,
+        recipient indexes).
+        """
+        max_numbers = self.backend.max_recipients
+        results = [None] * len(recipients)
+        groups = {}
+        messages = self.render_messages(recipients)
+        for index, ((attendance, parent), message) in enumerate(zip(recipients, messages)):
+            if not parent.phone_number:
+                error_msg = f'Parent {parent.full_name} has no phone number'
+                results[index] = {'success': False, 'error': error_msg, 'status': 'FAILED', 'message': message, 'retriable': False}
+                continue
+            groups.setdefault(message, []).append(index)
+        submissions = [
+            (message, indexes[start:start + max_numbers])
+            for message, indexes in groups.items()
+            for start in range(0, len(indexes), max_numbers)
+        ]
+        return results, submissions
+
+    @staticmethod
+    def fan_out(results: List[Optional[Dict]], indexes: List[int], message: str, result: Dict):
+        """Give every recipient of a submission its result"""
+        for index in indexes:
+            results[index] = {**result, 'message': message, 'batch_size': len(indexes)}
+
+    def send_batch(self, recipients: List[Tuple[Attendance, Parent]], deadline: Optional[float] = None) -> List[Dict]:
+        """
+        Send attendance notifications to several parents with one backend call
+        per submission (see plan_batch).
+
+        Recipients with identical messages (e.g. an SMS template without
+        per-parent variables) share a multi-number submission, and its result
+        and message ID. Returns one result per recipient, in order, carrying
+        the 'message' sent and 'retriable' when a later attempt may succeed.
+
+        No submission is started that could still be running at deadline (a
+        time.monotonic() value); the remaining ones are held back.
+        """
+        results, submissions = self.plan_batch(recipients)
+        held_back = self.check_configuration()
+        for message, chunk in submissions:
+            if not held_back and deadline is not None and time.monotonic() + self.backend.max_send_seconds >= deadline:
+                held_back = LEASE_EXPIRING
+            if held_back:
+                # Not configured, out of time, or held back by the rate limit or circuit breaker: defer the remaining submissions too
+                result = held_back
             else:
-                print(f"✗ WhatsApp API Request Exception: {error_msg}")
-            return {'success': False, 'error': f'WhatsApp API error: {error_msg}'}
-        except Exception as e:
-            return {'success': False, 'error': str(e)}
-    
-    def _format_attendance_message(self, student: Student, attendance: Attendance) -> str:
-        """Format the attendance notification message"""
-        attendance_type = 'checked in' if attendance.attendance_type == 'CHECK_IN' else 'checked out'
-        
-        # Convert UTC timestamp to device's local timezone for display
-        # The timestamp is stored in UTC in the database, but we want to show the same time
-        # as displayed on the fingerprint device (local time)
-        from .utils import get_device_timezone
-        device_tz = get_device_timezone()
-        
-        # Ensure timestamp is timezone-aware (should be UTC from database)
-        if timezone.is_naive(attendance.timestamp):
-            timestamp = timezone.make_aware(attendance.timestamp)
+                logger.debug(f"Sending {self.label} to {len(chunk)} parent(s) in one submission...")
+                result = self.backend.send([recipients[index][1].phone_number for index in chunk], message)
+                if result.get('success'):
+                    logger.info(f"{self.label} sent successfully to {len(chunk)} parent(s)")
+                else:
+                    logger.warning(f"Failed to send {self.label} to {len(chunk)} parent(s): {result.get('error', 'Unknown error')}")
+                if result.get('retry_after') is not None:
+                    held_back = result
+            self.fan_out(results, chunk, message, result)
+        return results
+
+    def send_to_parent(self, attendance: Attendance, parent: Parent) -> Dict:
+        """Send the attendance notification to one parent without logging it"""
+        return self.send_batch([(attendance, parent)])[0]
+
+    def build_log(self, attendance: Attendance, parent: Parent, result: Dict) -> SMSLog:
+        """Unsaved log entry for the outcome of a send, matched later by delivery receipts"""
+        if result.get('success'):
+            # Use timestamp from API response if available, otherwise use current time
+            # The API timestamp is the actual time the SMS was sent by the provider
+            status = 'SENT'
+            sent_at = result.get('timestamp') or timezone.now()
         else:
-            timestamp = attendance.timestamp
-        
-        # Convert from UTC to device's local timezone
-        local_timestamp = timestamp.astimezone(device_tz)
-        
-        time_str = local_timestamp.strftime('%I:%M %p')
-        date_str = local_timestamp.strftime('%B %d, %Y')
-        
-        message = "📚 *Qurtubah School*\n\n"
-        message += f"Hello! Your child *{student.full_name}* has {attendance_type} at {time_str} on {date_str}.\n\n"
-        message += "Thank you for your attention."
-        
-        return message
-    
-    def send_attendance_notification(self, attendance: Attendance) -> Dict:
-        """Send attendance notification to all parents of a student"""
-        if not self.enabled:
-            print("⚠ WhatsApp notifications are disabled (WHATSAPP_ENABLED=False)")
-            return {'success': False, 'sent': 0, 'failed': 0, 'errors': ['WhatsApp notifications are disabled']}
-        
-        if not all([self.access_token, self.phone_number_id]):
-            print(f"⚠ WhatsApp credentials missing: access_token={'set' if self.access_token else 'missing'}, phone_number_id={'set' if self.phone_number_id else 'missing'}")
-            return {'success': False, 'sent': 0, 'failed': 0, 'errors': ['WhatsApp API credentials not configured']}
-        
+            status = 'FAILED'
+            sent_at = None
+
+        return SMSLog(
+            student_id=attendance.student_id,
+            parent=parent,
+            attendance=attendance,
+            channel=self.channel,
+            phone_number=parent.phone_number or '',
+            message=result.get('message', ''),
+            status=status,
+            api_response=result.get('response', {}),
+            error_message=result.get('error', '') if not result.get('success') else '',
+            message_id=(result.get('message_id') or '') if result.get('success') else '',
+            sent_at=sent_at
+        )
+
+    def log_result(self, attendance: Attendance, parent: Parent, result: Dict) -> SMSLog:
+        """Record the outcome of a send_to_parent() call in the log"""
+        sms_log = self.build_log(attendance, parent, result)
+        sms_log.save()
+        return sms_log
+
+    def send_attendance_notification(self, attendance: Attendance, parents: Optional[List[Parent]] = None) -> Dict:
+        """Send the attendance notification to all parents of a student (or the given parents) and log results"""
+        configuration_error = self.check_configuration()
+        if configuration_error:
+            logger.warning(configuration_error['error'])
+            return {'success': False, 'sent': 0, 'failed': 0, 'errors': [configuration_error['error']]}
+
         student = attendance.student
-        parents = student.parents.all()
-        
-        if not parents.exists():
-            print(f"⚠ No parents found for student {student.full_name}")
+        if parents is None:
+            parents = resolve_recipients([attendance])[attendance.id]
+
+        if not parents:
+            logger.warning(f"No parents found for student {student.full_name}")
             return {
                 'success': False,
                 'sent': 0,
                 'failed': 0,
                 'errors': [f'No parents found for student {student.full_name}']
             }
-        
-        message = self._format_attendance_message(student, attendance)
+
         results = {
             'success': True,
             'sent': 0,
             'failed': 0,
-            'errors': []
+            'errors': [],
+            'logs': []
         }
-        
-        for parent in parents:
-            # Check if parent has phone number
-            if not parent.phone_number:
-                error_msg = f'Parent {parent.full_name} has no phone number'
-                print(f"⚠ {error_msg}")
-                results['errors'].append(error_msg)
-                results['failed'] += 1
-                continue
-            
-            # Send WhatsApp message
-            print(f"📤 Sending WhatsApp message to {parent.full_name} ({parent.phone_number})...")
-            result = self._send_whatsapp_message(parent.phone_number, message)
-            
+
+        sent = self.send_batch([(attendance, parent) for parent in parents])
+        for parent, result in zip(parents, sent):
             if result.get('success'):
-                print(f"✓ Message sent successfully to {parent.full_name}")
                 results['sent'] += 1
             else:
-                error_msg = f'Failed to send to {parent.full_name}: {result.get("error", "Unknown error")}'
-                print(f"✗ {error_msg}")
                 results['failed'] += 1
-                results['errors'].append(error_msg)
-        
+                results['errors'].append(f'Failed to send to {parent.full_name}: {result.get("error", "Unknown error")}')
+        logs = SMSLog.objects.bulk_create([
+            self.build_log(attendance, parent, result) for parent, result in zip(parents, sent)
+        ])
+        results['logs'] = [sms_log.id for sms_log in logs]
+
         return results
-    
-    def send_bulk_attendance_notifications(self, attendances: List[Attendance]) -> Dict:
+
+    def send_bulk_attendance_notifications(self, attendances: List[Attendance], recipients: Optional[Dict[int, List[Parent]]] = None) -> Dict:
         """Send notifications for multiple attendance records"""
+        recipients = recipients if recipients is not None else resolve_recipients(attendances)
         total_sent = 0
         total_failed = 0
         all_errors = []
-        
+        all_logs = []
+
         for attendance in attendances:
-            result = self.send_attendance_notification(attendance)
+            result = self.send_attendance_notification(attendance, recipients[attendance.id])
             total_sent += result.get('sent', 0)
             total_failed += result.get('failed', 0)
             all_errors.extend(result.get('errors', []))
-        
+            all_logs.extend(result.get('logs', []))
+
         return {
             'success': total_failed == 0,
             'total_sent': total_sent,
             'total_failed': total_failed,
-            'errors': all_errors
+            'errors': all_errors,
+            'logs': all_logs
         }
 
 
-class SMSNotificationService:
-    """Service for sending SMS messages to parents about student attendance using Mora SMS API"""
-    
-    # Mora SMS API error codes mapping
-    ERROR_CODES = {
-        100: 'Numbers received successfully',
-        105: 'Insufficient balance',
-        106: 'Sender name not available',
-        107: 'Sender name is blocked',
-        108: 'No valid numbers for sending',
-        112: 'Message contains prohibited words',
-        114: 'Account is suspended',
-        115: 'Mobile number not activated',
-        116: 'Email not activated',
-        117: 'Empty message cannot be sent',
-        118: 'Sender name is empty',
-        119: 'No recipient number provided',
-    }
-    
-    def __init__(self):
-        self.enabled = getattr(settings, 'SMS_ENABLED', False)
-        self.api_key = getattr(settings, 'SMS_API_KEY', None)
-        self.username = getattr(settings, 'SMS_USERNAME', None)
-        self.sender_name = getattr(settings, 'SMS_SENDER_NAME', None)
-        self.sender_number = getattr(settings, 'SMS_SENDER_NUMBER', None)
-        self.api_base_url = getattr(settings, 'SMS_API_BASE_URL', 'https://mora-sa.com/api/v1')
-    
-    def _format_phone_number(self, phone: str) -> str:
-        """Format phone number for Mora SMS API
-        
-        Mora SMS API expects numbers in international format (e.g., 966501234567)
-        Remove spaces, +, and other characters, keep only digits
-        """
-        # Remove spaces, +, and other non-digit characters
-        phone_number = ''.join(filter(str.isdigit, phone.replace(' ', '').replace('+', '').strip()))
-        return phone_number
-    
-    def _send_sms_message(self, to: str, message: str) -> Dict:
-        """Send SMS message using Mora SMS API"""
-        if not self.enabled:
-            return {'success': False, 'error': 'SMS notifications are disabled'}
-        
-        if not all([self.api_key, self.username, self.sender_name]):
-            return {'success': False, 'error': 'SMS API credentials not configured'}
-        
-        try:
-            # Format phone number
-            phone_number = self._format_phone_number(to)
-            if not phone_number:
-                return {'success': False, 'error': 'Invalid phone number'}
-            
-            # Mora SMS API endpoint
-            url = f'{self.api_base_url}/sendsms'
-            
-            # Request parameters
-            data = {
-                'api_key': self.api_key,
-                'username': self.username,
-                'message': message,
-                'sender': self.sender_name,
-                'numbers': phone_number,
-                'return': 'json'
-            }
-            
-            # Send request
-            response = requests.post(url, data=data, timeout=30)
-            
-            # Log response for debugging
-            print(f"📡 SMS API Response Status: {response.status_code}")
-            print(f"📡 SMS API Response Headers: {dict(response.headers)}")
-            print(f"📡 SMS API Raw Response Text: {response.text[:500]}")  # First 500 chars
-            
-            response.raise_for_status()
-            
-            # Try to parse JSON response
-            try:
-                result = response.json()
-            except ValueError:
-                # If response is not JSON, log the raw text
-                raw_response = response.text
-                print(f"✗ SMS API Response is not JSON: {raw_response}")
-                return {
-                    'success': False,
-                    'error': f'Invalid JSON response from API: {raw_response[:200]}',
-                    'status': 'FAILED',
-                    'response': {'raw': raw_response}
-                }
-            
-            # Log full response for debugging
-            print(f"📡 SMS API Full Response: {result}")
-            
-            # Mora API returns nested structure: {status: {...}, data: {code: 100, message: "...", ref_id: ...}}
-            # Check for data.code first (this is the actual SMS API response code)
-            data = result.get('data', {})
-            response_code = data.get('code') if isinstance(data, dict) else None
-            
-            # Fallback to top-level code if data.code doesn't exist
-            if response_code is None:
-                response_code = result.get('code') or result.get('Code') or result.get('status_code')
-            
-            # Get the message from data.message if available
-            api_message = data.get('message', '') if isinstance(data, dict) else ''
-            if not api_message:
-                api_message = result.get('message') or result.get('Message') or ''
-            
-            # Get ref_id for tracking
-            ref_id = data.get('ref_id') if isinstance(data, dict) else None
-            
-            # Extract timestamp from API response if available (format: "2026-01-18T10:45:30Z")
-            api_timestamp = None
-            if isinstance(data, dict) and data.get('timestamp'):
-                try:
-                    timestamp_str = data.get('timestamp')
-                    # Replace 'Z' with '+00:00' for ISO format parsing, or handle it directly
-                    if timestamp_str.endswith('Z'):
-                        timestamp_str = timestamp_str[:-1] + '+00:00'
-                    # Parse ISO format timestamp and make it timezone-aware
-                    from datetime import datetime as dt
-                    parsed_timestamp = dt.fromisoformat(timestamp_str)
-                    if timezone.is_naive(parsed_timestamp):
-                        api_timestamp = timezone.make_aware(parsed_timestamp, pytz.UTC)
-                    else:
-                        api_timestamp = parsed_timestamp
-                except (ValueError, AttributeError) as e:
-                    print(f"⚠ Warning: Failed to parse timestamp from API response: {e}")
-                    api_timestamp = None
-            
-            if response_code == 100:
-                # Success - SMS sent successfully
-                print(f"✓ SMS sent successfully (Code: {response_code}, Ref ID: {ref_id})")
-                return {
-                    'success': True,
-                    'code': response_code,
-                    'message': api_message or 'SMS sent successfully',
-                    'ref_id': ref_id,
-                    'status': 'SENT',
-                    'timestamp': api_timestamp,  # Include extracted timestamp
-                    'response': result
-                }
-            else:
-                # Error - check error codes
-                error_msg = self.ERROR_CODES.get(response_code, f'Unknown error code: {response_code}')
-                if api_message:
-                    error_msg = f'{error_msg}: {api_message}'
-                print(f"✗ SMS API Error: {error_msg} (Code: {response_code})")
-                return {
-                    'success': False,
-                    'error': error_msg,
-                    'code': response_code,
-                    'status': 'FAILED',
-                    'response': result
-                }
-                
-        except requests.exceptions.RequestException as e:
-            error_msg = str(e)
-            if hasattr(e, 'response') and e.response is not None:
-                try:
-                    error_data = e.response.json()
-                    error_msg = error_data.get('message', str(e))
-                    print(f"✗ SMS API Request Exception: {error_msg}")
-                except (ValueError, KeyError):
-                    error_msg = e.response.text or str(e)
-                    print(f"✗ SMS API Request Exception (raw): {error_msg}")
-            else:
-                print(f"✗ SMS API Request Exception: {error_msg}")
-            return {'success': False, 'error': f'SMS API error: {error_msg}', 'status': 'FAILED'}
-        except Exception as e:
-            return {'success': False, 'error': str(e), 'status': 'FAILED'}
-    
-    def _format_attendance_message(self, student: Student, attendance: Attendance, parent: Parent = None) -> str:
-        """Format the attendance notification SMS message using custom template from settings"""
-        from .models import AttendanceSettings
-        
-        # Get settings template
-        settings = AttendanceSettings.get_settings()
-        template = settings.sms_template
-        
+class WhatsAppNotificationService(NotificationService):
+    """Service for sending WhatsApp messages to parents about student attendance using Meta WhatsApp Cloud API"""
+
+    channel = 'WHATSAPP'
+    label = 'WhatsApp'
+
+    def render_messages(self, recipients: List[Tuple[Attendance, Parent]]) -> List[str]:
+        # The same text for every parent: formatted once per attendance record
+        messages = {}
+        for attendance, _ in recipients:
+            if attendance.id not in messages:
+                messages[attendance.id] = self._format_attendance_message(attendance.student, attendance)
+        return [messages[attendance.id] for attendance, _ in recipients]
+
+    def _format_attendance_message(self, student: Student, attendance: Attendance) -> str:
+        """Format the attendance notification message"""
+        attendance_type = 'checked in' if attendance.attendance_type == 'CHECK_IN' else 'checked out'
+
         # Convert UTC timestamp to device's local timezone for display
         # The timestamp is stored in UTC in the database, but we want to show the same time
         # as displayed on the fingerprint device (local time)
         from .utils import get_device_timezone
         device_tz = get_device_timezone()
-        
+
         # Ensure timestamp is timezone-aware (should be UTC from database)
         if timezone.is_naive(attendance.timestamp):
             timestamp = timezone.make_aware(attendance.timestamp)
         else:
             timestamp = attendance.timestamp
-        
+
         # Convert from UTC to device's local timezone
         local_timestamp = timestamp.astimezone(device_tz)
-        
-        # Format time from local timezone timestamp
+
         time_str = local_timestamp.strftime('%I:%M %p')
-        
-        # Get parent name
-        parent_name = parent.first_name if parent and parent.first_name else "Parent"
-        
-        # Replace template variables
-        message = template.format(
-            parent_name=parent_name,
-            student_name=student.full_name,
-            time_attended=time_str
-        )
-        
+        date_str = local_timestamp.strftime('%B %d, %Y')
+
+        message = "📚 *Qurtubah School*\n\n"
+        message += f"Hello! Your child *{student.full_name}* has {attendance_type} at {time_str} on {date_str}.\n\n"
+        message += "Thank you for your attention."
+
         return message
-    
-    def send_attendance_notification(self, attendance: Attendance) -> Dict:
-        """Send attendance SMS notification to all parents of a student and log results"""
-        if not self.enabled:
-            print("⚠ SMS notifications are disabled (SMS_ENABLED=False)")
-            return {'success': False, 'sent': 0, 'failed': 0, 'errors': ['SMS notifications are disabled']}
-        
-        if not all([self.api_key, self.username, self.sender_name]):
-            print(f"⚠ SMS credentials missing")
-            return {'success': False, 'sent': 0, 'failed': 0, 'errors': ['SMS API credentials not configured']}
-        
-        student = attendance.student
-        parents = student.parents.all()
-        
-        if not parents.exists():
-            print(f"⚠ No parents found for student {student.full_name}")
-            return {
-                'success': False,
-                'sent': 0,
-                'failed': 0,
-                'errors': [f'No parents found for student {student.full_name}']
-            }
-        
-        results = {
-            'success': True,
-            'sent': 0,
-            'failed': 0,
-            'errors': [],
-            'logs': []
-        }
-        
-        for parent in parents:
-            # Format personalized message for this parent
-            message = self._format_attendance_message(student, attendance, parent)
-            
-            # Check if parent has phone number
-            if not parent.phone_number:
-                error_msg = f'Parent {parent.full_name} has no phone number'
-                print(f"⚠ {error_msg}")
-                results['errors'].append(error_msg)
-                results['failed'] += 1
-                
-                # Log failed attempt
-                sms_log = SMSLog.objects.create(
-                    student=student,
-                    parent=parent,
-                    attendance=attendance,
-                    phone_number=parent.phone_number or '',
-                    message=message,
-                    status='FAILED',
-                    error_message=error_msg
-                )
-                results['logs'].append(sms_log.id)
-                continue
-            
-            # Send SMS message
-            print(f"📤 Sending SMS to {parent.full_name} ({parent.phone_number})...")
-            result = self._send_sms_message(parent.phone_number, message)
-            
-            # Determine status based on API response
-            if result.get('success'):
-                status = 'SENT'
-                # Use timestamp from API response if available, otherwise use current time
-                # The API timestamp is the actual time the SMS was sent by the provider
-                sent_at = result.get('timestamp') or timezone.now()
-                print(f"✓ SMS sent successfully to {parent.full_name}")
-                results['sent'] += 1
-            else:
-                status = 'FAILED'
-                sent_at = None
-                error_msg = result.get('error', 'Unknown error')
-                print(f"✗ Failed to send SMS to {parent.full_name}: {error_msg}")
-                results['failed'] += 1
-                results['errors'].append(f'Failed to send to {parent.full_name}: {error_msg}')
-            
-            # Create SMS log entry
-            sms_log = SMSLog.objects.create(
-                student=student,
-                parent=parent,
-                attendance=attendance,
-                phone_number=parent.phone_number,
-                message=message,
-                status=status,
-                api_response=result.get('response', {}),
-                error_message=result.get('error', '') if not result.get('success') else '',
-                message_id=str(result.get('ref_id', '')) if result.get('success') and result.get('ref_id') else '',
-                sent_at=sent_at
-            )
-            results['logs'].append(sms_log.id)
-        
-        return results
-    
-    def send_bulk_attendance_notifications(self, attendances: List[Attendance]) -> Dict:
-        """Send SMS notifications for multiple attendance records"""
-        total_sent = 0
-        total_failed = 0
-        all_errors = []
-        all_logs = []
-        
-        for attendance in attendances:
-            result = self.send_attendance_notification(attendance)
-            total_sent += result.get('sent', 0)
-            total_failed += result.get('failed', 0)
-            all_errors.extend(result.get('errors', []))
-            all_logs.extend(result.get('logs', []))
-        
-        return {
-            'success': total_failed == 0,
-            'total_sent': total_sent,
-            'total_failed': total_failed,
-            'errors': all_errors,
-            'logs': all_logs
-        }
\ No newline at end of file
+
+
+class SMSNotificationService(NotificationService):
+    """Service for sending SMS messages to parents about student attendance using Mora SMS API"""
+
+    channel = 'SMS'
+    label = 'SMS'
+
+    def render_messages(self, recipients: List[Tuple[Attendance, Parent]]) -> List[str]:
+        from .message_templates import render_messages
+
+        # Rendered in one pass: one settings lookup, one local time per attendance record
+        return render_messages(recipients)
+
+    def _format_attendance_message(self, student: Student, attendance: Attendance, parent: Parent = None) -> str:
+        """Format the attendance notification SMS message using custom template from settings"""
+        # The time is shown in the device's local timezone, as on the fingerprint device
+        # (student is the attendance record's student)
+        return self.render_messages([(attendance, parent)])[0]
+
+
+def get_channel_service(channel: str, backend: Optional[ChannelBackend] = None) -> NotificationService:
+    return SMSNotificationService(backend) if channel == 'SMS' else WhatsAppNotificationService(backend)
+
@@ -0,0 +1,409 @@
+"""
+Transactional outbox for attendance notifications
+
+Ingest paths call enqueue_notifications() in the same transaction as the
+attendance insert: one NotificationOutbox row per channel and parent, keyed by
+an idempotency key so a record is never queued twice. Repeated punches
+within NOTIFICATION_SUPPRESSION_WINDOW_SECONDS are not queued at all (see
+attendance.suppression). Nothing is sent inline, so a crash after the insert
+cannot lose a notification and a slow provider cannot slow down ingest.
+
+Dispatch workers (the attendance.dispatch_notifications task) drain the
+outbox concurrently. Each claims a batch of due rows with
+SELECT ... FOR UPDATE SKIP LOCKED, so workers never wait on or share rows,
+marks them PROCESSING with a lease (next_attempt_at) and sends them outside
+the claiming transaction. Outcomes:
+
+- sent: SENT;
+- retriable failure (network errors, throttling, configuration): back to
+  PENDING with exponential backoff and jitter;
+- permanent failure, or NOTIFICATION_OUTBOX_MAX_ATTEMPTS reached: DEAD
+  (dead letter), kept for inspection and requeue_dead_notifications();
+- held back by the provider rate limit or its open circuit breaker: PENDING
+  again when the provider can be called, without using up an attempt.
+
+SMS rows are due SMS_BATCH_WINDOW_SECONDS after they are queued, and a
+claimed batch sends identical SMS texts as one multi-number submission (see
+NotificationService.send_batch), so punches arriving together share API
+calls. Providers are called through each channel's backend (see
+attendance.channel_backends).
+
+attendance.async_dispatch drains the same outbox with a batch's provider
+requests in flight concurrently (NOTIFICATION_DISPATCH_MODE).
+
+Claimed rows are leased for NOTIFICATION_OUTBOX_LEASE_SECONDS, and at least
+twice the longest provider request (every retry timing out after the longest
+rate-limit wait). A worker does not start a request that could outlast its
+lease: the rest of the batch goes back to PENDING, due at once and without
+using up an attempt, so an expired lease never has two workers sending the
+same row. A worker that dies mid-batch leaves PROCESSING rows whose lease
+expires, after which another worker claims them again. Delivery is therefore
+at least once.
+"""
+import logging
+import math
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_MAX_ATTEMPTS = 6
+DEFAULT_RETRY_BASE_SECONDS = 30
+DEFAULT_RETRY_MAX_SECONDS = 3600
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_DISPATCH_SECONDS = 50
+DEFAULT_DISPATCH_CONCURRENCY = 4
+DEFAULT_RETENTION_DAYS = 14
+DEFAULT_SMS_BATCH_WINDOW_SECONDS = 2
+
+CHANNEL_SETTINGS = {'SMS': 'SMS_ENABLED', 'WHATSAPP': 'WHATSAPP_ENABLED'}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def idempotency_key(channel, attendance_id, parent_id):
+    return f'{channel}:{attendance_id}:{parent_id}'
+
+
+def enabled_channels(channels):
+    return [channel for channel in channels if _setting(CHANNEL_SETTINGS[channel], False)]
+
+
+def enqueue_notifications(attendance, channels=('SMS',), dispatch=True):
+    """
+    Queue the attendance notification for every parent of the student.
+
+    Call inside the transaction that creates the attendance record. Channels
+    that are disabled in settings are skipped, and nothing is queued for a
+    punch within the suppression window of a notified one (see
+    attendance.suppression). With dispatch, a dispatch task
+    is started once the transaction commits.
+
+    Returns:
+        int: Number of outbox rows written
+    """
+    from .models import NotificationOutbox
+    from .notifications import resolve_recipients
+    from .suppression import should_notify
+
+    channels = enabled_channels(channels)
+    if not channels:
+        return 0
+    # Repeated punches within the quiet window are not notified again
+    if not should_notify(attendance):
+        logger.info(
+            f"Notifications for attendance {attendance.id} suppressed: "
+            f"{attendance.attendance_type} of student {attendance.student_id} already notified"
+        )
+        return 0
+    # SMS waits out the batch window so identical texts can share one submission
+    now = timezone.now()
+    sms_due = now + timedelta(seconds=sms_batch_window())
+    # Every channel notifies the same parents
+    parents = resolve_recipients([attendance])[attendance.id]
+    rows = [
+        NotificationOutbox(
+            idempotency_key=idempotency_key(channel, attendance.id, parent.id),
+            channel=channel,
+            attendance_id=attendance.id,
+            parent=parent,
+            next_attempt_at=sms_due if channel == 'SMS' else now,
+        )
+        for channel in channels
+        for parent in parents
+    ]
+    if not rows:
+        return 0
+    NotificationOutbox.objects.bulk_create(rows, ignore_conflicts=True)
+    if dispatch:
+        transaction.on_commit(request_dispatch)
+    return len(rows)
+
+
+def sms_batch_window():
+    return _setting('SMS_BATCH_WINDOW_SECONDS', DEFAULT_SMS_BATCH_WINDOW_SECONDS)
+
+
+def request_dispatch(pending=None):
+    """
+    Start dispatch tasks once the SMS batch window has passed: one, or for a
+    known number of pending rows, one per batch up to
+    NOTIFICATION_DISPATCH_CONCURRENCY. The periodic dispatch task picks up
+    anything left if the broker is unavailable.
+    """
+    from .tasks import dispatch_notifications_task
+
+    tasks = 1
+    if pending is not None:
+        if not pending:
+            return
+        batch_size = _setting('NOTIFICATION_OUTBOX_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        concurrency = _setting('NOTIFICATION_DISPATCH_CONCURRENCY', DEFAULT_DISPATCH_CONCURRENCY)
+        tasks = max(1, min(concurrency, math.ceil(pending / batch_size)))
+    try:
+        for _ in range(tasks):
+            dispatch_notifications_task.apply_async(countdown=sms_batch_window())
+    except Exception as e:
+        logger.warning(f"Could not start notification dispatch, the periodic task will send queued notifications: {e}")
+
+
+def retry_delay(attempts):
+    """Backoff before the next attempt: doubling per attempt, capped, with jitter"""
+    base = _setting('NOTIFICATION_OUTBOX_RETRY_BASE_SECONDS', DEFAULT_RETRY_BASE_SECONDS)
+    cap = _setting('NOTIFICATION_OUTBOX_RETRY_MAX_SECONDS', DEFAULT_RETRY_MAX_SECONDS)
+    delay = min(cap, base * 2 ** max(attempts - 1, 0))
+    return timedelta(seconds=random.uniform(delay / 2, delay))
+
+
+def lease_seconds():
+    """Lease of claimed rows: the configured one, but long enough for any provider request to finish"""
+    from .provider_http import PROVIDER_DEFAULTS, max_request_seconds
+
+    longest = max(max_request_seconds(provider) for provider in PROVIDER_DEFAULTS)
+    return max(_setting('NOTIFICATION_OUTBOX_LEASE_SECONDS', DEFAULT_LEASE_SECONDS), 2 * longest)
+
+
+def lease_deadline(notifications):
+    """time.monotonic() value at which the claim on a batch runs out"""
+    expires = min(notification.next_attempt_at for notification in notifications)
+    return time.monotonic() + (expires - timezone.now()).total_seconds()
+
+
+def claim_notifications(batch_size=None, now=None):
+    """
+    Claim a batch of due notifications for this worker.
+
+    Rows locked by another worker's claim are skipped, not waited on. Claimed
+    rows are PROCESSING until their lease runs out.
+
+    Returns:
+        list: Claimed NotificationOutbox rows with attendance, student and parent loaded
+    """
+    from .models import Attendance, NotificationOutbox
+
+    batch_size = batch_size or _setting('NOTIFICATION_OUTBOX_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    now = now or timezone.now()
+    lease = timedelta(seconds=lease_seconds())
+
+    with transaction.atomic():
+        ids = list(
+            NotificationOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status__in=['PENDING', 'PROCESSING'], next_attempt_at__lte=now)
+            .order_by('next_attempt_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        NotificationOutbox.objects.filter(id__in=ids).update(
+            status='PROCESSING',
+            attempts=F('attempts') + 1,
+            next_attempt_at=now + lease,
+            updated_at=now,
+        )
+
+    notifications = list(NotificationOutbox.objects.filter(id__in=ids).select_related('parent').order_by('id'))
+    # Loaded separately: a join would drop rows whose attendance record was deleted
+    attendances = Attendance.objects.select_related('student').in_bulk(
+        {notification.attendance_id for notification in notifications}
+    )
+    for notification in notifications:
+        if notification.attendance_id in attendances:
+            notification.attendance = attendances[notification.attendance_id]
+    return notifications
+
+
+def _attendance_of(notification):
+    from .models import Attendance
+
+    try:
+        return notification.attendance
+    except Attendance.DoesNotExist:
+        return None
+
+
+def _service(services, channel):
+    from .notifications import get_channel_service
+
+    if channel not in services:
+        services[channel] = get_channel_service(channel)
+    return services[channel]
+
+
+def record_outcome(notification, result, services):
+    """
+    Store the outcome of a send attempt on a claimed notification.
+
+    Returns:
+        tuple: (new status, unsaved SMSLog or None); notifications get a log
+        entry for their final outcome only, not for every retried attempt
+    """
+    from .models import NotificationOutbox
+
+    now = timezone.now()
+    max_attempts = _setting('NOTIFICATION_OUTBOX_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+    if result.get('success'):
+        status, update = 'SENT', {'sent_at': now, 'last_error': ''}
+    elif result.get('retry_after') is not None:
+        # Held back by the rate limit or circuit breaker: the attempt does not count
+        status, update = 'PENDING', {
+            'next_attempt_at': now + timedelta(seconds=result['retry_after']),
+            'attempts': F('attempts') - 1,
+        }
+    elif result.get('retriable') and notification.attempts < max_attempts:
+        status, update = 'PENDING', {'next_attempt_at': now + retry_delay(notification.attempts)}
+    else:
+        status, update = 'DEAD', {}
+    if not result.get('success'):
+        update['last_error'] = result.get('error', 'Unknown error')
+
+    NotificationOutbox.objects.filter(id=notification.id, status='PROCESSING').update(
+        status=status, updated_at=now, **update
+    )
+    if status == 'DEAD':
+        logger.warning(
+            f"Notification {notification.id} ({notification.channel}) dead-lettered after "
+            f"{notification.attempts} attempt(s): {update['last_error']}"
+        )
+    attendance = _attendance_of(notification)
+    sms_log = None
+    if attendance is not None and status != 'PENDING':
+        sms_log = _service(services, notification.channel).build_log(attendance, notification.parent, result)
+    return status, sms_log
+
+
+def _send(notifications, services, deadline=None):
+    """Results of sending notifications of one channel (identical SMS texts share API calls)"""
+    missing = {'success': False, 'error': 'Attendance record no longer exists', 'retriable': False}
+    results = [missing] * len(notifications)
+    sendable = [index for index, notification in enumerate(notifications) if _attendance_of(notification) is not None]
+    if not sendable:
+        return results
+    channel = notifications[0].channel
+    service = _service(services, channel)
+    try:
+        sent = service.send_batch([
+            (notifications[index].attendance, notifications[index].parent) for index in sendable
+        ], deadline=deadline)
+    except Exception as e:
+        logger.error(f"Error sending {channel} notifications: {e}", exc_info=True)
+        sent = [{'success': False, 'error': str(e), 'retriable': True}] * len(sendable)
+    for index, result in zip(sendable, sent):
+        results[index] = result
+    return results
+
+
+def deliver_notifications(notifications, services=None):
+    """
+    Send claimed notifications and record the outcomes. Notifications not
+    sent before their lease runs out are released (PENDING).
+
+    Returns:
+        list: New status of each notification (SENT, PENDING for a retry, or DEAD)
+    """
+    services = services if services is not None else {}
+    deadline = lease_deadline(notifications) if notifications else None
+    by_channel = {}
+    for notification in notifications:
+        by_channel.setdefault(notification.channel, []).append(notification)
+
+    statuses = {}
+    for channel_notifications in by_channel.values():
+        results = _send(channel_notifications, services, deadline)
+        statuses.update(zip(
+            (notification.id for notification in channel_notifications),
+            store_outcomes(channel_notifications, results, services),
+        ))
+    return [statuses[notification.id] for notification in notifications]
+
+
+def store_outcomes(notifications, results, services=None):
+    """
+    Record the results of sending claimed notifications, writing their log
+    entries in one insert.
+
+    Returns:
+        list: New status of each notification
+    """
+    from .models import SMSLog
+
+    services = services if services is not None else {}
+    statuses = []
+    sms_logs = []
+    for notification, result in zip(notifications, results):
+        status, sms_log = record_outcome(notification, result, services)
+        statuses.append(status)
+        if sms_log is not None:
+            sms_logs.append(sms_log)
+    SMSLog.objects.bulk_create(sms_logs)
+    return statuses
+
+
+def deliver_notification(notification, services=None):
+    """
+    Send one claimed notification and record the outcome.
+
+    Returns:
+        str: New status (SENT, PENDING for a retry, or DEAD)
+    """
+    return deliver_notifications([notification], services)[0]
+
+
+def dispatch_notifications(batch_size=None, max_seconds=None):
+    """
+    Claim and send due notifications until the outbox is drained or the time
+    budget is spent. Safe to run in any number of workers at once.
+
+    Returns:
+        dict: Notifications per resulting status
+    """
+    max_seconds = max_seconds or _setting('NOTIFICATION_DISPATCH_SECONDS', DEFAULT_DISPATCH_SECONDS)
+    deadline = time.monotonic() + max_seconds
+    results = {'SENT': 0, 'PENDING': 0, 'DEAD': 0}
+    services = {}
+    while time.monotonic() < deadline:
+        batch = claim_notifications(batch_size)
+        if not batch:
+            break
+        for status in deliver_notifications(batch, services):
+            results[status] += 1
+    return results
+
+
+def requeue_dead_notifications(queryset=None):
+    """
+    Give dead-lettered notifications a fresh set of attempts.
+
+    Returns:
+        int: Number of notifications requeued
+    """
+    from .models import NotificationOutbox
+
+    queryset = queryset if queryset is not None else NotificationOutbox.objects.all()
+    now = timezone.now()
+    return queryset.filter(status='DEAD').update(
+        status='PENDING', attempts=0, next_attempt_at=now, updated_at=now
+    )
+
+
+def purge_notifications(retention_days=None):
+    """
+    Delete sent and dead-lettered notifications older than the retention period.
+
+    Returns:
+        int: Number of rows deleted
+    """
+    from .models import NotificationOutbox
+
+    retention_days = retention_days or _setting('NOTIFICATION_OUTBOX_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    deleted, _ = NotificationOutbox.objects.filter(status__in=['SENT', 'DEAD'], updated_at__lt=cutoff).delete()
+    return deleted
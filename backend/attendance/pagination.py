@@ -0,0 +1,172 @@
+"""
+Pagination for the large attendance and SMS log listings
+
+Page-number pagination (the default) is kept for compatibility. Requesting
+?pagination=keyset switches to keyset (seek) pagination on (<time field>, id):
+each page is fetched with a row comparison against the last row of the previous
+page, so deep pages cost the same as the first one. The total count in keyset
+mode comes from planner statistics, since an exact COUNT(*) over millions of
+rows would cost more than the page itself.
+"""
+import base64
+import json
+from collections import OrderedDict
+from datetime import datetime
+
+from django.db import connection
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+# Below this estimate an exact count is cheap enough to run
+EXACT_COUNT_THRESHOLD = 10000
+
+
+def estimate_count(queryset):
+    """
+    Estimate the number of rows a queryset returns from the planner's statistics.
+
+    Falls back to an exact count on other databases or for small results.
+
+    Returns:
+        tuple: (count, is_approximate)
+    """
+    if connection.vendor != 'postgresql':
+        return queryset.count(), False
+
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    estimate = int(plan[0]['Plan']['Plan Rows'])
+
+    if estimate < EXACT_COUNT_THRESHOLD:
+        return queryset.count(), False
+    return estimate, True
+
+
+class KeysetPagination(PageNumberPagination):
+    """
+    Page-number pagination with an opt-in keyset mode.
+
+    Keyset mode orders on (keyset_field, id), descending unless the request
+    orders on keyset_field ascending, and returns opaque next/previous cursors.
+    """
+    keyset_field = None
+    mode_query_param = 'pagination'
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset_mode = (
+            request.query_params.get(self.mode_query_param) == 'keyset'
+            or self.cursor_query_param in request.query_params
+        )
+        if not self.keyset_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.descending = request.query_params.get('ordering') != self.keyset_field
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor['reverse']
+
+        # The count is estimated over the whole filtered set, not the page
+        self.count, self.count_is_approximate = estimate_count(queryset)
+
+        # Going backwards flips the scan direction; the page is reversed afterwards
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{prefix}{self.keyset_field}', f'{prefix}id')
+        if cursor is not None:
+            queryset = queryset.filter(self.seek_condition(queryset, cursor, descending))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.page_rows = rows
+        self.has_next = bool(rows) and (has_more if not reverse else True)
+        self.has_previous = bool(rows) and (cursor is not None if not reverse else has_more)
+        return rows
+
+    def seek_condition(self, queryset, cursor, descending):
+        """Row comparison (field, id) </> (cursor value, cursor id) matching the index order"""
+        table = connection.ops.quote_name(queryset.model._meta.db_table)
+        column = connection.ops.quote_name(queryset.model._meta.get_field(self.keyset_field).column)
+        operator = '<' if descending else '>'
+        return RawSQL(
+            f'({table}.{column}, {table}."id") {operator} (%s, %s)',
+            [cursor['value'], cursor['id']],
+            output_field=BooleanField(),
+        )
+
+    def encode_cursor(self, row, reverse):
+        # Rows are model instances, or dicts for values() projections
+        if isinstance(row, dict):
+            value, row_id = row[self.keyset_field], row['id']
+        else:
+            value, row_id = getattr(row, self.keyset_field), row.id
+        payload = json.dumps({'v': value.isoformat(), 'i': row_id, 'r': reverse})
+        cursor = base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            return {
+                'value': datetime.fromisoformat(payload['v']),
+                'id': int(payload['i']),
+                'reverse': bool(payload.get('r')),
+            }
+        except (TypeError, ValueError, KeyError):
+            raise NotFound('Invalid cursor')
+
+    def get_next_link(self):
+        if not self.keyset_mode:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page_rows[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.keyset_mode:
+            return super().get_previous_link()
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(self.page_rows[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        if not self.keyset_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('count_is_approximate', self.count_is_approximate),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count_is_approximate'] = {'type': 'boolean'}
+        return response_schema
+
+
+class AttendancePagination(KeysetPagination):
+    keyset_field = 'timestamp'
+
+
+class SMSLogPagination(KeysetPagination):
+    keyset_field = 'created_at'
@@ -0,0 +1,236 @@
+"""
+Monthly range partitions for attendance records and SMS logs
+
+Both tables are partitioned by month on their timestamp (see migration 0009).
+Partitions are named <table>_pYYYY_MM; everything recorded before partitioning
+was introduced lives in the <table>_p_legacy partition.
+
+ensure_future_partitions() runs daily to keep months ahead created. Rows outside
+the created months (the task stopped running, a device clock far in the future)
+land in the <table>_p_default partition (migration 0018) instead of failing the
+ingest; creating their month's partition later moves them out of it. With a
+default partition PostgreSQL cannot detach CONCURRENTLY, so old partitions are
+detached with a plain DETACH under a short lock_timeout, retried on timeouts.
+"""
+import logging
+import re
+import time
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.db import OperationalError, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = {
+    'attendance_attendance': 'timestamp',
+    'attendance_smslog': 'created_at',
+}
+DEFAULT_MONTHS_AHEAD = 3
+
+# Plain DETACH (with a default partition) gives up on the parent's lock after
+# DETACH_LOCK_TIMEOUT_MS and is retried up to DETACH_ATTEMPTS times
+DETACH_LOCK_TIMEOUT_MS = 2000
+DETACH_ATTEMPTS = 5
+DETACH_RETRY_DELAY = 5
+LOCK_NOT_AVAILABLE = '55P03'
+
+PARTITION_NAME_RE = re.compile(r'_p(\d{4})_(\d{2})$')
+
+
+def add_months(year, month, count):
+    month_index = year * 12 + (month - 1) + count
+    return month_index // 12, month_index % 12 + 1
+
+
+def month_start(year, month):
+    """First instant of a month in UTC (partition bounds are UTC month boundaries)"""
+    return datetime(year, month, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(table, year, month):
+    return f'{table}_p{year:04d}_{month:02d}'
+
+
+def is_partitioned(table):
+    """Whether the table exists as a partitioned table"""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s", [table])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def default_partition_name(table):
+    return f'{table}_p_default'
+
+
+def create_month_partition(table, year, month):
+    """
+    Create the partition for one month if it does not exist yet.
+
+    PostgreSQL refuses to add a partition while the default partition holds
+    rows in its range, so those rows are moved into the new table before it is
+    attached, in one transaction.
+    """
+    next_year, next_month = add_months(year, month, 1)
+    name = partition_name(table, year, month)
+    bounds = [month_start(year, month), month_start(next_year, next_month)]
+    key = PARTITIONED_TABLES[table]
+    default = default_partition_name(table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s), to_regclass(%s)", [f'"{name}"', f'"{default}"'])
+        existing, has_default = cursor.fetchone()
+        if existing:
+            return name
+        stray_rows = 0
+        if has_default:
+            cursor.execute(f'LOCK TABLE "{default}" IN SHARE ROW EXCLUSIVE MODE')
+            cursor.execute(f'SELECT COUNT(*) FROM "{default}" WHERE "{key}" >= %s AND "{key}" < %s', bounds)
+            stray_rows = cursor.fetchone()[0]
+        if not stray_rows:
+            cursor.execute(
+                f'CREATE TABLE "{name}" PARTITION OF "{table}" FOR VALUES FROM (%s) TO (%s)', bounds
+            )
+            return name
+
+        cursor.execute(f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM "{default}" WHERE "{key}" >= %s AND "{key}" < %s RETURNING *) '
+            f'INSERT INTO "{name}" SELECT * FROM moved',
+            bounds,
+        )
+        cursor.execute(f'ALTER TABLE "{table}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)', bounds)
+    logger.info(f"Moved {stray_rows} row(s) from {default} into {name}")
+    return name
+
+
+def list_partitions(table):
+    """
+    List a partitioned table's partitions.
+
+    Returns:
+        list: dicts with name, month (first day, or None for the legacy
+              partition) and bound (partition bound expression), oldest first
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+            ORDER BY c.relname
+            """,
+            [table],
+        )
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, bound in rows:
+        match = PARTITION_NAME_RE.search(name)
+        month = date(int(match.group(1)), int(match.group(2)), 1) if match else None
+        partitions.append({'name': name, 'month': month, 'bound': bound})
+    partitions.sort(key=lambda partition: partition['month'] or date.min)
+    return partitions
+
+
+def ensure_future_partitions(months_ahead=DEFAULT_MONTHS_AHEAD, today=None):
+    """
+    Make sure the current month and the next months_ahead months have partitions.
+
+    Returns:
+        list: names of the partitions that were created
+    """
+    today = today or datetime.now(dt_timezone.utc).date()
+    created = []
+    for table in PARTITIONED_TABLES:
+        if not is_partitioned(table):
+            continue
+        existing = {partition['name'] for partition in list_partitions(table)}
+        legacy_end = _legacy_partition_end(table)
+        for offset in range(months_ahead + 1):
+            year, month = add_months(today.year, today.month, offset)
+            if legacy_end and month_start(year, month) < legacy_end:
+                # Still covered by the legacy partition
+                continue
+            name = partition_name(table, year, month)
+            if name not in existing:
+                create_month_partition(table, year, month)
+                created.append(name)
+                logger.info(f"Created partition {name}")
+        _warn_about_default_rows(table)
+    return created
+
+
+def detach_partition(table, name, drop=False):
+    """
+    Detach a partition from its parent.
+
+    Without a default partition this uses DETACH ... CONCURRENTLY, which does not
+    block reads and writes but cannot run inside a transaction block, so this
+    must be called in autocommit mode. With one, PostgreSQL only allows a plain
+    DETACH, which needs an ACCESS EXCLUSIVE lock on the parent: it is taken with
+    a short lock_timeout so it never waits behind a long query (with every
+    check-in queued behind it), and retried a few times. The detached table is
+    kept (e.g. for dumping to cold storage) unless drop is True.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [f'"{default_partition_name(table)}"'])
+        has_default = cursor.fetchone()[0] is not None
+    if has_default:
+        _detach_with_lock_timeout(table, name)
+    else:
+        with connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{name}" CONCURRENTLY')
+    if drop:
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE "{name}"')
+    logger.info(f"Detached partition {name} from {table}{' and dropped it' if drop else ''}")
+
+
+def _detach_with_lock_timeout(table, name):
+    for attempt in range(1, DETACH_ATTEMPTS + 1):
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT_MS}ms'")
+                cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"')
+            return
+        except OperationalError as e:
+            if getattr(e.__cause__, 'pgcode', None) != LOCK_NOT_AVAILABLE or attempt == DETACH_ATTEMPTS:
+                raise
+            logger.warning(f"Detaching {name} timed out waiting for the lock on {table} (attempt {attempt})")
+            time.sleep(DETACH_RETRY_DELAY * attempt)
+
+
+def _warn_about_default_rows(table):
+    """Log rows left in the default partition (months beyond the created ones)"""
+    default = default_partition_name(table)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [f'"{default}"'])
+        if cursor.fetchone()[0] is None:
+            return
+        cursor.execute(f'SELECT EXISTS (SELECT 1 FROM "{default}")')
+        if cursor.fetchone()[0]:
+            logger.warning(f"{default} holds rows outside the monthly partitions")
+
+
+def _legacy_partition_end(table):
+    """Upper bound of the legacy partition, or None if it was detached"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass AND c.relname = %s
+            """,
+            [table, f'{table}_p_legacy'],
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    match = re.search(r"TO \('([^']+)'\)", row[0])
+    if not match:
+        return None
+    return datetime.fromisoformat(match.group(1).replace('+00', '+00:00'))
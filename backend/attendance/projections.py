@@ -0,0 +1,124 @@
+"""
+Compact list projections for the attendance and SMS log viewsets
+
+The default serializers nest the full student (with every parent and their
+students), device and branch on each row. With ?view=compact, or a sparse
+?fields=a,b,c selection of the compact fields, list endpoints instead read flat
+IDs and display names straight from values(), in one query without
+select_related or prefetch chains.
+"""
+from datetime import datetime
+
+from django.db.models import CharField, F, Value
+from django.db.models.functions import Concat
+from rest_framework import serializers
+from rest_framework.response import Response
+
+
+def full_name(prefix):
+    return Concat(F(f'{prefix}__first_name'), Value(' '), F(f'{prefix}__last_name'), output_field=CharField())
+
+
+# Output name -> ORM expression (None = model field of the same name)
+ATTENDANCE_COMPACT_FIELDS = {
+    'id': None,
+    'student_id': None,
+    'student_name': full_name('student'),
+    'student_number': F('student__student_id'),
+    'grade': None,
+    'level': None,
+    'class_name': None,
+    'branch_id': None,
+    'branch_name': F('branch__name'),
+    'device_id': None,
+    'device_name': F('device__name'),
+    'attendance_type': None,
+    'timestamp': None,
+    'status': None,
+    'is_synced': None,
+}
+
+SMS_LOG_COMPACT_FIELDS = {
+    'id': None,
+    'student_id': None,
+    'student_name': full_name('student'),
+    'student_number': F('student__student_id'),
+    'parent_id': None,
+    'parent_name': full_name('parent'),
+    'attendance_id': None,
+    'channel': None,
+    'phone_number': None,
+    'status': None,
+    'message': None,
+    'error_message': None,
+    'message_id': None,
+    'sent_at': None,
+    'delivered_at': None,
+    'created_at': None,
+}
+
+
+class CompactProjectionMixin:
+    """
+    Adds ?view=compact and ?fields= to a viewset's list action.
+
+    Subclasses set compact_fields. Datetimes listed in local_datetime_fields are
+    rendered in the device timezone, like the full serializers do.
+    """
+    compact_fields = {}
+    local_datetime_fields = ()
+    view_query_param = 'view'
+    fields_query_param = 'fields'
+
+    def get_compact_field_names(self):
+        """Requested compact field names, or None for the full serializer"""
+        requested = self.request.query_params.get(self.fields_query_param)
+        if requested:
+            names = [name.strip() for name in requested.split(',') if name.strip()]
+            unknown = [name for name in names if name not in self.compact_fields]
+            if unknown:
+                raise ValueError(
+                    f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(self.compact_fields)}"
+                )
+            return names
+        if self.request.query_params.get(self.view_query_param) == 'compact':
+            return list(self.compact_fields)
+        return None
+
+    def get_compact_queryset(self, queryset, names):
+        """Project the filtered queryset onto the compact fields with values()"""
+        # Keep the pagination keys available even if not requested
+        selected = list(dict.fromkeys(['id', *names, *self.get_keyset_fields()]))
+        plain = [name for name in selected if self.compact_fields.get(name) is None]
+        expressions = {
+            name: self.compact_fields[name] for name in selected if self.compact_fields.get(name) is not None
+        }
+        return queryset.select_related(None).prefetch_related(None).values(*plain, **expressions)
+
+    def get_keyset_fields(self):
+        keyset_field = getattr(self.pagination_class, 'keyset_field', None)
+        return [keyset_field] if keyset_field else []
+
+    def format_compact_value(self, name, value):
+        if isinstance(value, datetime):
+            if name in self.local_datetime_fields:
+                from .utils import get_device_timezone
+                return value.astimezone(get_device_timezone()).isoformat()
+            return serializers.DateTimeField().to_representation(value)
+        return value
+
+    def list(self, request, *args, **kwargs):
+        try:
+            names = self.get_compact_field_names()
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        if names is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.get_compact_queryset(self.filter_queryset(self.get_queryset()), names)
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else queryset
+        data = [{name: self.format_compact_value(name, row[name]) for name in names} for row in rows]
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
@@ -0,0 +1,179 @@
+"""
+Pooled HTTP sessions for the SMS and WhatsApp providers
+
+Every provider gets one requests.Session per worker process, with a
+keep-alive connection pool, so consecutive messages reuse an open TLS
+connection instead of paying a new TCP and TLS handshake each. Requests
+always carry connect and read timeouts, and urllib3 retries what is safe to
+retry for a message send:
+
+- connection failures (the request never reached the provider);
+- 429 and 503 responses (the provider did not accept the message), after the
+  Retry-After delay when given.
+
+Read timeouts and other errors are not retried here, since the message may
+have been sent; the notification outbox decides whether to try again later.
+
+Requests are refused while the provider's circuit breaker is open (see
+attendance.circuit_breaker), then take a token from the provider's shared
+rate limit (see attendance.rate_limit), waiting for one if needed.
+
+Per-process counters (requests, errors, status classes, retries, latency)
+are kept per provider; see provider_metrics().
+"""
+import logging
+import os
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import circuit_breaker, rate_limit
+
+logger = logging.getLogger(__name__)
+
+# Provider -> defaults, overridable with <PROVIDER>_HTTP_CONNECT_TIMEOUT,
+# <PROVIDER>_HTTP_READ_TIMEOUT and <PROVIDER>_HTTP_RETRIES settings
+PROVIDER_DEFAULTS = {
+    'SMS': {'connect_timeout': 5, 'read_timeout': 30, 'retries': 2},
+    'WHATSAPP': {'connect_timeout': 5, 'read_timeout': 20, 'retries': 2},
+    # The local stub providers (see attendance.channel_backends.StubServerMixin)
+    'SMS_STUB': {'connect_timeout': 5, 'read_timeout': 30, 'retries': 2},
+    'WHATSAPP_STUB': {'connect_timeout': 5, 'read_timeout': 20, 'retries': 2},
+}
+DEFAULT_POOL_SIZE = 10
+RETRY_STATUSES = (429, 503)
+
+_lock = threading.Lock()
+_sessions = {}
+_metrics = {}
+
+
+def provider_setting(provider, name):
+    return getattr(settings, f'{provider}_HTTP_{name.upper()}', PROVIDER_DEFAULTS[provider][name])
+
+
+def get_timeout(provider):
+    """(connect, read) timeout of the provider's requests"""
+    return provider_setting(provider, 'connect_timeout'), provider_setting(provider, 'read_timeout')
+
+
+def max_request_seconds(provider):
+    """Longest a post() can take: every attempt timing out after the longest wait for a rate-limit token"""
+    connect_timeout, read_timeout = get_timeout(provider)
+    attempts = provider_setting(provider, 'retries') + 1
+    max_wait = getattr(settings, 'RATE_LIMIT_MAX_WAIT_SECONDS', rate_limit.DEFAULT_MAX_WAIT_SECONDS)
+    return max_wait + attempts * (connect_timeout + read_timeout)
+
+
+def build_session(provider):
+    retries = provider_setting(provider, 'retries')
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,
+        other=0,
+        status=retries,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({'GET', 'POST'}),
+        backoff_factor=0.5,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    pool_size = getattr(settings, 'PROVIDER_HTTP_POOL_SIZE', DEFAULT_POOL_SIZE)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(provider):
+    """The provider's pooled session in this process (created after a fork, never shared across one)"""
+    key = (provider, os.getpid())
+    session = _sessions.get(key)
+    if session is None:
+        with _lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _sessions[key] = build_session(provider)
+    return session
+
+
+def close_sessions():
+    """Close every pooled session (their connections are reopened on next use)"""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def record_request(provider, status_code, elapsed, retries=0):
+    """Count a request in the provider's metrics (status_code None: no response)"""
+    with _lock:
+        metrics = _metrics.setdefault(provider, {
+            'requests': 0, 'errors': 0, 'retries': 0, 'statuses': {}, 'total_seconds': 0.0, 'max_seconds': 0.0,
+        })
+        metrics['requests'] += 1
+        metrics['retries'] += retries
+        metrics['total_seconds'] += elapsed
+        metrics['max_seconds'] = max(metrics['max_seconds'], elapsed)
+        if status_code is None:
+            metrics['errors'] += 1
+        else:
+            status_class = f'{status_code // 100}xx'
+            metrics['statuses'][status_class] = metrics['statuses'].get(status_class, 0) + 1
+
+
+def provider_metrics(reset=False):
+    """
+    Request counters of this process per provider.
+
+    Returns:
+        dict: provider -> requests, errors (no response), retries, responses
+        per status class, average and maximum latency in milliseconds
+    """
+    with _lock:
+        snapshot = {
+            provider: {
+                'requests': metrics['requests'],
+                'errors': metrics['errors'],
+                'retries': metrics['retries'],
+                'statuses': dict(metrics['statuses']),
+                'avg_ms': round(metrics['total_seconds'] / metrics['requests'] * 1000, 1) if metrics['requests'] else 0,
+                'max_ms': round(metrics['max_seconds'] * 1000, 1),
+            }
+            for provider, metrics in _metrics.items()
+        }
+        if reset:
+            _metrics.clear()
+    return snapshot
+
+
+def post(provider, url, **kwargs):
+    """
+    POST through the provider's pooled session, with its timeouts unless given.
+
+    Raises:
+        circuit_breaker.CircuitOpen: while the provider's circuit breaker is open
+        rate_limit.RateLimited: when the provider's rate limit has no capacity soon enough
+    """
+    kwargs.setdefault('timeout', get_timeout(provider))
+    circuit_breaker.before_request(provider)
+    rate_limit.acquire(provider)
+    started = time.monotonic()
+    try:
+        response = get_session(provider).post(url, **kwargs)
+    except requests.exceptions.RequestException:
+        record_request(provider, None, time.monotonic() - started)
+        circuit_breaker.record_request(provider, None, time.monotonic() - started)
+        raise
+    elapsed = time.monotonic() - started
+    retry_state = getattr(response.raw, 'retries', None)
+    retries = len(retry_state.history) if retry_state is not None else 0
+    record_request(provider, response.status_code, elapsed, retries)
+    circuit_breaker.record_request(provider, response.status_code, elapsed)
+    return response
@@ -0,0 +1,165 @@
+"""
+Token-bucket rate limits for the notification providers, shared by all workers
+
+Each provider has one bucket in Redis (<KEY_PREFIX>:<provider>) holding up to
+<PROVIDER>_RATE_LIMIT_BURST tokens, refilled at <PROVIDER>_RATE_LIMIT_PER_SECOND.
+Every provider API request takes a token. Refill and take happen in one Lua
+script on the Redis clock, so every worker on every host draws from the same
+bucket.
+
+When the bucket is empty the sender sleeps until a token is due, for at most
+RATE_LIMIT_MAX_WAIT_SECONDS. If the wait would be longer, RateLimited is
+raised with the delay, and the notification outbox reschedules the message
+for then without counting it as a failed attempt.
+
+If Redis is unreachable, each process falls back to a local bucket with the
+same limit, which keeps a single worker within the provider's ceiling.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from .utils import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'ratelimit:provider'
+
+# Provider -> (requests per second, burst); 0 requests per second disables the limit
+DEFAULT_LIMITS = {
+    'SMS': (5, 10),
+    'WHATSAPP': (50, 80),
+    # The local stub providers, limited like the real ones in buckets of their own
+    'SMS_STUB': (5, 10),
+    'WHATSAPP_STUB': (50, 80),
+}
+DEFAULT_MAX_WAIT_SECONDS = 10
+
+# KEYS: bucket
+# ARGV: rate per second, burst, tokens requested
+# Returns the milliseconds until the tokens are available (0: taken)
+TAKE_SCRIPT = """
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait = math.ceil((requested - tokens) * 1000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+return wait
+"""
+
+
+class RateLimited(Exception):
+    """The provider's bucket has no token within the allowed wait"""
+
+    def __init__(self, provider, retry_after):
+        self.provider = provider
+        self.retry_after = retry_after
+        super().__init__(f'{provider} rate limit reached, retry in {retry_after:.1f}s')
+
+
+def get_limit(provider):
+    """(requests per second, burst) of a provider"""
+    rate, burst = DEFAULT_LIMITS.get(provider, (0, 0))
+    rate = getattr(settings, f'{provider}_RATE_LIMIT_PER_SECOND', rate)
+    burst = getattr(settings, f'{provider}_RATE_LIMIT_BURST', burst)
+    return rate, max(burst, 1)
+
+
+class LocalTokenBucket:
+    """In-process bucket used while Redis is unavailable"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tokens = None
+        self.updated = None
+
+    def take(self, rate, burst, requested=1):
+        with self.lock:
+            now = time.monotonic()
+            if self.tokens is None:
+                self.tokens, self.updated = burst, now
+            self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+            self.updated = now
+            if self.tokens >= requested:
+                self.tokens -= requested
+                return 0.0
+            return (requested - self.tokens) / rate
+
+
+_local_buckets = {}
+_local_lock = threading.Lock()
+
+
+def _local_bucket(provider):
+    with _local_lock:
+        return _local_buckets.setdefault(provider, LocalTokenBucket())
+
+
+def try_take(provider, tokens=1):
+    """
+    Take tokens from the provider's bucket if available.
+
+    Returns:
+        float: 0 when taken, otherwise seconds until they will be available
+    """
+    rate, burst = get_limit(provider)
+    if not rate:
+        return 0.0
+    try:
+        wait_ms = get_redis_client().eval(TAKE_SCRIPT, 1, f'{KEY_PREFIX}:{provider}', rate, burst, tokens)
+        return int(wait_ms) / 1000
+    except Exception as e:
+        logger.warning(f"Rate limiter unavailable, limiting {provider} in this process only: {e}")
+        return _local_bucket(provider).take(rate, burst, tokens)
+
+
+def acquire(provider, tokens=1, max_wait=None):
+    """
+    Block until tokens are taken from the provider's bucket.
+
+    Raises:
+        RateLimited: when that would take longer than max_wait seconds
+        (default RATE_LIMIT_MAX_WAIT_SECONDS)
+    """
+    if max_wait is None:
+        max_wait = getattr(settings, 'RATE_LIMIT_MAX_WAIT_SECONDS', DEFAULT_MAX_WAIT_SECONDS)
+    deadline = time.monotonic() + max_wait
+    while True:
+        wait = try_take(provider, tokens)
+        if not wait:
+            return
+        if time.monotonic() + wait > deadline:
+            raise RateLimited(provider, wait)
+        time.sleep(wait)
+
+
+async def acquire_async(provider, tokens=1, max_wait=None):
+    """acquire() for coroutines: the Redis call runs in a thread and waiting does not block the event loop"""
+    if max_wait is None:
+        max_wait = getattr(settings, 'RATE_LIMIT_MAX_WAIT_SECONDS', DEFAULT_MAX_WAIT_SECONDS)
+    deadline = time.monotonic() + max_wait
+    while True:
+        wait = await asyncio.to_thread(try_take, provider, tokens)
+        if not wait:
+            return
+        if time.monotonic() + wait > deadline:
+            raise RateLimited(provider, wait)
+        await asyncio.sleep(wait)
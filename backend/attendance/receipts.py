@@ -0,0 +1,234 @@
+"""
+Delivery receipts for SMS and WhatsApp notifications
+
+The provider webhooks (Mora delivery reports, WhatsApp status callbacks)
+only normalize the payload and push the receipts onto a Redis list
+(<QUEUE_KEY>), then acknowledge. The attendance.apply_delivery_receipts task
+drains the list in batches and applies each batch with one
+UPDATE ... FROM (VALUES ...) statement matched on the provider message ID
+(partial index on SMSLog.message_id), so a burst of receipts costs one write
+per batch instead of one per receipt.
+
+Receipts:
+- delivered (WhatsApp 'delivered' and 'read'): DELIVERED with delivered_at;
+- failed: FAILED with the provider's reason;
+- anything else (accepted, sent): ignored, the log already says SENT.
+
+A DELIVERED log is never downgraded by a late or repeated receipt. Mora
+multi-number submissions share one message ID, so SMS receipts that name
+the number only update that recipient's log. Only logs created within
+DELIVERY_RECEIPT_LOOKBACK_DAYS are matched, which keeps the update on recent
+SMS log partitions.
+
+If Redis is unreachable, the webhook applies its receipts directly.
+Receipts drained from the list by a worker that dies before applying them
+are lost; the log then keeps its SENT status.
+"""
+import json
+import logging
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .utils import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = 'receipts:queue'
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_LOOKBACK_DAYS = 7
+DEFAULT_APPLY_SECONDS = 50
+
+SMS_DELIVERED = {'delivered', 'delivrd', 'success', 'succeeded'}
+SMS_FAILED = {'failed', 'undelivered', 'undeliv', 'rejected', 'rejectd', 'expired', 'error'}
+WHATSAPP_DELIVERED = {'delivered', 'read'}
+WHATSAPP_FAILED = {'failed'}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _parse_time(value):
+    """Receipt time from an ISO string or a Unix timestamp (None when missing or unreadable)"""
+    if value in (None, ''):
+        return None
+    try:
+        return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+    except (TypeError, ValueError):
+        pass
+    parsed = parse_datetime(str(value).replace(' ', 'T', 1))
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def _receipt(channel, message_id, status, phone='', at=None, error=''):
+    return {
+        'channel': channel,
+        'message_id': str(message_id),
+        'phone': ''.join(filter(str.isdigit, str(phone or ''))),
+        'status': status,
+        # UTC ISO strings, so receipts of any source compare in time order
+        'at': (at or timezone.now()).astimezone(dt_timezone.utc).isoformat(),
+        'error': str(error or '')[:500],
+    }
+
+
+def parse_sms_receipts(payload):
+    """
+    Receipts from a Mora delivery report: one report or a list of them, with
+    the submission ref_id, the number and its delivery status.
+    """
+    if isinstance(payload, dict):
+        payload = payload.get('data', payload)
+    reports = payload if isinstance(payload, list) else [payload]
+    receipts = []
+    for report in reports:
+        if not isinstance(report, dict):
+            continue
+        message_id = report.get('ref_id') or report.get('message_id') or report.get('id')
+        state = str(report.get('status') or report.get('dlr_status') or '').strip().lower()
+        if not message_id or state not in SMS_DELIVERED | SMS_FAILED:
+            continue
+        receipts.append(_receipt(
+            'SMS',
+            message_id,
+            'DELIVERED' if state in SMS_DELIVERED else 'FAILED',
+            phone=report.get('number') or report.get('mobile') or report.get('to'),
+            at=_parse_time(report.get('delivered_at') or report.get('timestamp') or report.get('date')),
+            error=report.get('error') or report.get('message') or state,
+        ))
+    return receipts
+
+
+def parse_whatsapp_receipts(payload):
+    """Receipts from a WhatsApp Cloud API webhook (entry -> changes -> value -> statuses)"""
+    receipts = []
+    for entry in payload.get('entry', []) if isinstance(payload, dict) else []:
+        for change in entry.get('changes', []):
+            for update in change.get('value', {}).get('statuses', []):
+                state = update.get('status')
+                if not update.get('id') or state not in WHATSAPP_DELIVERED | WHATSAPP_FAILED:
+                    continue
+                errors = update.get('errors') or [{}]
+                receipts.append(_receipt(
+                    'WHATSAPP',
+                    update['id'],
+                    'DELIVERED' if state in WHATSAPP_DELIVERED else 'FAILED',
+                    at=_parse_time(update.get('timestamp')),
+                    error=errors[0].get('title') or errors[0].get('message') or state,
+                ))
+    return receipts
+
+
+def queue_receipts(receipts):
+    """
+    Queue receipts for the batch applier, or apply them now if Redis is unavailable.
+
+    Returns:
+        int: Number of receipts queued or applied
+    """
+    if not receipts:
+        return 0
+    try:
+        get_redis_client().rpush(QUEUE_KEY, *(json.dumps(receipt) for receipt in receipts))
+    except Exception as e:
+        logger.warning(f"Receipt queue unavailable, applying {len(receipts)} receipt(s) directly: {e}")
+        apply_receipts(receipts)
+    return len(receipts)
+
+
+def drain_receipts(batch_size=None):
+    """Take up to batch_size receipts off the queue"""
+    batch_size = batch_size or _setting('DELIVERY_RECEIPT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    pipe = get_redis_client().pipeline(transaction=True)
+    pipe.lrange(QUEUE_KEY, 0, batch_size - 1)
+    pipe.ltrim(QUEUE_KEY, batch_size, -1)
+    items, _ = pipe.execute()
+    return [json.loads(item) for item in items]
+
+
+def _merge(receipts):
+    """One receipt per log (message ID and number): delivered wins, otherwise the latest"""
+    merged = {}
+    for receipt in receipts:
+        key = (receipt['channel'], receipt['message_id'], receipt.get('phone', ''))
+        current = merged.get(key)
+        if current is None or _preferred(receipt, current):
+            merged[key] = receipt
+    return list(merged.values())
+
+
+def _preferred(receipt, current):
+    if receipt['status'] != current['status']:
+        return receipt['status'] == 'DELIVERED'
+    # The first delivery, or the latest failure
+    if receipt['status'] == 'DELIVERED':
+        return receipt['at'] < current['at']
+    return receipt['at'] > current['at']
+
+
+def apply_receipts(receipts):
+    """
+    Apply receipts to the logs with one UPDATE ... FROM (VALUES ...).
+
+    Returns:
+        int: Number of log rows updated
+    """
+    from .models import SMSLog
+
+    receipts = _merge(receipts)
+    if not receipts:
+        return 0
+    table = connection.ops.quote_name(SMSLog._meta.db_table)
+    values = ', '.join(['(%s, %s, %s, %s, %s::timestamptz, %s)'] * len(receipts))
+    params = []
+    for receipt in receipts:
+        params.extend([
+            receipt['channel'], receipt['message_id'], receipt.get('phone', ''),
+            receipt['status'], receipt['at'], receipt.get('error', ''),
+        ])
+    lookback = timezone.now() - timedelta(days=_setting('DELIVERY_RECEIPT_LOOKBACK_DAYS', DEFAULT_LOOKBACK_DAYS))
+    params.append(lookback)
+    sql = f"""
+        UPDATE {table} AS s
+        SET status = v.status,
+            delivered_at = CASE WHEN v.status = 'DELIVERED' THEN v.received_at ELSE s.delivered_at END,
+            error_message = CASE WHEN v.status = 'FAILED' THEN v.error ELSE s.error_message END,
+            updated_at = now()
+        FROM (VALUES {values}) AS v(channel, message_id, phone, status, received_at, error)
+        WHERE s.message_id = v.message_id
+          AND s.message_id <> ''
+          AND s.channel = v.channel
+          AND (v.phone = '' OR regexp_replace(s.phone_number, '[^0-9]', '', 'g') = v.phone)
+          AND s.status <> 'DELIVERED'
+          AND s.created_at >= %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def process_receipt_queue(batch_size=None, max_seconds=None):
+    """
+    Apply queued receipts batch by batch until the queue is empty or the
+    time budget is spent.
+
+    Returns:
+        dict: Receipts drained and log rows updated
+    """
+    max_seconds = max_seconds or _setting('DELIVERY_RECEIPT_APPLY_SECONDS', DEFAULT_APPLY_SECONDS)
+    deadline = time.monotonic() + max_seconds
+    results = {'receipts': 0, 'updated': 0}
+    while time.monotonic() < deadline:
+        receipts = drain_receipts(batch_size)
+        if not receipts:
+            break
+        results['receipts'] += len(receipts)
+        results['updated'] += apply_receipts(receipts)
+    return results
@@ -0,0 +1,418 @@
+"""
+Attendance report building shared by the JSON report endpoint and file exports
+
+Rows are produced as a generator: students are read with a server-side cursor and
+their attendance is aggregated one chunk of students at a time, so memory stays
+flat regardless of the report size.
+
+Ranges starting before the archive cutoff also read the archive tables: each
+source is aggregated separately and the per-student results are merged.
+"""
+from django.db.models import Count, Max, Min, Q
+from django.utils import timezone
+
+from core.models import Student
+from .models import Attendance
+from .utils import status_priority_expression
+
+REPORT_CHUNK_SIZE = 500
+
+STATUS_BY_PRIORITY = {3: 'ATTENDED', 2: 'LATE'}
+STATUS_DISPLAY = {'ATTENDED': 'Present', 'LATE': 'Late', 'ABSENT': 'Absent'}
+
+
+def parse_report_filters(query_params):
+    """Extract report filters from request query parameters (dates default to today)"""
+    today = timezone.now().date().isoformat()
+    branch_id = query_params.get('branch_id')
+    return {
+        'branch_id': branch_id if branch_id and str(branch_id).isdigit() else None,
+        'grade': query_params.get('grade') or None,
+        'level': query_params.get('level') or None,
+        'class_name': query_params.get('class') or None,
+        'date_from': query_params.get('date_from') or today,
+        'date_to': query_params.get('date_to') or today,
+    }
+
+
+def get_report_students(filters):
+    """Active students matching the report filters, in report order"""
+    students = Student.objects.filter(is_active=True)
+    if filters['branch_id']:
+        students = students.filter(branch_id=filters['branch_id'])
+    if filters['grade']:
+        students = students.filter(grade=filters['grade'])
+    if filters['level']:
+        students = students.filter(level=filters['level'])
+    if filters['class_name']:
+        students = students.filter(class_name=filters['class_name'])
+    return students.select_related('branch').order_by('first_name', 'last_name', 'id')
+
+
+def get_report_attendance(filters):
+    """Attendance records inside the report date range"""
+    return Attendance.objects.filter(
+        local_date__gte=filters['date_from'],
+        local_date__lte=filters['date_to'],
+    )
+
+
+def get_report_attendance_sources(filters):
+    """
+    Attendance querysets to aggregate for the report date range.
+
+    The archive table is only included when the range starts before the
+    archive cutoff, so recent reports never touch it.
+    """
+    from .archive import range_needs_archive
+    from .models import AttendanceArchive
+
+    sources = [get_report_attendance(filters)]
+    if range_needs_archive(filters['date_from']):
+        sources.append(
+            AttendanceArchive.objects.filter(
+                local_date__gte=filters['date_from'],
+                local_date__lte=filters['date_to'],
+            )
+        )
+    return sources
+
+
+def aggregate_student_attendance(attendance_query, student_ids):
+    """Aggregate attendance per student for a chunk of students in one grouped query"""
+    check_in = Q(attendance_type='CHECK_IN')
+    check_out = Q(attendance_type='CHECK_OUT')
+    rows = (
+        attendance_query.filter(student_id__in=student_ids)
+        .values('student_id')
+        .annotate(
+            check_in_count=Count('id', filter=check_in),
+            check_out_count=Count('id', filter=check_out),
+            best_priority=Max(status_priority_expression(), filter=check_in),
+            first_check_in=Min('timestamp', filter=check_in),
+            last_check_out=Max('timestamp', filter=check_out),
+        )
+        .order_by()
+    )
+    return {row['student_id']: row for row in rows}
+
+
+def merge_student_attendance(stats, other):
+    """Merge per-student aggregates from two attendance sources into stats"""
+    for student_id, row in other.items():
+        current = stats.get(student_id)
+        if current is None:
+            stats[student_id] = row
+            continue
+        current['check_in_count'] += row['check_in_count']
+        current['check_out_count'] += row['check_out_count']
+        for key, pick in (('best_priority', max), ('first_check_in', min), ('last_check_out', max)):
+            values = [value for value in (current[key], row[key]) if value is not None]
+            current[key] = pick(values) if values else None
+    return stats
+
+
+def build_report_row(student, stats):
+    """Build one student's report row from their aggregated attendance"""
+    stats = stats or {}
+    check_in_count = stats.get('check_in_count', 0)
+    check_out_count = stats.get('check_out_count', 0)
+    best_status = STATUS_BY_PRIORITY.get(stats.get('best_priority'), 'ABSENT')
+    first_check_in = stats.get('first_check_in')
+    last_check_out = stats.get('last_check_out')
+
+    return {
+        'student_id': student.id,
+        'student_name': student.full_name,
+        'student_id_number': student.student_id,
+        'grade': student.grade,
+        'level': student.level,
+        'class_name': student.class_name or '',
+        'branch': {'id': student.branch.id, 'name': student.branch.name},
+        'has_attended': check_in_count > 0,
+        'attendance_status': STATUS_DISPLAY[best_status],
+        'attendance_status_code': best_status,
+        'first_check_in': first_check_in.isoformat() if first_check_in else None,
+        'last_check_out': last_check_out.isoformat() if last_check_out else None,
+        'check_in_count': check_in_count,
+        'check_out_count': check_out_count,
+        'total_attendance_days': check_in_count,
+    }
+
+
+def iter_report_rows(filters, chunk_size=REPORT_CHUNK_SIZE):
+    """Yield report rows, aggregating attendance one chunk of students at a time"""
+    sources = get_report_attendance_sources(filters)
+    chunk = []
+    for student in get_report_students(filters).iterator(chunk_size=chunk_size):
+        chunk.append(student)
+        if len(chunk) >= chunk_size:
+            yield from _build_chunk(sources, chunk)
+            chunk = []
+    if chunk:
+        yield from _build_chunk(sources, chunk)
+
+
+def _build_chunk(sources, students):
+    student_ids = [student.id for student in students]
+    stats = {}
+    for attendance_query in sources:
+        merge_student_attendance(stats, aggregate_student_attendance(attendance_query, student_ids))
+    for student in students:
+        yield build_report_row(student, stats.get(student.id))
+
+
+def summarize_report_rows(rows):
+    """Summary statistics for a list of report rows"""
+    total_students = len(rows)
+    present_count = sum(1 for item in rows if item['attendance_status_code'] == 'ATTENDED')
+    late_count = sum(1 for item in rows if item['attendance_status_code'] == 'LATE')
+    absent_count = sum(1 for item in rows if item['attendance_status_code'] == 'ABSENT')
+    return {
+        'total_students': total_students,
+        'present': present_count,
+        'late': late_count,
+        'absent': absent_count,
+        'attendance_rate': round((present_count / total_students * 100), 2)
+        if total_students > 0
+        else 0,
+    }
+
+
+def build_report(filters):
+    """Build the full JSON attendance report for the given filters"""
+    rows = list(iter_report_rows(filters))
+    return {
+        'date_from': filters['date_from'],
+        'date_to': filters['date_to'],
+        'filters': {
+            'branch_id': filters['branch_id'],
+            'grade': filters['grade'],
+            'level': filters['level'],
+            'class': filters['class_name'],
+        },
+        'summary': summarize_report_rows(rows),
+        'students': rows,
+    }
+
+
+def normalize_report_filters(filters):
+    """Normalize report filters so equivalent requests produce the same job hash"""
+    from datetime import date
+
+    normalized = {}
+    for key in ('branch_id', 'grade', 'level', 'class_name'):
+        value = filters.get(key)
+        normalized[key] = str(value).strip() if value not in (None, '') else None
+    for key in ('date_from', 'date_to'):
+        normalized[key] = date.fromisoformat(str(filters[key])[:10]).isoformat()
+    return normalized
+
+
+def report_filter_hash(filters, file_format):
+    """SHA-256 of the normalized filters and output format"""
+    import hashlib
+    import json
+
+    payload = json.dumps({'filters': filters, 'format': file_format}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_report_job_expiry(filters):
+    """
+    Expiry for a report job's cached result.
+
+    Reports that end before today only cover immutable past days and never
+    expire; reports including today expire after REPORT_JOB_TTL_SECONDS.
+    """
+    from datetime import date, timedelta
+    from django.conf import settings
+    from .utils import get_local_date
+
+    if date.fromisoformat(filters['date_to']) < get_local_date():
+        return None
+    return timezone.now() + timedelta(seconds=getattr(settings, 'REPORT_JOB_TTL_SECONDS', 900))
+
+
+def start_report_job(filters, file_format='json', user=None):
+    """
+    Get or start the background job for a report.
+
+    Identical requests (same normalized filters and format) coalesce onto one
+    job row: a pending, running or unexpired completed job is returned as is,
+    and only a failed, stale or expired job is reset and enqueued again.
+    """
+    from django.db import IntegrityError, transaction
+    from .models import ReportJob
+    from .tasks import generate_report_task
+
+    filters = normalize_report_filters(filters)
+    filter_hash = report_filter_hash(filters, file_format)
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                job, created = ReportJob.objects.get_or_create(
+                    filter_hash=filter_hash,
+                    defaults={
+                        'filters': filters,
+                        'file_format': file_format,
+                        'requested_by': user,
+                    },
+                )
+        except IntegrityError:
+            # A concurrent identical request created the job first
+            job, created = ReportJob.objects.get(filter_hash=filter_hash), False
+
+        if not created:
+            job = ReportJob.objects.select_for_update().get(pk=job.pk)
+            if job.is_reusable:
+                return job
+            if job.file:
+                job.file.delete(save=False)
+            job.status = 'PENDING'
+            job.result = None
+            job.error_message = ''
+            job.expires_at = None
+            job.completed_at = None
+            job.requested_by = user
+            job.save()
+
+        transaction.on_commit(lambda: generate_report_task.delay(job.id))
+    return job
+
+
+def run_report_job(job):
+    """Compute a report job's result and store it on the job"""
+    import tempfile
+    from django.core.files import File
+    from .exports import ATTENDANCE_REPORT_COLUMNS, write_csv, write_xlsx
+
+    job.status = 'RUNNING'
+    job.save(update_fields=['status', 'updated_at'])
+
+    try:
+        if job.file_format == 'json':
+            job.result = build_report(job.filters)
+        else:
+            filename = f"attendance_report_{job.filters['date_from']}_{job.filters['date_to']}.{job.file_format}"
+            with tempfile.TemporaryFile() as output:
+                rows = iter_report_rows(job.filters)
+                if job.file_format == 'xlsx':
+                    write_xlsx(rows, ATTENDANCE_REPORT_COLUMNS, output, 'Attendance Report')
+                else:
+                    write_csv(rows, ATTENDANCE_REPORT_COLUMNS, output)
+                output.seek(0)
+                job.file.save(filename, File(output), save=False)
+        job.status = 'COMPLETED'
+        job.completed_at = timezone.now()
+        job.expires_at = get_report_job_expiry(job.filters)
+        job.save()
+    except Exception as e:
+        job.status = 'FAILED'
+        job.error_message = str(e)
+        job.save(update_fields=['status', 'error_message', 'updated_at'])
+        raise
+
+
+REGISTER_CODES = {
+    'P': 'Present',
+    'L': 'Late',
+    'A': 'Absent',
+    '.': 'Upcoming',
+}
+REGISTER_CODE_BY_PRIORITY = {3: 'P', 2: 'L'}
+REGISTER_MAX_DAYS = 200
+
+
+def get_school_days(date_from, date_to):
+    """Calendar days in the range, excluding the configured weekend days"""
+    from datetime import timedelta
+    from django.conf import settings
+
+    weekend_days = set(getattr(settings, 'SCHOOL_WEEKEND_DAYS', [4, 5]))
+    days = []
+    day = date_from
+    while day <= date_to:
+        if day.weekday() not in weekend_days:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def build_register(filters):
+    """
+    Build a students x school days attendance register.
+
+    Each student's row ends with a status string holding one code per school
+    day (see REGISTER_CODES). The best CHECK_IN status of every student and day
+    comes from one grouped query (plus one on the archive for ranges before the
+    archive cutoff), so the cost does not grow with N x D.
+    """
+    from datetime import date
+    from .archive import range_needs_archive
+    from .models import AttendanceArchive
+    from .utils import get_local_date
+
+    date_from = date.fromisoformat(filters['date_from'])
+    date_to = date.fromisoformat(filters['date_to'])
+    if date_from > date_to:
+        raise ValueError('date_from must be on or before date_to')
+    if (date_to - date_from).days >= REGISTER_MAX_DAYS:
+        raise ValueError(f'Date range cannot exceed {REGISTER_MAX_DAYS} days')
+
+    school_days = get_school_days(date_from, date_to)
+    day_index = {day: index for index, day in enumerate(school_days)}
+    today = get_local_date()
+
+    students = list(
+        get_report_students(filters).values_list('id', 'first_name', 'last_name', 'student_id', 'class_name')
+    )
+    student_ids = [student[0] for student in students]
+
+    attendance_models = [Attendance]
+    if range_needs_archive(date_from):
+        attendance_models.append(AttendanceArchive)
+
+    best_by_student = {}
+    if student_ids and school_days:
+        for model in attendance_models:
+            rows = (
+                model.objects.filter(
+                    student_id__in=student_ids,
+                    attendance_type='CHECK_IN',
+                    local_date__gte=date_from,
+                    local_date__lte=date_to,
+                )
+                .values('student_id', 'local_date')
+                .annotate(best=Max(status_priority_expression()))
+                .order_by()
+            )
+            for row in rows:
+                if row['local_date'] in day_index:
+                    days = best_by_student.setdefault(row['student_id'], {})
+                    index = day_index[row['local_date']]
+                    days[index] = max(days.get(index, 0), row['best'])
+
+    default_codes = ['.' if day > today else 'A' for day in school_days]
+    register = []
+    for student_id, first_name, last_name, student_number, class_name in students:
+        codes = list(default_codes)
+        for index, priority in best_by_student.get(student_id, {}).items():
+            codes[index] = REGISTER_CODE_BY_PRIORITY.get(priority, 'A')
+        register.append([
+            student_id,
+            f'{first_name} {last_name}',
+            student_number,
+            class_name or '',
+            ''.join(codes),
+        ])
+
+    return {
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+        'days': [day.isoformat() for day in school_days],
+        'codes': REGISTER_CODES,
+        'columns': ['student_id', 'student_name', 'student_id_number', 'class_name', 'register'],
+        'students': register,
+    }
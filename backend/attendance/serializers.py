@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import FingerprintDevice, Attendance, SMSLog, AttendanceSettings
+from .models import FingerprintDevice, Attendance, SMSLog, SMSLogArchive, AttendanceSettings, ReportJob, StudentAttendanceStats
 from core.serializers import StudentSerializer, ParentSerializer
 
 
@@ -108,18 +108,12 @@ class AttendanceSerializer(serializers.ModelSerializer):
         if validated_data.get('attendance_type') == 'CHECK_IN' and 'timestamp' in validated_data:
             validated_data['status'] = AttendanceSettings.calculate_attendance_status(validated_data['timestamp'])
         
-        attendance = super().create(validated_data)
-        
-        # Send SMS notification to parents after creating attendance
-        try:
-            from .notifications import SMSNotificationService
-            sms_service = SMSNotificationService()
-            sms_service.send_attendance_notification(attendance)
-        except Exception as e:
-            # Don't fail the request if SMS notification fails
-            import traceback
-            print(f"✗ Error sending SMS notification: {str(e)}")
-            print(f"  Traceback: {traceback.format_exc()}")
+        # Queue the SMS notification to parents in the same transaction as the record
+        from django.db import transaction
+        from .outbox import enqueue_notifications
+        with transaction.atomic():
+            attendance = super().create(validated_data)
+            enqueue_notifications(attendance)
         
         return attendance
 
@@ -142,13 +136,29 @@ class SMSLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = SMSLog
         fields = [
-            'id', 'student', 'parent', 'attendance', 'phone_number', 'message',
+            'id', 'student', 'parent', 'attendance', 'channel', 'phone_number', 'message',
             'status', 'display_status', 'api_response', 'error_message', 'message_id',
             'sent_at', 'delivered_at', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
+class SMSLogArchiveSerializer(serializers.ModelSerializer):
+    """Serializer for archived SMS log entries (read-only)"""
+    student = StudentSerializer(read_only=True)
+    parent = ParentSerializer(read_only=True)
+    display_status = serializers.CharField(source='get_status_display', read_only=True)
+
+    class Meta:
+        model = SMSLogArchive
+        fields = [
+            'id', 'student', 'parent', 'attendance_id', 'channel', 'phone_number', 'message',
+            'status', 'display_status', 'api_response', 'error_message', 'message_id',
+            'sent_at', 'delivered_at', 'created_at', 'updated_at', 'archived_at'
+        ]
+        read_only_fields = fields
+
+
 class AttendanceSettingsSerializer(serializers.ModelSerializer):
     """Serializer for attendance settings"""
     sync_frequency_total_seconds = serializers.SerializerMethodField()
@@ -168,6 +178,17 @@ class AttendanceSettingsSerializer(serializers.ModelSerializer):
         """Get total sync frequency in seconds"""
         return obj.get_sync_frequency_seconds()
     
+    def validate_sms_template(self, value):
+        """Reject templates with unknown placeholders or malformed braces"""
+        from django.core.exceptions import ValidationError
+        from .message_templates import validate_template
+        
+        try:
+            validate_template(value)
+        except ValidationError as e:
+            raise serializers.ValidationError(e.messages)
+        return value
+    
     def validate(self, data):
         """Validate time intervals"""
         attendance_start = data.get('attendance_start_time', self.instance.attendance_start_time if self.instance else None)
@@ -189,3 +210,60 @@ class AttendanceSettingsSerializer(serializers.ModelSerializer):
         
         return data
 
+
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    """Serializer for background report job status"""
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ReportJob
+        fields = [
+            'id', 'filter_hash', 'filters', 'file_format', 'status', 'error_message',
+            'expires_at', 'completed_at', 'download_url', 'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
+
+    def get_download_url(self, obj):
+        if obj.status != 'COMPLETED':
+            return None
+        request = self.context.get('request')
+        url = f'/api/attendance/report-jobs/{obj.id}/download/'
+        return request.build_absolute_uri(url) if request else url
+
+
+class ReportJobCreateSerializer(serializers.Serializer):
+    """Serializer for requesting a background report job"""
+    branch_id = serializers.IntegerField(required=False, allow_null=True)
+    grade = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    level = serializers.IntegerField(required=False, allow_null=True)
+    class_name = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    file_format = serializers.ChoiceField(choices=['json', 'csv', 'xlsx'], default='json')
+
+    def validate(self, data):
+        from django.utils import timezone
+
+        today = timezone.now().date()
+        data['date_from'] = data.get('date_from') or today
+        data['date_to'] = data.get('date_to') or today
+        if data['date_from'] > data['date_to']:
+            raise serializers.ValidationError({"date_to": "End date must be on or after start date"})
+        return data
+
+
+class StudentAttendanceStatsSerializer(serializers.ModelSerializer):
+    student_name = serializers.CharField(source='student.full_name', read_only=True)
+    student_id_number = serializers.CharField(source='student.student_id', read_only=True)
+    days_counted = serializers.IntegerField(read_only=True)
+    attendance_rate = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = StudentAttendanceStats
+        fields = [
+            'student', 'student_name', 'student_id_number', 'school_year_start',
+            'days_present', 'days_late', 'days_absent', 'days_counted', 'attendance_rate',
+            'current_streak', 'streak_status', 'last_day_status', 'last_counted_date', 'last_seen',
+        ]
+        read_only_fields = fields
@@ -6,7 +6,9 @@ from typing import Optional, List, Dict, Tuple
 from django.utils import timezone
 from django.utils.timezone import make_aware, make_naive
 from django.conf import settings
+from django.db import transaction
 from .models import FingerprintDevice, Attendance
+from .outbox import enqueue_notifications, request_dispatch
 from core.models import Student
 
 
@@ -156,6 +158,7 @@ class ZKtecoDeviceService:
             
             synced_records = []
             skipped_records = []
+            queued_notifications = 0
             
             for att in attendances:
                 # Find student by student_id (device stores student_id as user_id)
@@ -215,50 +218,17 @@ class ZKtecoDeviceService:
                     ).first()
                     
                     if not existing:
-                        attendance = Attendance.create_attendance(
-                            student=student,
-                            attendance_type=attendance_type,
-                            timestamp=device_timestamp,
-                            device=self.device
-                        )
-                        
-                        # Send WhatsApp notification to parents
-                        notification_result = None
-                        try:
-                            from .notifications import WhatsAppNotificationService
-                            whatsapp_service = WhatsAppNotificationService()
-                            notification_result = whatsapp_service.send_attendance_notification(attendance)
-                            
-                            # Log notification results for debugging
-                            if notification_result.get('success'):
-                                print(f"✓ WhatsApp notification sent for {student.full_name}: {notification_result.get('sent', 0)} sent, {notification_result.get('failed', 0)} failed")
-                            else:
-                                print(f"✗ WhatsApp notification failed for {student.full_name}: {notification_result.get('errors', ['Unknown error'])}")
-                        except Exception as e:
-                            # Don't fail the sync if notification fails
-                            import traceback
-                            print(f"✗ Error sending WhatsApp notification for {student.full_name}: {str(e)}")
-                            print(f"  Traceback: {traceback.format_exc()}")
-                            notification_result = {'success': False, 'error': str(e)}
-                        
-                        # Send SMS notification to parents
-                        sms_notification_result = None
-                        try:
-                            from .notifications import SMSNotificationService
-                            sms_service = SMSNotificationService()
-                            sms_notification_result = sms_service.send_attendance_notification(attendance)
-                            
-                            # Log SMS notification results for debugging
-                            if sms_notification_result.get('success'):
-                                print(f"✓ SMS notification sent for {student.full_name}: {sms_notification_result.get('sent', 0)} sent, {sms_notification_result.get('failed', 0)} failed")
-                            else:
-                                print(f"✗ SMS notification failed for {student.full_name}: {sms_notification_result.get('errors', ['Unknown error'])}")
-                        except Exception as e:
-                            # Don't fail the sync if SMS notification fails
-                            import traceback
-                            print(f"✗ Error sending SMS notification for {student.full_name}: {str(e)}")
-                            print(f"  Traceback: {traceback.format_exc()}")
-                            sms_notification_result = {'success': False, 'error': str(e)}
+                        # Notifications are queued with the record and sent by the outbox dispatcher
+                        with transaction.atomic():
+                            attendance = Attendance.create_attendance(
+                                student=student,
+                                attendance_type=attendance_type,
+                                timestamp=device_timestamp,
+                                device=self.device
+                            )
+                            queued = enqueue_notifications(attendance, channels=('WHATSAPP', 'SMS'), dispatch=False)
+                        queued_notifications += queued
+                        notification_result = {'queued': queued}
                         
                         synced_records.append({
                             'id': attendance.id,
@@ -277,6 +247,9 @@ class ZKtecoDeviceService:
                     })
                     continue
             
+            # Start enough dispatch workers for the notifications queued by this sync
+            request_dispatch(queued_notifications)
+            
             # Update last sync time
             self.device.last_sync = timezone.now()
             self.device.save(update_fields=['last_sync'])
@@ -0,0 +1,149 @@
+"""
+Local stub of the SMS and WhatsApp provider APIs, for offline load tests
+
+StubProviderServer answers the Mora send endpoint (POST .../sendsms) and the
+WhatsApp Cloud messages endpoint (POST .../<phone number id>/messages) the
+way the real providers do, after a simulated latency (latency_ms, plus up to
+jitter_ms at random). A share of the requests (error_rate) fails:
+
+- with error_code: the provider's error response for that code (Mora: HTTP
+  200 with data.code, WhatsApp: HTTP 400 with error.code). Account errors
+  such as 105 (Mora, insufficient balance) or 131042 (WhatsApp, payment
+  issue) trip the circuit breaker;
+- otherwise with HTTP error_status (default 503).
+
+MoraStubBackend and WhatsAppStubBackend (attendance.channel_backends) send to
+it at NOTIFICATION_STUB_URL. Run it with manage.py run_provider_stub, or
+in-process with start(); stats() counts requests, numbers, errors and the
+most requests in flight at once.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class StubProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes: without this, delayed ACKs add ~40 ms to every response
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        path = urlsplit(self.path).path
+        if path.endswith('/sendsms'):
+            provider = 'SMS'
+            numbers = [number for number in parse_qs(body.decode()).get('numbers', [''])[0].split(',') if number]
+        elif path.endswith('/messages'):
+            provider = 'WHATSAPP'
+            try:
+                numbers = [json.loads(body or b'{}').get('to') or '']
+            except ValueError:
+                numbers = []
+        else:
+            self.respond(404, {'message': f'Unknown endpoint {path}'})
+            return
+
+        message_id, failed = server.begin(len(numbers))
+        try:
+            time.sleep(server.delay())
+        finally:
+            server.end()
+
+        if failed and server.error_code is not None:
+            if provider == 'SMS':
+                self.respond(200, {'data': {'code': server.error_code, 'message': 'Simulated provider error'}})
+            else:
+                self.respond(400, {'error': {'message': 'Simulated provider error', 'code': server.error_code}})
+        elif failed:
+            self.respond(server.error_status, {'message': 'Simulated provider error', 'error': {'message': 'Simulated provider error'}})
+        elif provider == 'SMS':
+            self.respond(200, {'data': {'code': 100, 'message': 'Numbers received successfully', 'ref_id': message_id}})
+        else:
+            self.respond(200, {
+                'messaging_product': 'whatsapp',
+                'contacts': [{'input': numbers[0], 'wa_id': numbers[0]}],
+                'messages': [{'id': f'wamid.STUB{message_id}'}],
+            })
+
+    def respond(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubProviderServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address=('127.0.0.1', 0), latency_ms=50, jitter_ms=0, error_rate=0.0, error_status=503,
+                 error_code=None, seed=None):
+        super().__init__(address, StubProviderHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.error_code = error_code
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.reset_stats()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests = self.numbers = self.errors = 0
+            self.in_flight = self.max_in_flight = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'numbers': self.numbers,
+                'errors': self.errors,
+                'max_in_flight': self.max_in_flight,
+            }
+
+    def delay(self):
+        with self.lock:
+            jitter = self.random.uniform(0, self.jitter_ms) if self.jitter_ms else 0
+        return (self.latency_ms + jitter) / 1000
+
+    def begin(self, numbers):
+        """Count a request; returns its message ID and whether it is to fail"""
+        with self.lock:
+            self.requests += 1
+            self.numbers += numbers
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            return self.requests, failed
+
+    def end(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def start(self):
+        """Serve from a background thread"""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
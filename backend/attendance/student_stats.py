@@ -0,0 +1,225 @@
+"""
+Per-student running attendance statistics
+
+StudentAttendanceStats keeps, for the current school year, the number of days
+present, late and absent, the current streak and the last time the student
+was seen. Counters are updated incrementally:
+
+- on ingest, a student's first ATTENDED or LATE check-in of a day counts that
+  day as present or late;
+- the end-of-day absence job counts the day for every student, covering
+  recorded absences and any present day ingest did not count.
+
+Each day is counted once per student (last_counted_date only moves forward),
+so both paths can run in any order and be retried. Events that arrive out of
+order (a check-in for an already counted day or for an earlier day) rebuild
+that student's counters from their attendance and recorded absences.
+"""
+import logging
+
+from django.db.models import Case, F, Max, PositiveIntegerField, Q, Value, When
+from django.utils import timezone
+
+from .utils import get_local_date, status_priority_expression
+
+logger = logging.getLogger(__name__)
+
+STATS_BATCH_SIZE = 1000
+
+COUNTER_FIELDS = {'ATTENDED': 'days_present', 'LATE': 'days_late', 'ABSENT': 'days_absent'}
+OUTCOME_PRIORITY = {'ATTENDED': 3, 'LATE': 2, 'ABSENT': 1}
+OUTCOME_BY_PRIORITY = {3: 'ATTENDED', 2: 'LATE'}
+
+
+def _chunks(items, size=STATS_BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def ensure_stats(student_ids, school_year_start):
+    """Create missing stats rows and reset rows left over from a previous school year"""
+    from .models import StudentAttendanceStats
+
+    StudentAttendanceStats.objects.bulk_create(
+        [StudentAttendanceStats(student_id=student_id, school_year_start=school_year_start) for student_id in student_ids],
+        ignore_conflicts=True,
+    )
+    StudentAttendanceStats.objects.filter(
+        student_id__in=student_ids, school_year_start__lt=school_year_start
+    ).update(
+        school_year_start=school_year_start,
+        days_present=0,
+        days_late=0,
+        days_absent=0,
+        current_streak=0,
+        streak_status='',
+        last_day_status='',
+        last_counted_date=None,
+        updated_at=timezone.now(),
+    )
+
+
+def apply_day_outcome(student_ids, day, outcome):
+    """
+    Count one school day with the same outcome for a set of students.
+
+    Students whose counters already include the day (or a later one) are left
+    untouched.
+
+    Returns:
+        int: Number of students whose counters were updated
+    """
+    from .archive import get_school_year_start
+    from .models import StudentAttendanceStats
+
+    school_year_start = get_school_year_start(day)
+    counter = COUNTER_FIELDS[outcome]
+    streak_status = 'ABSENT' if outcome == 'ABSENT' else 'PRESENT'
+
+    updated = 0
+    for chunk in _chunks(list(student_ids)):
+        ensure_stats(chunk, school_year_start)
+        updated += StudentAttendanceStats.objects.filter(
+            Q(last_counted_date__isnull=True) | Q(last_counted_date__lt=day),
+            student_id__in=chunk,
+            school_year_start=school_year_start,
+        ).update(**{
+            counter: F(counter) + 1,
+            'current_streak': Case(
+                When(streak_status=streak_status, then=F('current_streak') + 1),
+                default=Value(1),
+                output_field=PositiveIntegerField(),
+            ),
+            'streak_status': streak_status,
+            'last_day_status': outcome,
+            'last_counted_date': day,
+            'updated_at': timezone.now(),
+        })
+    return updated
+
+
+def record_attendance_stats(attendance):
+    """Apply a newly created attendance record to the student's statistics"""
+    from .models import StudentAttendanceStats
+
+    try:
+        if not StudentAttendanceStats.objects.filter(student_id=attendance.student_id).exists():
+            # First record seen for this student: start from their full history
+            rebuild_student_stats([attendance.student_id])
+            return
+
+        StudentAttendanceStats.objects.filter(
+            Q(last_seen__isnull=True) | Q(last_seen__lt=attendance.timestamp),
+            student_id=attendance.student_id,
+        ).update(last_seen=attendance.timestamp)
+
+        outcome = attendance.status if attendance.attendance_type == 'CHECK_IN' else None
+        if outcome not in ('ATTENDED', 'LATE'):
+            return
+        day = attendance.local_date or get_local_date(attendance.timestamp)
+        if apply_day_outcome([attendance.student_id], day, outcome):
+            return
+
+        # The day was already counted: only a better outcome or an earlier day changes anything
+        stats = StudentAttendanceStats.objects.filter(student_id=attendance.student_id).first()
+        if stats is None or stats.last_counted_date is None:
+            return
+        if stats.last_counted_date > day or OUTCOME_PRIORITY.get(stats.last_day_status, 0) < OUTCOME_PRIORITY[outcome]:
+            rebuild_student_stats([attendance.student_id])
+    except Exception as e:
+        logger.warning(f"Failed to update attendance statistics for record {attendance.id}: {e}")
+
+
+def update_stats_for_day(day):
+    """
+    Count a finished school day for every student (run by the end-of-day job).
+
+    Returns:
+        dict: students counted per outcome
+    """
+    from .models import Attendance, DailyAbsence
+
+    best_by_student = (
+        Attendance.objects.filter(local_date=day, attendance_type='CHECK_IN', status__in=('ATTENDED', 'LATE'))
+        .values('student_id')
+        .annotate(best=Max(status_priority_expression()))
+        .order_by()
+    )
+    by_outcome = {'ATTENDED': [], 'LATE': []}
+    for row in best_by_student:
+        by_outcome[OUTCOME_BY_PRIORITY[row['best']]].append(row['student_id'])
+    by_outcome['ABSENT'] = list(DailyAbsence.objects.filter(date=day).values_list('student_id', flat=True))
+
+    return {outcome: apply_day_outcome(student_ids, day, outcome) for outcome, student_ids in by_outcome.items()}
+
+
+def rebuild_student_stats(student_ids=None, today=None):
+    """
+    Recompute statistics from attendance records and recorded absences.
+
+    Rebuilds the given students, or every active student. Used for backfill
+    and for corrections when events arrive out of order.
+
+    Returns:
+        int: Number of students rebuilt
+    """
+    from core.models import Student
+    from .archive import get_school_year_start
+    from .models import Attendance, DailyAbsence, StudentAttendanceStats
+
+    today = today or get_local_date()
+    school_year_start = get_school_year_start(today)
+    if student_ids is None:
+        student_ids = list(Student.objects.filter(is_active=True).order_by('id').values_list('id', flat=True))
+
+    rebuilt = 0
+    for chunk in _chunks(list(student_ids)):
+        days_by_student = {student_id: {} for student_id in chunk}
+        last_seen = {}
+
+        records = Attendance.objects.filter(
+            student_id__in=chunk, local_date__gte=school_year_start, local_date__lte=today
+        )
+        for row in records.values('student_id').annotate(last_seen=Max('timestamp')).order_by():
+            last_seen[row['student_id']] = row['last_seen']
+        present_days = (
+            records.filter(attendance_type='CHECK_IN', status__in=('ATTENDED', 'LATE'))
+            .values('student_id', 'local_date')
+            .annotate(best=Max(status_priority_expression()))
+            .order_by()
+        )
+        for row in present_days:
+            days_by_student[row['student_id']][row['local_date']] = OUTCOME_BY_PRIORITY[row['best']]
+        absences = DailyAbsence.objects.filter(
+            student_id__in=chunk, date__gte=school_year_start, date__lte=today
+        ).values_list('student_id', 'date')
+        for student_id, day in absences:
+            days_by_student[student_id].setdefault(day, 'ABSENT')
+
+        rows = []
+        for student_id, days in days_by_student.items():
+            stats = StudentAttendanceStats(
+                student_id=student_id, school_year_start=school_year_start, last_seen=last_seen.get(student_id)
+            )
+            for day in sorted(days):
+                outcome = days[day]
+                setattr(stats, COUNTER_FIELDS[outcome], getattr(stats, COUNTER_FIELDS[outcome]) + 1)
+                streak_status = 'ABSENT' if outcome == 'ABSENT' else 'PRESENT'
+                stats.current_streak = stats.current_streak + 1 if stats.streak_status == streak_status else 1
+                stats.streak_status = streak_status
+                stats.last_day_status = outcome
+                stats.last_counted_date = day
+            stats.updated_at = timezone.now()
+            rows.append(stats)
+
+        StudentAttendanceStats.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['student'],
+            update_fields=[
+                'school_year_start', 'days_present', 'days_late', 'days_absent', 'current_streak',
+                'streak_status', 'last_day_status', 'last_counted_date', 'last_seen', 'updated_at',
+            ],
+        )
+        rebuilt += len(rows)
+    return rebuilt
@@ -0,0 +1,117 @@
+"""
+Duplicate suppression for attendance notifications
+
+Students often punch several times within a few minutes, and backup devices
+report the same punch again. Parents get one notification per student,
+attendance type and local day within NOTIFICATION_SUPPRESSION_WINDOW_SECONDS:
+a punch closer than that to an already notified punch of the same type and
+day queues nothing (no rendering, no provider calls, no SMS log).
+
+The last notified punch time is kept in Redis (<KEY_PREFIX>:<local date>:
+<student>:<type>) and only written once the punch's transaction commits, so a
+rolled-back ingest does not silence the next real punch. Until then the punch
+holds a short reservation (<key>:reserved, RESERVATION_SECONDS) that is
+checked and taken in one Lua script, so concurrent ingest paths agree. A punch
+whose transaction rolls back can therefore suppress punches within its window
+for at most RESERVATION_SECONDS. Windows are measured on punch timestamps, so
+records synced late from a device are judged by when they happened.
+
+If Redis is unreachable, the outbox is queried for a notified punch within
+the window instead.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+
+from .utils import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'notify:last'
+KEY_TTL_SECONDS = 2 * 24 * 3600
+DEFAULT_WINDOW_SECONDS = 600
+# Longer than an ingest transaction
+RESERVATION_SECONDS = 60
+
+# KEYS: last notified punch, reservation
+# ARGV: punch time (ms), window (ms), reservation ttl
+# Returns 1 when the punch should be notified (and reserves it), 0 when suppressed
+CHECK_SCRIPT = """
+local punch = tonumber(ARGV[1])
+for _, key in ipairs(KEYS) do
+    local last = tonumber(redis.call('GET', key) or '')
+    if last and math.abs(punch - last) < tonumber(ARGV[2]) then
+        return 0
+    end
+end
+redis.call('SET', KEYS[2], ARGV[1], 'EX', ARGV[3])
+return 1
+"""
+
+# KEYS: last notified punch, reservation
+# ARGV: punch time (ms), ttl
+RECORD_SCRIPT = """
+local last = tonumber(redis.call('GET', KEYS[1]) or '')
+redis.call('SET', KEYS[1], tostring(math.max(tonumber(ARGV[1]), last or 0)), 'EX', ARGV[2])
+if redis.call('GET', KEYS[2]) == ARGV[1] then
+    redis.call('DEL', KEYS[2])
+end
+return 1
+"""
+
+
+def get_window():
+    """Quiet window in seconds (0 disables suppression)"""
+    return getattr(settings, 'NOTIFICATION_SUPPRESSION_WINDOW_SECONDS', DEFAULT_WINDOW_SECONDS)
+
+
+def suppression_key(attendance):
+    return f'{KEY_PREFIX}:{attendance.local_date.isoformat()}:{attendance.student_id}:{attendance.attendance_type}'
+
+
+def _notified_nearby(attendance, window):
+    """Database fallback: whether a punch within the window has queued notifications"""
+    from .models import NotificationOutbox
+
+    delta = timedelta(seconds=window)
+    return NotificationOutbox.objects.filter(
+        attendance__student_id=attendance.student_id,
+        attendance__local_date=attendance.local_date,
+        attendance__attendance_type=attendance.attendance_type,
+        attendance__timestamp__gt=attendance.timestamp - delta,
+        attendance__timestamp__lt=attendance.timestamp + delta,
+    ).exclude(attendance_id=attendance.id).exists()
+
+
+def should_notify(attendance):
+    """
+    Whether an attendance record's notifications should be queued; reserves
+    it when so, and records it as notified once the current transaction
+    commits.
+
+    Call before queueing, inside the ingest transaction.
+    """
+    window = get_window()
+    if not window or attendance.local_date is None:
+        return True
+    key = suppression_key(attendance)
+    punch = int(attendance.timestamp.timestamp() * 1000)
+    try:
+        allowed = bool(int(get_redis_client().eval(
+            CHECK_SCRIPT, 2, key, f'{key}:reserved', punch, int(window * 1000), RESERVATION_SECONDS,
+        )))
+    except Exception as e:
+        logger.warning(f"Notification suppression unavailable, using database: {e}")
+        return not _notified_nearby(attendance, window)
+    if allowed:
+        transaction.on_commit(lambda: _record_notified(key, punch))
+    return allowed
+
+
+def _record_notified(key, punch):
+    try:
+        get_redis_client().eval(RECORD_SCRIPT, 2, key, f'{key}:reserved', punch, KEY_TTL_SECONDS)
+    except Exception as e:
+        logger.warning(f"Failed to record notified punch {key}: {e}")
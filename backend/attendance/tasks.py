@@ -2,6 +2,7 @@
 Celery tasks for attendance syncing
 """
 from celery import shared_task
+from django.conf import settings
 from django.core.management import call_command
 from django.utils import timezone
 import logging
@@ -46,3 +47,143 @@ def sync_attendance_task(device_id=None):
         logger.error(f"Error in Celery task sync_attendance: {str(e)}", exc_info=True)
         return {'status': 'error', 'message': str(e)}
 
+
+
+@shared_task(name='attendance.generate_report')
+def generate_report_task(job_id):
+    """
+    Task to compute a background attendance report job
+    Stores the JSON result or export file on the ReportJob row
+    """
+    from .models import ReportJob
+    from .reports import run_report_job
+
+    logger.info(f"Starting Celery task: generate_report for job {job_id}")
+    try:
+        job = ReportJob.objects.get(id=job_id)
+    except ReportJob.DoesNotExist:
+        logger.warning(f"Report job {job_id} no longer exists")
+        return {'status': 'error', 'message': 'Report job not found'}
+    try:
+        run_report_job(job)
+        logger.info(f"Celery task generate_report completed for job {job_id}")
+        return {'status': 'success', 'job_id': job_id}
+    except Exception as e:
+        logger.error(f"Error in Celery task generate_report for job {job_id}: {str(e)}", exc_info=True)
+        return {'status': 'error', 'message': str(e)}
+
+
+@shared_task(name='attendance.cleanup_report_jobs')
+def cleanup_report_jobs_task():
+    """
+    Task to delete expired report jobs and their export files
+    """
+    from .models import ReportJob
+
+    expired_jobs = ReportJob.objects.filter(expires_at__lte=timezone.now())
+    deleted = 0
+    for job in expired_jobs.iterator():
+        if job.file:
+            job.file.delete(save=False)
+        job.delete()
+        deleted += 1
+    logger.info(f"Celery task cleanup_report_jobs deleted {deleted} expired report job(s)")
+    return {'status': 'success', 'deleted': deleted}
+
+
+@shared_task(name='attendance.ensure_partitions')
+def ensure_partitions_task(months_ahead=None):
+    """
+    Task to create upcoming monthly partitions for attendance records and SMS logs
+    """
+    from .partitioning import DEFAULT_MONTHS_AHEAD, ensure_future_partitions
+
+    try:
+        created = ensure_future_partitions(months_ahead or DEFAULT_MONTHS_AHEAD)
+        logger.info(f"Celery task ensure_partitions created {len(created)} partition(s)")
+        return {'status': 'success', 'created': created}
+    except Exception as e:
+        logger.error(f"Error in Celery task ensure_partitions: {str(e)}", exc_info=True)
+        return {'status': 'error', 'message': str(e)}
+
+
+@shared_task(name='attendance.materialize_absences')
+def materialize_absences_task(day=None):
+    """
+    Task to record the day's absences at the end of the school day
+    Defaults to today in the device timezone; day may be an ISO date string
+    """
+    from datetime import date
+    from .absences import materialize_absences
+    from .utils import get_local_date
+
+    day = date.fromisoformat(day) if day else get_local_date()
+    try:
+        recorded = materialize_absences(day)
+        if recorded is None:
+            logger.info(f"Celery task materialize_absences skipped {day}: not a school day")
+            return {'status': 'success', 'date': day.isoformat(), 'skipped': True}
+        logger.info(f"Celery task materialize_absences recorded {recorded} absence(s) for {day}")
+        return {'status': 'success', 'date': day.isoformat(), 'recorded': recorded}
+    except Exception as e:
+        logger.error(f"Error in Celery task materialize_absences for {day}: {str(e)}", exc_info=True)
+        return {'status': 'error', 'message': str(e)}
+
+
+@shared_task(name='attendance.dispatch_notifications')
+def dispatch_notifications_task():
+    """
+    Task to send queued attendance notifications from the outbox
+    Any number of workers can run it at once; each claims its own batches
+    """
+    from .provider_http import provider_metrics
+
+    try:
+        if getattr(settings, 'NOTIFICATION_DISPATCH_MODE', 'async') == 'sync':
+            from .outbox import dispatch_notifications
+        else:
+            from .async_dispatch import dispatch_notifications_async as dispatch_notifications
+        results = dispatch_notifications()
+        # Provider requests made by this run (counters are per worker process)
+        http_metrics = provider_metrics(reset=True)
+        if any(results.values()):
+            logger.info(
+                f"Celery task dispatch_notifications: {results['SENT']} sent, "
+                f"{results['PENDING']} to retry, {results['DEAD']} dead-lettered; provider requests: {http_metrics}"
+            )
+        return {'status': 'success', **{status.lower(): count for status, count in results.items()}, 'http': http_metrics}
+    except Exception as e:
+        logger.error(f"Error in Celery task dispatch_notifications: {str(e)}", exc_info=True)
+        return {'status': 'error', 'message': str(e)}
+
+
+@shared_task(name='attendance.purge_notification_outbox')
+def purge_notification_outbox_task():
+    """
+    Task to delete sent and dead-lettered outbox rows past their retention period
+    """
+    from .outbox import purge_notifications
+
+    deleted = purge_notifications()
+    logger.info(f"Celery task purge_notification_outbox deleted {deleted} outbox row(s)")
+    return {'status': 'success', 'deleted': deleted}
+
+
+@shared_task(name='attendance.apply_delivery_receipts')
+def apply_delivery_receipts_task():
+    """
+    Task to apply queued provider delivery receipts to the notification logs in batches
+    """
+    from .receipts import process_receipt_queue
+
+    try:
+        results = process_receipt_queue()
+        if results['receipts']:
+            logger.info(
+                f"Celery task apply_delivery_receipts applied {results['receipts']} receipt(s), "
+                f"{results['updated']} log(s) updated"
+            )
+        return {'status': 'success', **results}
+    except Exception as e:
+        logger.error(f"Error in Celery task apply_delivery_receipts: {str(e)}", exc_info=True)
+        return {'status': 'error', 'message': str(e)}
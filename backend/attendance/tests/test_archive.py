@@ -0,0 +1,68 @@
+"""
+Archival of closed school years: moving rows, conflicts and the archive endpoint
+
+Run with: python manage.py test attendance
+"""
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+CUTOFF = datetime(2024, 8, 1, tzinfo=dt_timezone.utc)
+SENT_AT = datetime(2024, 3, 3, 5, 0, tzinfo=dt_timezone.utc)
+
+
+class ArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from core.models import Branch, Parent, Student
+        from ..models import Attendance, SMSLog
+
+        student = Student.objects.create(
+            first_name='Archived', last_name='Student', student_id='AR-0001', grade='PRIMARY', level=1,
+            gender='M', date_of_birth=date(2015, 1, 1), branch=Branch.objects.get(id=1),
+        )
+        parent = Parent.objects.create(
+            first_name='Archived', last_name='Parent', email='archived@example.com', phone_number='0550000001',
+        )
+        attendance = Attendance.objects.create(student=student, attendance_type='CHECK_OUT', timestamp=SENT_AT)
+        cls.sms_log = SMSLog.objects.create(
+            student=student, parent=parent, attendance=attendance, phone_number=parent.phone_number,
+            message='Checked out', status='SENT', sent_at=SENT_AT,
+        )
+        SMSLog.objects.filter(id=cls.sms_log.id).update(created_at=SENT_AT)
+        cls.user = User.objects.create_user('archive', password='archive')
+
+    def test_conflicting_row_fails_the_run(self):
+        from ..archive import run_archive
+        from ..models import ArchiveRun, SMSLog, SMSLogArchive
+
+        SMSLogArchive.objects.create(
+            id=self.sms_log.id, student_id=self.sms_log.student_id, parent_id=self.sms_log.parent_id,
+            attendance_id=self.sms_log.attendance_id, phone_number='', message='', status='SENT',
+            created_at=SENT_AT, updated_at=SENT_AT,
+        )
+        with self.assertRaises(IntegrityError):
+            run_archive(CUTOFF)
+
+        # Still in the hot table, not lost
+        self.assertTrue(SMSLog.objects.filter(id=self.sms_log.id).exists())
+        self.assertEqual(ArchiveRun.objects.get(cutoff=CUTOFF).status, 'FAILED')
+
+    def test_archived_logs_are_listed_by_the_archive_endpoint(self):
+        from ..archive import run_archive
+
+        run = run_archive(CUTOFF)
+        self.assertEqual((run.sms_logs_archived, run.attendances_archived), (1, 1))
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get('/api/attendance/sms-logs/').data['count'], 0)
+        response = client.get('/api/attendance/sms-logs-archive/', {'date_from': '2024-03-01'})
+        self.assertEqual([row['id'] for row in response.data['results']], [self.sms_log.id])
+        self.assertEqual(response.data['results'][0]['attendance_id'], self.sms_log.attendance_id)
+        statistics = client.get('/api/attendance/sms-logs-archive/statistics/').data
+        self.assertEqual((statistics['total'], statistics['sent']), (1, 1))
+        self.assertEqual(client.delete(f'/api/attendance/sms-logs-archive/{self.sms_log.id}/').status_code, 405)
@@ -0,0 +1,140 @@
+"""
+Asyncio outbox dispatcher against a local stub SMS provider
+
+Run with: python manage.py test attendance
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .utils import RedisDisabledMixin, create_family
+
+
+class SlowProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            server.requests += 1
+            ref_id = server.requests
+        time.sleep(0.05)
+        with server.lock:
+            server.in_flight -= 1
+        body = json.dumps({'data': {'code': 100, 'ref_id': ref_id}}).encode()
+        self.send_response(server.status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(
+    SMS_ENABLED=True, WHATSAPP_ENABLED=False, SMS_API_KEY='key', SMS_USERNAME='user', SMS_SENDER_NAME='School',
+    SMS_BATCH_WINDOW_SECONDS=0, SMS_RATE_LIMIT_PER_SECOND=0, SMS_HTTP_RETRIES=0, SMS_ASYNC_CONCURRENCY=4,
+)
+class AsyncDispatchTests(RedisDisabledMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from ..models import AttendanceSettings
+
+        cls.student, cls.parents = create_family('Async', 'AD-0001', 24, '0510000')
+        # Personalized texts: one submission per parent
+        attendance_settings = AttendanceSettings.get_settings()
+        attendance_settings.sms_template = 'Dear {parent_name}, {student_name} checked out at {time_attended}'
+        attendance_settings.save(update_fields=['sms_template'])
+
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), SlowProviderHandler)
+        self.server.lock = threading.Lock()
+        self.server.in_flight = self.server.max_in_flight = self.server.requests = 0
+        self.server.status = 200
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        settings_override = override_settings(SMS_API_BASE_URL=f'http://127.0.0.1:{self.server.server_port}')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create_attendance(self):
+        from ..models import Attendance
+        from ..outbox import enqueue_notifications
+
+        attendance = Attendance.create_attendance(self.student, 'CHECK_OUT', timezone.now())
+        self.assertEqual(enqueue_notifications(attendance, dispatch=False), len(self.parents))
+        return attendance
+
+    def test_requests_are_concurrent_within_the_cap(self):
+        from ..async_dispatch import dispatch_notifications_async
+        from ..models import NotificationOutbox, SMSLog
+
+        attendance = self.create_attendance()
+        self.assertEqual(dispatch_notifications_async(), {'SENT': len(self.parents), 'PENDING': 0, 'DEAD': 0})
+        self.assertEqual(self.server.requests, len(self.parents))
+        self.assertGreater(self.server.max_in_flight, 1)
+        self.assertLessEqual(self.server.max_in_flight, 4)
+        self.assertEqual(set(NotificationOutbox.objects.values_list('status', flat=True)), {'SENT'})
+        # Every parent's log carries the ref_id of its own submission
+        logs = SMSLog.objects.filter(attendance_id=attendance.id, status='SENT')
+        self.assertEqual(len({log.message_id for log in logs}), len(self.parents))
+
+    def test_provider_errors_are_retried_later(self):
+        from ..async_dispatch import dispatch_notifications_async
+        from ..models import NotificationOutbox, SMSLog
+
+        self.server.status = 503
+        attendance = self.create_attendance()
+        self.assertEqual(dispatch_notifications_async(), {'SENT': 0, 'PENDING': len(self.parents), 'DEAD': 0})
+        self.assertFalse(SMSLog.objects.filter(attendance_id=attendance.id).exists())
+        # The failures opened the circuit breaker: the rest were parked without a request or an attempt
+        self.assertLess(self.server.requests, len(self.parents))
+        attempts = list(NotificationOutbox.objects.values_list('attempts', flat=True))
+        self.assertEqual(attempts.count(1), self.server.requests)
+        self.assertEqual(attempts.count(0), len(self.parents) - self.server.requests)
+
+    def test_unexpected_send_errors_are_retried(self):
+        from ..async_dispatch import dispatch_notifications_async
+        from ..models import NotificationOutbox
+
+        self.create_attendance()
+        with mock.patch('attendance.channel_backends.MoraBackend.send_async', side_effect=ValueError('Unexpected')), \
+                self.assertLogs('attendance.async_dispatch', 'ERROR'):
+            self.assertEqual(dispatch_notifications_async(), {'SENT': 0, 'PENDING': len(self.parents), 'DEAD': 0})
+        self.assertEqual(set(NotificationOutbox.objects.values_list('status', 'attempts')), {('PENDING', 1)})
+
+    @override_settings(WHATSAPP_RATE_LIMIT_PER_SECOND=0)
+    def test_unparseable_error_responses_are_classified_by_status(self):
+        import asyncio
+
+        import httpx
+        from ..channel_backends import WhatsAppCloudBackend
+
+        responses = [
+            httpx.Response(502, text='<html><body>Bad Gateway</body></html>'),
+            httpx.Response(400, json={'error': 'Invalid parameter'}),
+        ]
+        transport = httpx.MockTransport(lambda request: responses.pop(0))
+
+        async def send_twice():
+            async with httpx.AsyncClient(transport=transport) as client:
+                backend = WhatsAppCloudBackend()
+                return [await backend.send_async(client, ['0510000000'], 'Checked out') for _ in range(2)]
+
+        gateway_error, rejection = asyncio.run(send_twice())
+        self.assertTrue(gateway_error['retriable'])
+        self.assertIn('Bad Gateway', gateway_error['error'])
+        self.assertFalse(rejection['retriable'])
+        self.assertEqual(rejection['error'], 'WhatsApp API error: Invalid parameter')
@@ -0,0 +1,131 @@
+"""
+Channel backends: shared parent fan-out, in-memory and stub provider backends,
+and the notification throughput benchmark
+
+Run with: python manage.py test attendance
+"""
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .utils import RedisDisabledMixin, create_family
+
+
+@override_settings(
+    SMS_ENABLED=True, WHATSAPP_ENABLED=True, SMS_BATCH_WINDOW_SECONDS=0,
+    SMS_STUB_RATE_LIMIT_PER_SECOND=0, WHATSAPP_STUB_RATE_LIMIT_PER_SECOND=0,
+    SMS_STUB_HTTP_RETRIES=0, WHATSAPP_STUB_HTTP_RETRIES=0,
+    SMS_BACKEND='attendance.channel_backends.InMemoryBackend',
+    WHATSAPP_BACKEND='attendance.channel_backends.InMemoryBackend',
+)
+class ChannelBackendTests(RedisDisabledMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from ..models import AttendanceSettings
+
+        cls.student, cls.parents = create_family('Backend', 'CB-0001', 2, '0530000')
+        # The same text for both parents: one SMS submission
+        attendance_settings = AttendanceSettings.get_settings()
+        attendance_settings.sms_template = '{student_name} checked out at {time_attended}'
+        attendance_settings.save(update_fields=['sms_template'])
+
+    def setUp(self):
+        from ..channel_backends import clear_sent_messages
+
+        super().setUp()
+        clear_sent_messages()
+
+    def create_attendance(self):
+        from ..models import Attendance
+        from ..outbox import enqueue_notifications
+
+        attendance = Attendance.create_attendance(self.student, 'CHECK_OUT', timezone.now())
+        enqueue_notifications(attendance, channels=('SMS', 'WHATSAPP'), dispatch=False)
+        return attendance
+
+    def test_channels_share_the_recipient_list(self):
+        from ..channel_backends import sent_messages
+        from ..models import NotificationOutbox, SMSLog
+        from ..notifications import resolve_recipients
+        from ..outbox import dispatch_notifications
+
+        attendance = self.create_attendance()
+        with self.assertNumQueries(1):
+            recipients = resolve_recipients([attendance])
+        self.assertEqual(recipients[attendance.id], self.parents)
+        queued = NotificationOutbox.objects.filter(attendance_id=attendance.id)
+        self.assertEqual(
+            sorted(queued.values_list('channel', 'parent_id')),
+            [(channel, parent.id) for channel in ('SMS', 'WHATSAPP') for parent in self.parents],
+        )
+
+        self.assertEqual(dispatch_notifications(), {'SENT': 4, 'PENDING': 0, 'DEAD': 0})
+        # One SMS submission to both numbers, one WhatsApp message per parent
+        self.assertEqual(
+            sorted((message['channel'], len(message['numbers'])) for message in sent_messages),
+            [('SMS', 2), ('WHATSAPP', 1), ('WHATSAPP', 1)],
+        )
+        logs = SMSLog.objects.filter(attendance_id=attendance.id)
+        self.assertEqual(sorted(logs.values_list('channel', flat=True)), ['SMS', 'SMS', 'WHATSAPP', 'WHATSAPP'])
+        self.assertEqual(len({log.message_id for log in logs}), 3)
+
+    def test_stub_provider_simulates_fatal_errors(self):
+        from ..async_dispatch import dispatch_notifications_async
+        from ..circuit_breaker import CircuitOpen, before_request
+        from ..models import NotificationOutbox, SMSLog
+        from ..stub_provider import StubProviderServer
+
+        stub = StubProviderServer(latency_ms=5, error_code=105).start()
+        self.addCleanup(stub.stop)
+        attendance = self.create_attendance()
+        with self.settings(
+            SMS_BACKEND='attendance.channel_backends.MoraStubBackend',
+            WHATSAPP_BACKEND='attendance.channel_backends.WhatsAppStubBackend',
+            NOTIFICATION_STUB_URL=stub.url,
+        ):
+            # WhatsApp first: the stub answers it like the Cloud API
+            sms = NotificationOutbox.objects.filter(channel='SMS')
+            sms.update(next_attempt_at=timezone.now() + timedelta(hours=1))
+            self.assertEqual(dispatch_notifications_async(), {'SENT': 2, 'PENDING': 0, 'DEAD': 0})
+
+            # Insufficient balance: the stub's SMS breaker opens and the notifications are parked
+            stub.error_rate = 1
+            sms.update(next_attempt_at=timezone.now())
+            self.assertEqual(dispatch_notifications_async(), {'SENT': 0, 'PENDING': 2, 'DEAD': 0})
+
+        self.assertEqual(stub.stats()['requests'], 3)
+        whatsapp_ids = SMSLog.objects.filter(attendance_id=attendance.id, channel='WHATSAPP').values_list('message_id', flat=True)
+        self.assertTrue(all(message_id.startswith('wamid.STUB') for message_id in whatsapp_ids))
+        parked = NotificationOutbox.objects.filter(channel='SMS')
+        self.assertEqual({(row.status, row.attempts) for row in parked}, {('PENDING', 0)})
+        self.assertIn('Insufficient balance', parked[0].last_error)
+        # The real provider's breaker is untouched
+        before_request('SMS')
+        with self.assertRaises(CircuitOpen):
+            before_request('SMS_STUB')
+
+    def test_mora_client_errors_are_final(self):
+        import requests
+        from ..channel_backends import MoraBackend
+
+        for status_code, retriable in ((401, False), (400, False), (429, True), (503, True)):
+            response = requests.Response()
+            response.status_code = status_code
+            response._content = b'{"status": {"message": "Rejected"}}'
+            result = MoraBackend().parse_response(response, ['0530000001'])
+            self.assertEqual((result['success'], result['retriable']), (False, retriable), status_code)
+
+    def test_benchmark_rolls_back(self):
+        from core.models import Student
+        from ..models import NotificationOutbox
+
+        out = StringIO()
+        call_command('benchmark_notifications', attendances=3, mode='sync', stdout=out)
+        output = out.getvalue()
+        self.assertIn('12 sent, 0 to retry, 0 dead-lettered', output)
+        self.assertIn('In-memory backends: 9 send(s)', output)
+        self.assertFalse(Student.objects.filter(student_id__startswith='BENCH-').exists())
+        self.assertFalse(NotificationOutbox.objects.exists())
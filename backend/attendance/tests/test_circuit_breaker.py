@@ -0,0 +1,64 @@
+"""
+Provider circuit breaker: tripping on error rate and latency, half-open probing
+
+Run with: python manage.py test attendance
+"""
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+
+@override_settings(
+    CIRCUIT_BREAKER_MIN_REQUESTS=4, CIRCUIT_BREAKER_FAILURE_RATIO=0.5, CIRCUIT_BREAKER_OPEN_SECONDS=0.2,
+    CIRCUIT_BREAKER_PROBE_SECONDS=5, CIRCUIT_BREAKER_SLOW_CALL_SECONDS=2,
+)
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        from ..circuit_breaker import reset
+
+        # Redis unavailable: the per-process breaker applies the same rules
+        patcher = mock.patch(
+            'attendance.circuit_breaker.get_redis_client', side_effect=ConnectionError('Redis disabled in tests')
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        reset()
+        self.addCleanup(reset)
+
+    def test_error_rate_opens_then_probe_closes(self):
+        from ..circuit_breaker import CircuitOpen, before_request, record_request
+
+        for status_code in (200, 200, 503):
+            before_request('SMS')
+            record_request('SMS', status_code, 0.1)
+        # Slow calls count as failures: 2 of 4
+        before_request('SMS')
+        record_request('SMS', 200, 3)
+        with self.assertRaises(CircuitOpen) as raised:
+            before_request('SMS')
+        self.assertLessEqual(raised.exception.retry_after, 0.2)
+        # Other providers are unaffected
+        before_request('WHATSAPP')
+
+        time.sleep(0.25)
+        # One probe goes through; the rest wait for its outcome
+        before_request('SMS')
+        with self.assertRaises(CircuitOpen):
+            before_request('SMS')
+        record_request('SMS', 200, 0.1)
+        before_request('SMS')
+        before_request('SMS')
+
+    def test_failed_probe_opens_again(self):
+        from ..circuit_breaker import CircuitOpen, before_request, record_request, trip
+
+        with override_settings(CIRCUIT_BREAKER_FATAL_OPEN_SECONDS=0.2):
+            trip('SMS', 'Insufficient balance')
+        with self.assertRaisesMessage(CircuitOpen, 'Insufficient balance'):
+            before_request('SMS')
+        time.sleep(0.25)
+        before_request('SMS')
+        record_request('SMS', None, 0.1)
+        with self.assertRaises(CircuitOpen):
+            before_request('SMS')
@@ -0,0 +1,67 @@
+"""
+Compiled SMS templates: validation at save time and batch rendering
+
+Run with: python manage.py test attendance
+"""
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytz
+from django.core.exceptions import ValidationError
+from django.test import TestCase, override_settings
+
+
+@override_settings(TIME_ZONE='Asia/Riyadh')
+class MessageTemplateTests(TestCase):
+    def test_unknown_placeholders_are_rejected(self):
+        from ..message_templates import validate_template
+        from ..models import AttendanceSettings
+        from ..serializers import AttendanceSettingsSerializer
+
+        validate_template('{{literal}} {parent_name}: {student_name} at {time_attended}')
+        for template in ('Hello {name}', 'Hello {parent_name!r}', 'Hello {}', 'Hello {parent_name'):
+            with self.assertRaises(ValidationError):
+                validate_template(template)
+
+        attendance_settings = AttendanceSettings.get_settings()
+        serializer = AttendanceSettingsSerializer(attendance_settings, data={'sms_template': 'Hi {student}'}, partial=True)
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('sms_template', serializer.errors)
+        attendance_settings.sms_template = 'Hi {student}'
+        with self.assertRaises(ValidationError):
+            attendance_settings.clean()
+
+    def test_batch_is_rendered_with_one_settings_lookup(self):
+        from ..message_templates import render_messages
+        from ..models import AttendanceSettings
+
+        attendance_settings = AttendanceSettings.get_settings()
+        attendance_settings.sms_template = 'Dear {parent_name}, {student_name} arrived at {time_attended}'
+        attendance_settings.save(update_fields=['sms_template'])
+        student = SimpleNamespace(full_name='Sara Ali')
+        attendances = [
+            SimpleNamespace(id=index, student=student, timestamp=datetime(2026, 1, 18, 4, index, tzinfo=pytz.UTC))
+            for index in (1, 2)
+        ]
+        parents = [SimpleNamespace(first_name='Huda'), SimpleNamespace(first_name='')]
+        with self.assertNumQueries(1):
+            messages = render_messages([(attendance, parent) for attendance in attendances for parent in parents])
+        self.assertEqual(messages, [
+            'Dear Huda, Sara Ali arrived at 07:01 AM',
+            'Dear Parent, Sara Ali arrived at 07:01 AM',
+            'Dear Huda, Sara Ali arrived at 07:02 AM',
+            'Dear Parent, Sara Ali arrived at 07:02 AM',
+        ])
+
+    def test_invalid_stored_template_falls_back_to_default(self):
+        from ..message_templates import get_compiled_template
+        from ..models import AttendanceSettings
+
+        attendance_settings = AttendanceSettings(sms_template='Hi {student}')
+        default = AttendanceSettings._meta.get_field('sms_template').default
+        with self.assertLogs('attendance.message_templates', 'ERROR'):
+            template = get_compiled_template(attendance_settings)
+        self.assertEqual(template.placeholders, {'parent_name', 'student_name', 'time_attended'})
+        self.assertTrue(template.render({
+            'parent_name': 'Huda', 'student_name': 'Sara', 'time_attended': '07:00 AM'
+        }).startswith(default.split('{')[0]))
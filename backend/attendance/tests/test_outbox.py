@@ -0,0 +1,223 @@
+"""
+Notification outbox: queueing with the attendance record, claiming, retries
+and dead-lettering
+
+Run with: python manage.py test attendance
+"""
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .utils import RedisDisabledMixin, create_family
+
+
+@override_settings(
+    SMS_ENABLED=True, WHATSAPP_ENABLED=False, NOTIFICATION_OUTBOX_MAX_ATTEMPTS=3, SMS_BATCH_WINDOW_SECONDS=0,
+    SMS_API_KEY='key', SMS_USERNAME='user', SMS_SENDER_NAME='School',
+)
+class NotificationOutboxTests(RedisDisabledMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student, cls.parents = create_family('Outbox', 'OB-0001', 2, '0500000')
+
+    def create_attendance(self):
+        from ..models import Attendance
+        from ..outbox import enqueue_notifications
+
+        attendance = Attendance.create_attendance(self.student, 'CHECK_OUT', timezone.now())
+        self.assertEqual(enqueue_notifications(attendance, dispatch=False), len(self.parents))
+        return attendance
+
+    def outbox(self):
+        from ..models import NotificationOutbox
+        return NotificationOutbox.objects.order_by('id')
+
+    def send_sms(self, result):
+        return mock.patch('attendance.channel_backends.MoraBackend.send', return_value=result)
+
+    def test_enqueue_is_idempotent(self):
+        from ..outbox import enqueue_notifications
+
+        attendance = self.create_attendance()
+        enqueue_notifications(attendance, dispatch=False)
+        self.assertEqual(self.outbox().count(), len(self.parents))
+        self.assertEqual({row.status for row in self.outbox()}, {'PENDING'})
+
+    def test_repeated_punches_are_suppressed_within_the_window(self):
+        from ..models import Attendance, AttendanceSettings
+        from ..outbox import enqueue_notifications
+
+        # Check-ins read the attendance windows from the stored settings
+        AttendanceSettings.get_settings()
+        attendance = self.create_attendance()
+        punches = [
+            ('CHECK_OUT', attendance.timestamp + timedelta(minutes=3), 0),
+            ('CHECK_IN', attendance.timestamp + timedelta(minutes=3), len(self.parents)),
+            ('CHECK_OUT', attendance.timestamp + timedelta(minutes=30), len(self.parents)),
+        ]
+        for attendance_type, timestamp, queued in punches:
+            repeat = Attendance.create_attendance(self.student, attendance_type, timestamp)
+            self.assertEqual(enqueue_notifications(repeat, dispatch=False), queued)
+        with self.settings(NOTIFICATION_SUPPRESSION_WINDOW_SECONDS=0):
+            repeat = Attendance.create_attendance(self.student, 'CHECK_OUT', attendance.timestamp + timedelta(minutes=1))
+            self.assertEqual(enqueue_notifications(repeat, dispatch=False), len(self.parents))
+
+    def test_dispatch_sends_and_logs(self):
+        from ..models import SMSLog
+        from ..outbox import dispatch_notifications
+
+        attendance = self.create_attendance()
+        with self.send_sms({'success': True, 'message': 'Checked out', 'message_id': '42'}) as send:
+            results = dispatch_notifications()
+        self.assertEqual(send.call_count, len(self.parents))
+        self.assertEqual(results, {'SENT': 2, 'PENDING': 0, 'DEAD': 0})
+        self.assertEqual({row.status for row in self.outbox()}, {'SENT'})
+        logs = SMSLog.objects.filter(attendance_id=attendance.id)
+        self.assertEqual({(log.status, log.message_id) for log in logs}, {('SENT', '42')})
+        self.assertEqual(logs.count(), len(self.parents))
+
+    @override_settings(SMS_BATCH_WINDOW_SECONDS=2)
+    def test_identical_texts_share_one_submission(self):
+        from ..models import AttendanceSettings, SMSLog
+        from ..outbox import claim_notifications, deliver_notifications, dispatch_notifications
+
+        attendance_settings = AttendanceSettings.get_settings()
+        attendance_settings.sms_template = '{student_name} checked in at {time_attended}'
+        attendance_settings.save(update_fields=['sms_template'])
+        attendance = self.create_attendance()
+        # Not due before the batch window has passed
+        self.assertEqual(claim_notifications(), [])
+
+        batch = claim_notifications(now=timezone.now() + timedelta(seconds=3))
+        with self.send_sms({'success': True, 'message_id': '7'}) as send:
+            deliver_notifications(batch)
+        send.assert_called_once()
+        numbers, _ = send.call_args.args
+        self.assertEqual(sorted(numbers), sorted(parent.phone_number for parent in self.parents))
+        # The submission's ref_id is fanned out to every parent's log
+        logs = SMSLog.objects.filter(attendance_id=attendance.id)
+        self.assertEqual(sorted(log.parent_id for log in logs if log.message_id == '7'), sorted(p.id for p in self.parents))
+        self.assertEqual(dispatch_notifications(), {'SENT': 0, 'PENDING': 0, 'DEAD': 0})
+
+    def test_claimed_rows_are_not_claimed_again_until_lease_expires(self):
+        from ..outbox import claim_notifications
+
+        self.create_attendance()
+        self.assertEqual(len(claim_notifications()), len(self.parents))
+        self.assertEqual(claim_notifications(), [])
+        expired = timezone.now() + timedelta(hours=1)
+        reclaimed = claim_notifications(now=expired)
+        self.assertEqual({row.attempts for row in reclaimed}, {2})
+
+    @override_settings(NOTIFICATION_OUTBOX_LEASE_SECONDS=10)
+    def test_sends_that_could_outlast_the_lease_are_released(self):
+        from ..channel_backends import MoraBackend
+        from ..outbox import claim_notifications, deliver_notifications
+        from ..provider_http import max_request_seconds
+
+        self.create_attendance()
+        batch = claim_notifications()
+        # The lease covers the slowest provider request, whatever is configured
+        lease = min(row.next_attempt_at for row in batch) - timezone.now()
+        self.assertGreater(lease.total_seconds(), 2 * max_request_seconds('SMS') - 5)
+
+        # Time is left for the first parent's message only
+        max_send_seconds = mock.PropertyMock(side_effect=[0, lease.total_seconds()])
+        with mock.patch.object(MoraBackend, 'max_send_seconds', new_callable=lambda: max_send_seconds), \
+                self.send_sms({'success': True, 'message_id': '42'}) as send:
+            self.assertEqual(deliver_notifications(batch), ['SENT', 'PENDING'])
+        send.assert_called_once()
+        released = self.outbox().last()
+        self.assertEqual((released.status, released.attempts), ('PENDING', 0))
+        self.assertEqual([row.id for row in claim_notifications()], [released.id])
+
+    def test_retriable_failures_back_off_then_dead_letter(self):
+        from ..models import SMSLog
+        from ..outbox import claim_notifications, deliver_notification
+
+        attendance = self.create_attendance()
+        failure = {'success': False, 'error': 'SMS API error: timeout', 'retriable': True}
+        now = timezone.now()
+        with self.send_sms(failure):
+            for attempt in range(1, 4):
+                batch = claim_notifications(now=now)
+                self.assertEqual(len(batch), len(self.parents))
+                statuses = {deliver_notification(row) for row in batch}
+                row = self.outbox().first()
+                self.assertEqual(row.attempts, attempt)
+                if attempt < 3:
+                    self.assertEqual(statuses, {'PENDING'})
+                    # Not due again before its backoff
+                    self.assertGreater(row.next_attempt_at, timezone.now())
+                    self.assertEqual(claim_notifications(), [])
+                    now = row.next_attempt_at + timedelta(hours=2)
+        self.assertEqual(statuses, {'DEAD'})
+        self.assertEqual(row.last_error, failure['error'])
+        # Retries are not logged; the final failure is
+        self.assertEqual(SMSLog.objects.filter(attendance_id=attendance.id, status='FAILED').count(), len(self.parents))
+
+    def test_rate_limited_notifications_are_rescheduled(self):
+        from ..outbox import dispatch_notifications
+        from ..rate_limit import RateLimited
+
+        self.create_attendance()
+        with mock.patch('attendance.provider_http.rate_limit.acquire', side_effect=RateLimited('SMS', 30)), \
+                mock.patch('attendance.provider_http.get_session') as get_session:
+            results = dispatch_notifications()
+        get_session.assert_not_called()
+        self.assertEqual(results['PENDING'], len(self.parents))
+        for row in self.outbox():
+            # Due when the limit has capacity again, without using up an attempt
+            self.assertEqual(row.attempts, 0)
+            self.assertGreater(row.next_attempt_at, timezone.now() + timedelta(seconds=25))
+
+    @override_settings(SMS_RATE_LIMIT_PER_SECOND=0)
+    def test_fatal_provider_error_parks_notifications(self):
+        from ..outbox import dispatch_notifications
+
+        self.create_attendance()
+        response = mock.Mock(status_code=200, headers={}, text='', raw=mock.Mock(retries=None))
+        response.json.return_value = {'data': {'code': 105, 'message': 'Insufficient balance'}}
+        with mock.patch('attendance.provider_http.get_session') as get_session:
+            get_session.return_value.post.return_value = response
+            results = dispatch_notifications()
+            self.assertEqual(results['PENDING'], len(self.parents))
+            # The circuit breaker is open: later dispatches make no request at all
+            dispatch_notifications()
+            self.assertEqual(dispatch_notifications(), {'SENT': 0, 'PENDING': 0, 'DEAD': 0})
+        get_session.return_value.post.assert_called_once()
+        for row in self.outbox():
+            self.assertEqual(row.attempts, 0)
+            self.assertGreater(row.next_attempt_at, timezone.now() + timedelta(minutes=5))
+
+    def test_unexpected_send_errors_are_retried(self):
+        from ..outbox import dispatch_notifications
+
+        self.create_attendance()
+        with mock.patch('attendance.provider_http.post', side_effect=ValueError('Unexpected')), \
+                self.assertLogs('attendance.channel_backends', 'ERROR'):
+            results = dispatch_notifications()
+        self.assertEqual(results['PENDING'], len(self.parents))
+        self.assertEqual({(row.status, row.attempts, row.last_error) for row in self.outbox()}, {('PENDING', 1, 'Unexpected')})
+
+    def test_permanent_failure_is_dead_lettered_and_requeued(self):
+        from ..outbox import dispatch_notifications, requeue_dead_notifications
+
+        self.create_attendance()
+        with self.send_sms({'success': False, 'error': 'No valid numbers for sending', 'retriable': False}):
+            results = dispatch_notifications()
+        self.assertEqual(results['DEAD'], len(self.parents))
+        self.assertEqual(requeue_dead_notifications(), len(self.parents))
+        self.assertEqual({(row.status, row.attempts) for row in self.outbox()}, {('PENDING', 0)})
+
+    def test_deleted_attendance_is_dead_lettered(self):
+        from ..models import Attendance
+        from ..outbox import dispatch_notifications
+
+        attendance = self.create_attendance()
+        # Bypass the cascade, as archiving does
+        Attendance.objects.filter(id=attendance.id)._raw_delete(Attendance.objects.db)
+        results = dispatch_notifications()
+        self.assertEqual(results['DEAD'], len(self.parents))
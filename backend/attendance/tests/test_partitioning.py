@@ -0,0 +1,114 @@
+"""
+Monthly partitions: rows beyond the created months, creating their partition later
+and detaching partitions next to the default partition
+
+Run with: python manage.py test attendance
+"""
+from datetime import date, datetime, timezone as dt_timezone
+from unittest import mock, skipUnless
+
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import TestCase
+
+FAR_FUTURE = datetime(2099, 5, 10, 6, 0, tzinfo=dt_timezone.utc)
+COMMITTED_PARTITION = 'attendance_attendance_p2098_01'
+
+
+@skipUnless(connection.vendor == 'postgresql', 'partitioning needs PostgreSQL')
+class PartitioningTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Created outside the test transaction, which would otherwise already hold
+        # the parent's ACCESS EXCLUSIVE lock from CREATE TABLE ... PARTITION OF
+        cls.run_committed(
+            f"CREATE TABLE {COMMITTED_PARTITION} PARTITION OF attendance_attendance "
+            f"FOR VALUES FROM ('2098-01-01 00:00+00') TO ('2098-02-01 00:00+00')"
+        )
+        cls.addClassCleanup(cls.run_committed, f'DROP TABLE {COMMITTED_PARTITION}')
+        super().setUpClass()
+
+    def partition_of(self, attendance_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT tableoid::regclass::text FROM attendance_attendance WHERE id = %s', [attendance_id]
+            )
+            return cursor.fetchone()[0]
+
+    def test_rows_beyond_the_created_months_move_into_their_partition(self):
+        from core.models import Branch, Student
+        from ..models import Attendance
+        from ..partitioning import create_month_partition, ensure_future_partitions
+
+        student = Student.objects.create(
+            first_name='Future', last_name='Student', student_id='FU-0001', grade='PRIMARY', level=1,
+            gender='M', date_of_birth=date(2015, 1, 1), branch=Branch.objects.get(id=1),
+        )
+        attendance = Attendance.objects.create(student=student, attendance_type='CHECK_IN', timestamp=FAR_FUTURE)
+        self.assertEqual(self.partition_of(attendance.id), 'attendance_attendance_p_default')
+        with self.assertLogs('attendance.partitioning', 'WARNING'):
+            ensure_future_partitions(months_ahead=0)
+
+        self.assertEqual(create_month_partition('attendance_attendance', 2099, 5), 'attendance_attendance_p2099_05')
+        self.assertEqual(self.partition_of(attendance.id), 'attendance_attendance_p2099_05')
+        self.assertEqual(Attendance.objects.get(id=attendance.id).student_id, student.id)
+        # The moved partition carries the parent's primary key
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Attendance.objects.create(
+                id=attendance.id, student=student, attendance_type='CHECK_IN', timestamp=FAR_FUTURE
+            )
+
+    def table_locks(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT mode FROM pg_locks WHERE pid = pg_backend_pid() AND relation = %s::regclass', [table]
+            )
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_detach_takes_the_parent_lock_under_a_timeout(self):
+        from ..partitioning import detach_partition
+
+        self.assertEqual(self.table_locks('attendance_attendance'), set())
+        detach_partition('attendance_attendance', COMMITTED_PARTITION)
+
+        # Plain DETACH (the default partition rules out CONCURRENTLY), held until commit
+        self.assertIn('AccessExclusiveLock', self.table_locks('attendance_attendance'))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT current_setting('lock_timeout'), relispartition FROM pg_class WHERE relname = %s",
+                [COMMITTED_PARTITION],
+            )
+            self.assertEqual(cursor.fetchone(), ('2s', False))
+
+    def test_detach_gives_up_on_a_busy_parent(self):
+        from ..partitioning import detach_partition
+
+        # A long report query in another session
+        other = self.other_connection()
+        self.addCleanup(other.close)
+        other.cursor().execute('LOCK TABLE ONLY attendance_attendance IN ACCESS SHARE MODE')
+
+        with mock.patch.multiple(
+            'attendance.partitioning', DETACH_LOCK_TIMEOUT_MS=50, DETACH_ATTEMPTS=2, DETACH_RETRY_DELAY=0,
+        ), self.assertLogs('attendance.partitioning', 'WARNING') as logs, self.assertRaises(OperationalError):
+            detach_partition('attendance_attendance', COMMITTED_PARTITION)
+        self.assertEqual(len(logs.records), 1)
+
+        other.rollback()
+        detach_partition('attendance_attendance', COMMITTED_PARTITION)
+
+    @staticmethod
+    def other_connection():
+        import psycopg2
+
+        settings = connection.settings_dict
+        return psycopg2.connect(
+            dbname=settings['NAME'], user=settings['USER'], password=settings['PASSWORD'],
+            host=settings['HOST'], port=settings['PORT'],
+        )
+
+    @classmethod
+    def run_committed(cls, sql):
+        other = cls.other_connection()
+        other.autocommit = True
+        other.cursor().execute(sql)
+        other.close()
@@ -0,0 +1,80 @@
+"""
+Pooled provider HTTP sessions against a local stub provider
+
+Run with: python manage.py test attendance
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+
+class StubProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with server.lock:
+            server.connections.add(self.client_address)
+            status = server.statuses.pop(0) if server.statuses else 200
+        body = b'{"data": {"code": 100}}'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 503:
+            self.send_header('Retry-After', '0')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(SMS_HTTP_RETRIES=2, SMS_RATE_LIMIT_PER_SECOND=0)
+class ProviderHTTPTests(SimpleTestCase):
+    def setUp(self):
+        from .. import circuit_breaker, provider_http
+
+        patcher = mock.patch(
+            'attendance.circuit_breaker.get_redis_client', side_effect=ConnectionError('Redis disabled in tests')
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        circuit_breaker.reset()
+        self.addCleanup(circuit_breaker.reset)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubProviderHandler)
+        self.server.lock = threading.Lock()
+        self.server.connections = set()
+        self.server.statuses = []
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/sendsms'
+        provider_http.close_sessions()
+        provider_http.provider_metrics(reset=True)
+        self.addCleanup(provider_http.close_sessions)
+
+    def test_connections_are_reused(self):
+        from ..provider_http import post, provider_metrics
+
+        for _ in range(20):
+            self.assertEqual(post('SMS', self.url, data={'message': 'hello'}).status_code, 200)
+        # One handshake for twenty messages
+        self.assertEqual(len(self.server.connections), 1)
+        metrics = provider_metrics()['SMS']
+        self.assertEqual((metrics['requests'], metrics['errors'], metrics['statuses']), (20, 0, {'2xx': 20}))
+
+    def test_unavailable_provider_is_retried(self):
+        from ..provider_http import post, provider_metrics
+
+        self.server.statuses = [503, 503]
+        self.assertEqual(post('SMS', self.url, data={'message': 'hello'}).status_code, 200)
+        self.assertEqual(provider_metrics()['SMS']['retries'], 2)
+
+        # Out of retries: the last response is returned to the caller
+        self.server.statuses = [503, 503, 503]
+        self.assertEqual(post('SMS', self.url, data={'message': 'hello'}).status_code, 503)
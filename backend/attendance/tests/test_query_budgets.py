@@ -0,0 +1,259 @@
+"""
+Query budgets and index usage of the API endpoints
+
+Every endpoint gets an upper bound on the number of SQL statements it may issue
+against a realistic dataset, and the statements touching attendance and SMS
+logs must be servable from an index. Budgets are independent of the number of
+students, days and records, so an N+1 shows up as a failure here.
+
+Run with: python manage.py test attendance
+"""
+import io
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from openpyxl import Workbook
+from rest_framework.test import APIClient
+
+from ..utils import get_local_date
+from .utils import QueryBudgetMixin, seed_dataset
+
+
+class APITestCase(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = seed_dataset()
+        cls.user = User.objects.create_user('budget', password='budget')
+
+    def setUp(self):
+        # Live counters need Redis; exercise the database fallback deterministically
+        patcher = mock.patch(
+            'attendance.counters.get_redis_client', side_effect=ConnectionError('Redis disabled in tests')
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @property
+    def date_range(self):
+        days = self.dataset['school_days']
+        return days[0].isoformat(), days[-1].isoformat()
+
+    def get(self, url, budget, **params):
+        with self.assertQueryBudget(budget):
+            response = self.client.get(url, params)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200, getattr(response, 'data', None))
+        return response
+
+
+class AttendanceEndpointBudgetTests(APITestCase):
+    def test_attendance_report(self):
+        date_from, date_to = self.date_range
+        response = self.get(
+            '/api/attendance/records/attendance_report/', 6, date_from=date_from, date_to=date_to
+        )
+        self.assertEqual(response.data['summary']['total_students'], len(self.dataset['students']))
+
+    def test_attendance_report_for_branch(self):
+        date_from, date_to = self.date_range
+        self.get(
+            '/api/attendance/records/attendance_report/', 6,
+            date_from=date_from, date_to=date_to, branch_id=2, grade='PRIMARY',
+        )
+
+    def test_attendance_report_export(self):
+        date_from, date_to = self.date_range
+        self.get(
+            '/api/attendance/records/attendance_report_export/', 6,
+            date_from=date_from, date_to=date_to, file_format='csv',
+        )
+
+    def test_attendance_register(self):
+        date_from, date_to = self.date_range
+        response = self.get(
+            '/api/attendance/records/attendance_register/', 6, date_from=date_from, date_to=date_to
+        )
+        self.assertEqual(len(response.data['students']), len(self.dataset['students']))
+
+    def test_today_summary(self):
+        response = self.get('/api/attendance/records/today_summary/', 4)
+        self.assertEqual(response.data['date'], get_local_date().isoformat())
+
+    def test_today_summary_for_branch(self):
+        self.get('/api/attendance/records/today_summary/', 5, branch_id=1)
+
+    def test_attendance_overview(self):
+        # Two queries per day of the week
+        self.get('/api/attendance/records/attendance_overview/', 20, period='week')
+
+    def test_absences(self):
+        from ..absences import materialize_absence_range
+
+        days = self.dataset['school_days']
+        materialize_absence_range(days[0], days[-1])
+        date_from, date_to = self.date_range
+        response = self.get('/api/attendance/records/absences/', 4, date_from=date_from, date_to=date_to)
+        # Every tenth student is absent every day
+        self.assertEqual(response.data['count'], len(self.dataset['students']) // 10 * len(days))
+        self.assertEqual(response.data['pending_dates'], [])
+
+    def test_attendance_overview_with_recorded_absences(self):
+        from ..absences import materialize_absences
+
+        day = self.dataset['school_days'][-1]
+        materialize_absences(day)
+        response = self.get(
+            '/api/attendance/records/attendance_overview/', 20, date_from=day.isoformat(), date_to=day.isoformat()
+        )
+        self.assertEqual(response.data['daily_data'][0]['absent'], len(self.dataset['students']) // 10)
+
+    def test_student_attendance(self):
+        student = self.dataset['students'][1]
+        response = self.get('/api/attendance/records/student_attendance/', 4, student_id=student.id, view='compact')
+        self.assertEqual(response.data['count'], 2 * len(self.dataset['school_days']))
+
+    def test_student_statistics(self):
+        from ..absences import materialize_absence_range
+        from ..student_stats import rebuild_student_stats
+
+        days = self.dataset['school_days']
+        materialize_absence_range(days[0], days[-1])
+        counted = {row.student_id: row for row in self._stats()}
+        rebuild_student_stats(today=days[-1])
+        # Incremental counting by the end-of-day job matches a full rebuild
+        for row in self._stats():
+            self.assertEqual(self._counters(row), self._counters(counted[row.student_id]))
+
+        absent_student = self.dataset['students'][0]
+        response = self.get('/api/attendance/records/student_statistics/', 3, student_id=absent_student.id)
+        self.assertEqual(response.data['days_absent'], len(days))
+        self.assertEqual(response.data['current_streak'], len(days))
+        response = self.get('/api/attendance/records/at_risk/', 4, branch_id=1)
+        self.assertEqual(response.data['count'], len(self.dataset['students']) // 20)
+
+    def _stats(self):
+        from ..models import StudentAttendanceStats
+        return StudentAttendanceStats.objects.all()
+
+    @staticmethod
+    def _counters(row):
+        return (row.days_present, row.days_late, row.days_absent, row.current_streak, row.streak_status, row.last_counted_date)
+
+    def test_attendance_list_compact(self):
+        date_from, date_to = self.date_range
+        self.get('/api/attendance/records/', 4, view='compact', date_from=date_from, date_to=date_to)
+
+    # The test tables fall under the exact-count threshold; count from estimates as production does
+    @mock.patch('attendance.pagination.EXACT_COUNT_THRESHOLD', 0)
+    def test_attendance_list_keyset(self):
+        response = self.get('/api/attendance/records/', 4, view='compact', pagination='keyset')
+        self.get(response.data['next'], 4)
+
+    @mock.patch('attendance.pagination.EXACT_COUNT_THRESHOLD', 0)
+    def test_sms_log_list_keyset(self):
+        self.get('/api/attendance/sms-logs/', 4, view='compact', pagination='keyset')
+
+    def test_sms_log_list_by_date(self):
+        date_from, date_to = self.date_range
+        self.get('/api/attendance/sms-logs/', 4, view='compact', date_from=date_from, date_to=date_to)
+
+    def test_attendance_search(self):
+        date_from, date_to = self.date_range
+        response = self.get(
+            '/api/attendance/records/', 4,
+            view='compact', search='student39 b2', date_from=date_from, date_to=date_to,
+        )
+        self.assertEqual({row['student_name'] for row in response.data['results']}, {'Student39 B2'})
+
+    def test_sms_log_search_by_parent(self):
+        date_from, date_to = self.date_range
+        response = self.get(
+            '/api/attendance/sms-logs/', 4,
+            view='compact', search='parent151', date_from=date_from, date_to=date_to,
+        )
+        # Logs of the parent, and of the children they are linked to
+        self.assertIn('Parent151 P', {row['parent_name'] for row in response.data['results']})
+
+    def test_sms_log_search_by_phone_number(self):
+        from ..models import SMSLog
+
+        # A number the parent has since changed: only the log still has it
+        log = SMSLog.objects.order_by('-id').first()
+        SMSLog.objects.filter(id=log.id).update(phone_number='0599999999')
+        date_from, date_to = self.date_range
+        response = self.get(
+            '/api/attendance/sms-logs/', 4,
+            view='compact', search='+966 599999999', date_from=date_from, date_to=date_to,
+        )
+        self.assertEqual([row['id'] for row in response.data['results']], [log.id])
+
+    def test_sms_log_export(self):
+        date_from, date_to = self.date_range
+        self.get('/api/attendance/sms-logs/export/', 4, date_from=date_from, date_to=date_to)
+
+
+class CoreEndpointBudgetTests(APITestCase):
+    def test_parents_all(self):
+        response = self.get('/api/core/parents/all/', 4)
+        self.assertEqual(len(response.data), len(self.dataset['parents']))
+
+    def test_parent_list(self):
+        self.get('/api/core/parents/', 5)
+
+    def test_student_search(self):
+        from core.models import Student
+
+        student = Student.objects.get(id=self.dataset['students'][0].id)
+        student.first_name = 'أحمد'
+        # Documents of changed rows are refreshed when the transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            student.save()
+        # One result: the nested serializer reads its branch and each parent's students
+        response = self.get('/api/core/students/', 6, search='إحمَد')
+        self.assertEqual([row['id'] for row in response.data['results']], [self.dataset['students'][0].id])
+
+    def test_parent_search_by_phone(self):
+        parent = self.dataset['parents'][5]
+        response = self.get('/api/core/parents/', 5, search=f'+966{parent.phone_number[1:]}')
+        self.assertEqual([row['id'] for row in response.data['results']], [parent.id])
+
+    def upload(self, url, headers, rows):
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(headers)
+        for row in rows:
+            sheet.append(row)
+        output = io.BytesIO()
+        workbook.save(output)
+        output.seek(0)
+        output.name = 'upload.xlsx'
+        return self.client.post(url, {'file': output}, format='multipart')
+
+    def test_student_bulk_upload(self):
+        headers = ['first_name', 'last_name', 'student_id', 'grade', 'gender', 'date_of_birth', 'branch']
+        rows = [
+            [f'New{index}', 'Student', f'N-{index:04d}', 'PRIMARY', 'M', '2015-01-01', 'Main Branch']
+            for index in range(20)
+        ]
+        # Budget grows with the number of rows but must stay per-row constant
+        with self.assertQueryBudget(10 + 8 * len(rows)):
+            response = self.upload('/api/core/students/bulk_upload/', headers, rows)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], len(rows))
+
+    def test_parent_bulk_upload(self):
+        students = self.dataset['students']
+        headers = ['first_name', 'last_name', 'email', 'student_id']
+        rows = [
+            [f'New{index}', 'Parent', f'new{index}@example.com', students[index].student_id]
+            for index in range(20)
+        ]
+        with self.assertQueryBudget(10 + 10 * len(rows)):
+            response = self.upload('/api/core/parents/bulk_upload/', headers, rows)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], len(rows))
+
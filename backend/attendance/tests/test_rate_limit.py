@@ -0,0 +1,58 @@
+"""
+Provider rate limits: bursts, waiting for capacity and giving up
+
+Redis is disabled here, so the per-process fallback bucket is exercised.
+
+Run with: python manage.py test attendance
+"""
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+
+def without_redis():
+    return mock.patch('attendance.rate_limit.get_redis_client', side_effect=ConnectionError('Redis disabled in tests'))
+
+
+@override_settings(SMS_RATE_LIMIT_PER_SECOND=1, SMS_RATE_LIMIT_BURST=2)
+class RateLimitTests(SimpleTestCase):
+    def setUp(self):
+        from .. import rate_limit
+
+        patcher = without_redis()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        rate_limit._local_buckets.clear()
+
+    def test_burst_then_wait(self):
+        from ..rate_limit import try_take
+
+        self.assertEqual(try_take('SMS'), 0)
+        self.assertEqual(try_take('SMS'), 0)
+        self.assertAlmostEqual(try_take('SMS'), 1, delta=0.1)
+
+    def test_acquire_waits_for_a_token(self):
+        from ..rate_limit import acquire
+
+        acquire('SMS')
+        acquire('SMS')
+        with mock.patch('attendance.rate_limit.time.sleep') as sleep, \
+                mock.patch('attendance.rate_limit.try_take', side_effect=[0.4, 0]):
+            acquire('SMS', max_wait=1)
+        sleep.assert_called_once_with(0.4)
+
+    def test_acquire_gives_up_after_max_wait(self):
+        from ..rate_limit import RateLimited, acquire
+
+        acquire('SMS')
+        acquire('SMS')
+        with self.assertRaises(RateLimited) as raised:
+            acquire('SMS', max_wait=0.1)
+        self.assertAlmostEqual(raised.exception.retry_after, 1, delta=0.1)
+
+    @override_settings(SMS_RATE_LIMIT_PER_SECOND=0)
+    def test_zero_rate_disables_the_limit(self):
+        from ..rate_limit import try_take
+
+        self.assertEqual({try_take('SMS') for _ in range(100)}, {0})
+
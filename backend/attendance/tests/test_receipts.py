@@ -0,0 +1,114 @@
+"""
+Delivery receipt webhooks and batched status updates
+
+Run with: python manage.py test attendance
+"""
+import hashlib
+import hmac
+import json
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .utils import RedisDisabledMixin, create_family
+
+
+@override_settings(SMS_WEBHOOK_TOKEN='sms-token', WHATSAPP_APP_SECRET='app-secret', WHATSAPP_WEBHOOK_VERIFY_TOKEN='verify')
+class DeliveryReceiptTests(RedisDisabledMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from ..models import Attendance, SMSLog
+
+        student, parents = create_family('Receipt', 'RC-0001', 3, '0520000')
+        with mock.patch('attendance.counters.get_redis_client', side_effect=ConnectionError('Redis disabled in tests')):
+            attendance = Attendance.create_attendance(student, 'CHECK_OUT', timezone.now())
+        # Two parents share one multi-number submission, the third got a WhatsApp message
+        cls.logs = SMSLog.objects.bulk_create([
+            SMSLog(
+                student=student, parent=parent, attendance=attendance, channel=channel, phone_number=parent.phone_number,
+                message='Checked out', status='SENT', message_id=message_id, sent_at=timezone.now(),
+            )
+            for parent, channel, message_id in zip(
+                parents, ['SMS', 'SMS', 'WHATSAPP'], ['77', '77', 'wamid.ABC']
+            )
+        ])
+
+    def statuses(self):
+        from ..models import SMSLog
+        return list(SMSLog.objects.filter(id__in=[log.id for log in self.logs]).order_by('id').values_list('status', flat=True))
+
+    def test_sms_receipts_require_the_token(self):
+        response = self.client.post(
+            '/api/attendance/webhooks/sms/?token=wrong', {'ref_id': '77', 'status': 'delivered'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.statuses(), ['SENT', 'SENT', 'SENT'])
+
+    def test_sms_receipts_update_the_named_recipient(self):
+        from ..models import SMSLog
+
+        reports = [
+            {'ref_id': '77', 'number': '0520000000', 'status': 'DELIVRD', 'timestamp': '2026-01-18T10:45:30Z'},
+            {'ref_id': '77', 'number': '0520000001', 'status': 'failed', 'error': 'Absent subscriber'},
+            {'ref_id': '77', 'number': '0520000000', 'status': 'failed'},
+        ]
+        response = self.client.post('/api/attendance/webhooks/sms/?token=sms-token', reports, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'queued': 3})
+        self.assertEqual(self.statuses(), ['DELIVERED', 'FAILED', 'SENT'])
+        delivered = SMSLog.objects.get(id=self.logs[0].id)
+        self.assertEqual(delivered.delivered_at.isoformat(), '2026-01-18T10:45:30+00:00')
+        self.assertEqual(SMSLog.objects.get(id=self.logs[1].id).error_message, 'Absent subscriber')
+
+        # A late failure report does not undo a delivery
+        self.client.post('/api/attendance/webhooks/sms/?token=sms-token', reports[2], content_type='application/json')
+        self.assertEqual(self.statuses()[0], 'DELIVERED')
+
+    def test_whatsapp_callbacks_are_signed(self):
+        payload = json.dumps({'entry': [{'changes': [{'value': {'statuses': [
+            {'id': 'wamid.ABC', 'status': 'sent', 'timestamp': '1768733000'},
+            {'id': 'wamid.ABC', 'status': 'read', 'timestamp': '1768733130'},
+            {'id': 'wamid.ABC', 'status': 'delivered', 'timestamp': '1768733100'},
+        ]}}]}]}).encode()
+        url = '/api/attendance/webhooks/whatsapp/'
+        response = self.client.post(url, payload, content_type='application/json', HTTP_X_HUB_SIGNATURE_256='sha256=bad')
+        self.assertEqual(response.status_code, 403)
+
+        signature = 'sha256=' + hmac.new(b'app-secret', payload, hashlib.sha256).hexdigest()
+        response = self.client.post(url, payload, content_type='application/json', HTTP_X_HUB_SIGNATURE_256=signature)
+        self.assertEqual(response.json(), {'queued': 2})
+        self.assertEqual(self.statuses(), ['SENT', 'SENT', 'DELIVERED'])
+        from ..models import SMSLog
+        self.assertEqual(SMSLog.objects.get(id=self.logs[2].id).delivered_at.timestamp(), 1768733100)
+
+        response = self.client.get(url, {'hub.mode': 'subscribe', 'hub.verify_token': 'verify', 'hub.challenge': '42'})
+        self.assertEqual(response.content, b'42')
+
+    def test_sms_log_listings_default_to_sms(self):
+        from django.contrib.auth.models import User
+        from rest_framework.test import APIClient
+        from ..models import SMSLog
+
+        SMSLog.objects.filter(id=self.logs[0].id).update(status='DELIVERED')
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('receipts', password='receipts'))
+        url = '/api/attendance/sms-logs/'
+
+        self.assertEqual(client.get(url).data['count'], 2)
+        self.assertEqual(client.get(url, {'channel': 'WHATSAPP'}).data['count'], 1)
+        self.assertEqual(client.get(url, {'status__in': 'SENT,DELIVERED'}).data['count'], 2)
+        statistics = client.get(f'{url}statistics/').data
+        self.assertEqual((statistics['total'], statistics['sent'], statistics['delivered']), (2, 2, 1))
+        # Single logs are reachable whatever their channel
+        self.assertEqual(client.get(f'{url}{self.logs[2].id}/').status_code, 200)
+
+    def test_a_batch_is_applied_in_one_statement(self):
+        from ..receipts import apply_receipts, parse_sms_receipts
+
+        receipts = parse_sms_receipts({'data': [
+            {'ref_id': '77', 'status': 'delivered'} for _ in range(50)
+        ]})
+        with self.assertNumQueries(1):
+            self.assertEqual(apply_receipts(receipts), 2)
+        self.assertEqual(self.statuses(), ['DELIVERED', 'DELIVERED', 'SENT'])
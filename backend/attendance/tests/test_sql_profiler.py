@@ -0,0 +1,41 @@
+"""
+SQL profiling middleware: who sees the Server-Timing header, and the slow-request log
+
+Run with: python manage.py test attendance
+"""
+import json
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+URL = '/api/attendance/sms-logs/statistics/'
+
+
+@override_settings(DEBUG=False, SQL_PROFILER_ENABLED=True, SQL_PROFILER_SLOW_REQUEST_MS=0, SQL_PROFILER_SAMPLE_RATE=1.0)
+class SQLProfilerMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('profiled', password='profiled')
+        cls.staff = User.objects.create_user('staff', password='staff', is_staff=True)
+
+    def get(self, user=None):
+        client = APIClient()
+        if user:
+            client.force_authenticate(user)
+        return client.get(URL)
+
+    def test_timing_is_shown_to_staff_only(self):
+        self.assertNotIn('Server-Timing', self.get())
+        self.assertNotIn('Server-Timing', self.get(self.user))
+        self.assertRegex(self.get(self.staff)['Server-Timing'], r'^db;desc="\d+ queries";dur=[\d.]+, app;dur=[\d.]+$')
+        with self.settings(DEBUG=True):
+            self.assertIn('Server-Timing', self.get())
+
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs('schoolhub.slow_requests', 'WARNING') as logs:
+            response = self.get(self.user)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['path'], record['status']), (URL, response.status_code))
+        self.assertGreater(record['query_count'], 0)
+        self.assertLessEqual(len(record['slowest_queries']), 5)
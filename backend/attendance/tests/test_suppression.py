@@ -0,0 +1,61 @@
+"""
+Notification suppression: reservations and recording punches on commit
+
+The Lua scripts run against fakeredis (with Lua support); the tests are
+skipped when it is not installed.
+
+Run with: python manage.py test attendance
+"""
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock, skipIf
+
+from django.test import TestCase
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+PUNCH = datetime(2025, 3, 2, 5, 0, tzinfo=dt_timezone.utc)
+
+
+@skipIf(fakeredis is None, 'fakeredis is not installed')
+class SuppressionTests(TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        patcher = mock.patch('attendance.suppression.get_redis_client', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def punch(self, minutes, attendance_type='CHECK_OUT'):
+        from ..models import Attendance
+
+        return Attendance(
+            student_id=1, attendance_type=attendance_type, timestamp=PUNCH + timedelta(minutes=minutes),
+            local_date=date(2025, 3, 2),
+        )
+
+    def test_committed_punch_is_recorded(self):
+        from ..suppression import should_notify, suppression_key
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(should_notify(self.punch(0)))
+        key = suppression_key(self.punch(0))
+        self.assertEqual(self.redis.get(key), str(int(PUNCH.timestamp() * 1000)))
+        self.assertFalse(self.redis.exists(f'{key}:reserved'))
+        self.assertFalse(should_notify(self.punch(3)))
+
+    def test_rolled_back_punch_is_not_recorded(self):
+        from ..suppression import should_notify, suppression_key
+
+        # The callbacks are dropped, as on rollback
+        with self.captureOnCommitCallbacks(execute=False):
+            self.assertTrue(should_notify(self.punch(0)))
+            # Concurrent duplicates are held off by the reservation
+            self.assertFalse(should_notify(self.punch(1)))
+        key = suppression_key(self.punch(0))
+        self.assertFalse(self.redis.exists(key))
+
+        # Once the reservation expires, the next real punch is notified
+        self.redis.delete(f'{key}:reserved')
+        self.assertTrue(should_notify(self.punch(2)))
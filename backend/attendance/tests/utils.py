@@ -0,0 +1,252 @@
+"""
+Helpers for the attendance tests: shared fixtures, running without Redis, and
+the query-count and query-plan regression checks
+
+QueryBudgetMixin.assertQueryBudget() runs a block, fails if it issued more SQL
+statements than its budget, and then EXPLAINs every statement touching the
+attendance or SMS log tables with sequential scans disabled. On the small test
+tables the planner would otherwise always pick sequential scans. With them
+disabled, a remaining sequential scan, or an index scan without any index
+condition outside a LIMIT (a full index walk), means no index can serve the
+query, which is the regression these tests catch on million-row tables.
+
+Disabled scans of small unguarded tables (e.g. search subqueries without
+pg_trgm) dwarf every other cost, so the planner may then pick a full index walk
+on a guarded table merely for its sort order. A walk only fails the check if
+the statement still cannot be served once plain index scans are disabled too.
+"""
+import json
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from unittest import mock
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+# Modules falling back to the database or per-process state without Redis
+REDIS_CLIENTS = (
+    'attendance.circuit_breaker.get_redis_client',
+    'attendance.counters.get_redis_client',
+    'attendance.rate_limit.get_redis_client',
+    'attendance.receipts.get_redis_client',
+    'attendance.suppression.get_redis_client',
+)
+
+# Tables (and their monthly partitions) that must never be scanned sequentially
+GUARDED_TABLES = ('attendance_attendance', 'attendance_smslog')
+
+EXPLAINABLE_PREFIXES = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+
+
+def is_guarded_relation(name):
+    return any(name == table or name.startswith(f'{table}_p') for table in GUARDED_TABLES)
+
+
+def explain(sql, disabled=('enable_seqscan',)):
+    """EXPLAIN a captured statement with sequential scans disabled; returns the plan tree"""
+    with connection.cursor() as cursor:
+        cursor.execute('SAVEPOINT explain_check')
+        try:
+            for setting in disabled:
+                cursor.execute(f'SET LOCAL {setting} = off')
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+            plan = cursor.fetchone()[0]
+        finally:
+            cursor.execute('ROLLBACK TO SAVEPOINT explain_check')
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
+
+
+def find_full_scans(plan, limited=False):
+    """Guarded relations read in full anywhere in a plan tree"""
+    found = []
+    node_type = plan.get('Node Type')
+    if is_guarded_relation(plan.get('Relation Name', '')):
+        if node_type == 'Seq Scan':
+            found.append(f"{plan['Relation Name']} (Seq Scan)")
+        elif node_type in ('Index Scan', 'Index Only Scan') and 'Index Cond' not in plan and not limited:
+            found.append(f"{plan['Relation Name']} ({node_type} without condition)")
+    limited = limited or node_type == 'Limit'
+    for child in plan.get('Plans', []):
+        found.extend(find_full_scans(child, limited))
+    return found
+
+
+class QueryBudgetMixin:
+    """TestCase mixin asserting SQL statement budgets and index-only access plans"""
+
+    @contextmanager
+    def assertQueryBudget(self, budget, check_plans=True):
+        with CaptureQueriesContext(connection) as context:
+            yield context
+
+        statements = [query['sql'] for query in context.captured_queries]
+        self.assertLessEqual(
+            len(statements),
+            budget,
+            f'{len(statements)} queries issued, budget is {budget}:\n' + '\n'.join(statements),
+        )
+        if check_plans and connection.vendor == 'postgresql':
+            for sql in statements:
+                if not sql.lstrip().upper().startswith(EXPLAINABLE_PREFIXES):
+                    continue
+                if not any(table in sql for table in GUARDED_TABLES):
+                    continue
+                full_scans = find_full_scans(explain(sql))
+                if full_scans:
+                    full_scans = find_full_scans(explain(sql, ('enable_seqscan', 'enable_indexscan')))
+                self.assertFalse(full_scans, f'Full scan on {", ".join(full_scans)}:\n{sql}')
+
+
+class RedisDisabledMixin:
+    """TestCase mixin running every test without Redis, from fresh circuit breakers and rate limits"""
+
+    def setUp(self):
+        from .. import rate_limit
+        from ..circuit_breaker import reset
+
+        super().setUp()
+        for target in REDIS_CLIENTS:
+            patcher = mock.patch(target, side_effect=ConnectionError('Redis disabled in tests'))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        reset()
+        self.addCleanup(reset)
+        rate_limit._local_buckets.clear()
+
+
+def create_family(name, student_id, parent_count, phone_prefix):
+    """
+    A student of the main branch linked to parent_count parents, with phone
+    numbers phone_prefix followed by three digits.
+
+    Returns:
+        tuple: (student, parents)
+    """
+    from core.models import Branch, Parent, Student
+
+    student = Student.objects.create(
+        first_name=name, last_name='Student', student_id=student_id, grade='PRIMARY', level=1,
+        gender='M', date_of_birth=date(2015, 1, 1), branch=Branch.objects.get(id=1),
+    )
+    parents = [
+        Parent.objects.create(
+            first_name=f'{name}{index}', last_name='Parent', email=f'{name.lower()}{index}@example.com',
+            phone_number=f'{phone_prefix}{index:03d}',
+        )
+        for index in range(parent_count)
+    ]
+    student.parents.set(parents)
+    return student, parents
+
+
+def school_days_before(day, count):
+    """The last `count` weekdays (Sunday-Thursday) up to and including day"""
+    days = []
+    while len(days) < count:
+        if day.weekday() not in (4, 5):
+            days.append(day)
+        day -= timedelta(days=1)
+    return sorted(days)
+
+
+def local_datetime(day, hour, minute=0):
+    from ..utils import get_device_timezone
+    return get_device_timezone().localize(datetime.combine(day, time(hour, minute)))
+
+
+def seed_dataset(students_per_branch=40, days=10, today=None):
+    """
+    Seed a realistic school: two branches, devices, students with two parents
+    each, and `days` school days of check-ins (on time, late, absent), check-outs
+    and SMS logs.
+
+    Returns:
+        dict: branches, students, parents and school days created
+    """
+    from core.models import Branch, Parent, Student
+    from core.search import rebuild_search_documents
+    from ..models import Attendance, FingerprintDevice, SMSLog
+    from ..utils import get_local_date
+
+    today = today or get_local_date()
+    # Branch 1 is created by a core migration
+    main_branch = Branch.objects.get(id=1)
+    second_branch = Branch.objects.create(id=2, name='Second Branch', address='')
+    branches = [main_branch, second_branch]
+
+    devices = [
+        FingerprintDevice.objects.create(
+            name=f'Device {branch.id}', model='ZK702', ip_address=f'10.0.0.{branch.id}',
+            serial_number=f'SN{branch.id}', branch=branch, grade_category='PRIMARY', levels=[1, 2, 3, 4, 5, 6],
+        )
+        for branch in branches
+    ]
+
+    students = []
+    for branch in branches:
+        for index in range(students_per_branch):
+            students.append(Student(
+                first_name=f'Student{index}', last_name=f'B{branch.id}',
+                student_id=f'{branch.id}-{index:04d}', grade='PRIMARY', level=index % 6 + 1,
+                class_name='AB'[index % 2], gender='MF'[index % 2],
+                date_of_birth=date(2015, 1, 1), branch=branch,
+            ))
+    students = Student.objects.bulk_create(students)
+
+    parents = Parent.objects.bulk_create([
+        Parent(first_name=f'Parent{index}', last_name='P', email=f'parent{index}@example.com', phone_number=f'05{index:08d}')
+        for index in range(len(students) * 2)
+    ])
+    Student.parents.through.objects.bulk_create([
+        Student.parents.through(student_id=student.id, parent_id=parents[index * 2 + offset].id)
+        for index, student in enumerate(students)
+        for offset in (0, 1)
+    ])
+
+    rebuild_search_documents()
+
+    school_days = school_days_before(today, days)
+    records = []
+    for day in school_days:
+        for index, student in enumerate(students):
+            if index % 10 == 0:
+                continue  # absent
+            minute = 10 if index % 5 else 35  # every fifth student is late
+            check_in = local_datetime(day, 8, minute)
+            device = devices[0] if student.branch_id == 1 else devices[1]
+            placement = {
+                'branch_id': student.branch_id, 'grade': student.grade,
+                'level': student.level, 'class_name': student.class_name,
+            }
+            records.append(Attendance(
+                student=student, device=device, attendance_type='CHECK_IN', timestamp=check_in,
+                local_date=get_local_date(check_in), status='LATE' if minute == 35 else 'ATTENDED', is_synced=True,
+                **placement,
+            ))
+            check_out = local_datetime(day, 13, 30)
+            records.append(Attendance(
+                student=student, device=device, attendance_type='CHECK_OUT', timestamp=check_out,
+                local_date=get_local_date(check_out), is_synced=True, **placement,
+            ))
+    records = Attendance.objects.bulk_create(records)
+
+    parents_by_student = {
+        student.id: (parents[index * 2], parents[index * 2 + 1]) for index, student in enumerate(students)
+    }
+    SMSLog.objects.bulk_create([
+        SMSLog(
+            student_id=record.student_id, parent=parent, attendance=record, phone_number=parent.phone_number,
+            message='Checked in', status='SENT', sent_at=record.timestamp, message_id=f'm{record.id}-{parent.id}',
+        )
+        for record in records if record.attendance_type == 'CHECK_IN'
+        for parent in parents_by_student[record.student_id]
+    ])
+
+    return {
+        'branches': branches,
+        'students': students,
+        'parents': parents,
+        'school_days': school_days,
+    }
@@ -1,14 +1,27 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import FingerprintDeviceViewSet, AttendanceViewSet, SMSLogViewSet, AttendanceSettingsViewSet
+from .views import (
+    FingerprintDeviceViewSet,
+    AttendanceViewSet,
+    SMSLogViewSet,
+    SMSLogArchiveViewSet,
+    AttendanceSettingsViewSet,
+    ReportJobViewSet,
+    SMSDeliveryReceiptView,
+    WhatsAppStatusWebhookView,
+)
 
 router = DefaultRouter()
 router.register(r'devices', FingerprintDeviceViewSet, basename='device')
 router.register(r'records', AttendanceViewSet, basename='attendance')
 router.register(r'sms-logs', SMSLogViewSet, basename='sms-log')
+router.register(r'sms-logs-archive', SMSLogArchiveViewSet, basename='sms-log-archive')
 router.register(r'settings', AttendanceSettingsViewSet, basename='attendance-settings')
+router.register(r'report-jobs', ReportJobViewSet, basename='report-job')
 
 urlpatterns = [
+    path('webhooks/sms/', SMSDeliveryReceiptView.as_view(), name='sms-delivery-receipts'),
+    path('webhooks/whatsapp/', WhatsAppStatusWebhookView.as_view(), name='whatsapp-status-webhook'),
     path('', include(router.urls)),
 ]
 
@@ -27,3 +27,80 @@ def get_device_timezone():
     except pytz.exceptions.UnknownTimeZoneError:
         # Fallback to KSA timezone if invalid timezone is configured
         return pytz.timezone('Asia/Riyadh')
+
+
+def get_local_date(dt=None):
+    """
+    Get the calendar date of a datetime in the device timezone.
+    
+    Args:
+        dt: Timezone-aware datetime (defaults to now)
+    
+    Returns:
+        date: The date as seen on the fingerprint devices
+    """
+    from django.utils import timezone
+    
+    if dt is None:
+        dt = timezone.now()
+    elif timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return dt.astimezone(get_device_timezone()).date()
+
+
+def get_local_day_bounds(day):
+    """
+    Get the UTC datetime range covering a calendar day in the device timezone.
+    
+    Args:
+        day: date in the device timezone
+    
+    Returns:
+        tuple: (start_of_day_utc, end_of_day_utc), both inclusive
+    """
+    from datetime import datetime
+    
+    device_tz = get_device_timezone()
+    start_of_day_local = device_tz.localize(datetime.combine(day, datetime.min.time()))
+    end_of_day_local = device_tz.localize(datetime.combine(day, datetime.max.time()))
+    return start_of_day_local.astimezone(pytz.UTC), end_of_day_local.astimezone(pytz.UTC)
+
+
+def status_priority_expression():
+    """
+    Database expression ranking a CHECK_IN status: ATTENDED = 3, LATE = 2, ABSENT = 1, None = 0.
+    
+    Used to pick each student's best status of a day with Max() instead of
+    iterating over the records in Python.
+    """
+    from django.db.models import Case, When, Value, IntegerField
+    
+    return Case(
+        When(status='ATTENDED', then=Value(3)),
+        When(status='LATE', then=Value(2)),
+        When(status='ABSENT', then=Value(1)),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+_redis_client = None
+
+
+def get_redis_client():
+    """
+    Get a shared Redis client for application data (counters, locks, rate limits).
+    
+    The client is created lazily and reuses one connection pool per process.
+    Connects to REDIS_URL, which defaults to the Celery broker URL.
+    """
+    global _redis_client
+    if _redis_client is None:
+        import redis
+        _redis_client = redis.Redis.from_url(
+            getattr(settings, 'REDIS_URL', 'redis://localhost:6379/1'),
+            socket_connect_timeout=getattr(settings, 'REDIS_SOCKET_TIMEOUT', 0.5),
+            socket_timeout=getattr(settings, 'REDIS_SOCKET_TIMEOUT', 0.5),
+            decode_responses=True,
+        )
+    return _redis_client
@@ -1,28 +1,63 @@
-from rest_framework import viewsets, status, filters
+from rest_framework import viewsets, mixins, status, filters
 from rest_framework.decorators import action
+from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
 
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
 from django.utils import timezone
 from django.db.models import Q, Max, Min, Count
-from django.db import models
+from django.db import models, transaction
 
-import pytz
-import traceback
+import hashlib
+import hmac
+import json
+import os
 from datetime import datetime, timedelta
 
-from core.models import Student, Branch
-from .models import FingerprintDevice, Attendance, SMSLog, AttendanceSettings
+from core.models import Student, Branch, Parent
+from core.search import RankedSearchFilter
+from .models import FingerprintDevice, Attendance, SMSLog, SMSLogArchive, AttendanceSettings, ReportJob, StudentAttendanceStats
 from .serializers import (
     FingerprintDeviceSerializer,
     AttendanceSerializer,
     AttendanceCreateSerializer,
     SMSLogSerializer,
+    SMSLogArchiveSerializer,
     AttendanceSettingsSerializer,
+    ReportJobSerializer,
+    ReportJobCreateSerializer,
+    StudentAttendanceStatsSerializer,
+)
+from .utils import get_local_date, get_local_day_bounds
+from .counters import get_day_summary
+from .absences import count_absences_by_day, get_absences, materialized_days
+from .archive import get_school_year_start
+from .pagination import AttendancePagination, SMSLogPagination
+from .projections import ATTENDANCE_COMPACT_FIELDS, SMS_LOG_COMPACT_FIELDS, CompactProjectionMixin
+from .reports import (
+    parse_report_filters,
+    build_report,
+    build_register,
+    get_school_days,
+    iter_report_rows,
+    start_report_job,
+)
+from .exports import (
+    ATTENDANCE_REPORT_COLUMNS,
+    SMS_LOG_COLUMNS,
+    export_response,
+    iter_sms_log_rows,
 )
-from .utils import get_device_timezone
 from .services import ZKtecoDeviceService
-from .notifications import SMSNotificationService
+from .outbox import enqueue_notifications
+from .receipts import parse_sms_receipts, parse_whatsapp_receipts, queue_receipts
+
+# Default absence streak (school days) listed by the at-risk endpoint
+AT_RISK_MIN_STREAK = 3
 
 
 class FingerprintDeviceViewSet(viewsets.ModelViewSet):
@@ -180,15 +215,18 @@ class FingerprintDeviceViewSet(viewsets.ModelViewSet):
             )
 
 
-class AttendanceViewSet(viewsets.ModelViewSet):
+class AttendanceViewSet(CompactProjectionMixin, viewsets.ModelViewSet):
     queryset = Attendance.objects.select_related("student", "device").all()
     serializer_class = AttendanceSerializer
+    pagination_class = AttendancePagination
+    compact_fields = ATTENDANCE_COMPACT_FIELDS
+    local_datetime_fields = ("timestamp",)
     filter_backends = [
         DjangoFilterBackend,
-        filters.SearchFilter,
+        RankedSearchFilter,
         filters.OrderingFilter,
     ]
-    search_fields = ["student__first_name", "student__last_name", "student__student_id"]
+    search_documents = {"student_id": Student}
     filterset_fields = ["attendance_type", "is_synced", "device", "student"]
     ordering_fields = ["timestamp", "created_at"]
     ordering = ["-timestamp"]
@@ -204,22 +242,30 @@ class AttendanceViewSet(viewsets.ModelViewSet):
         status = self.request.query_params.get("status")
         device_id = self.request.query_params.get("device")
 
+        # Plain dates filter on the device-local date; datetimes on the timestamp
         if date_from:
-            queryset = queryset.filter(timestamp__gte=date_from)
+            try:
+                queryset = queryset.filter(local_date__gte=datetime.strptime(date_from, "%Y-%m-%d").date())
+            except ValueError:
+                queryset = queryset.filter(timestamp__gte=date_from)
         if date_to:
-            queryset = queryset.filter(timestamp__lte=date_to)
+            try:
+                queryset = queryset.filter(local_date__lte=datetime.strptime(date_to, "%Y-%m-%d").date())
+            except ValueError:
+                queryset = queryset.filter(timestamp__lte=date_to)
         if branch_id:
             try:
                 branch = Branch.objects.get(id=branch_id)
-                queryset = queryset.filter(student__branch=branch)
+                queryset = queryset.filter(branch=branch)
             except Branch.DoesNotExist:
                 pass
+        # Placement filters match the student's placement on the day of the record
         if grade:
-            queryset = queryset.filter(student__grade=grade)
+            queryset = queryset.filter(grade=grade)
         if level:
-            queryset = queryset.filter(student__level=level)
+            queryset = queryset.filter(level=level)
         if class_name:
-            queryset = queryset.filter(student__class_name=class_name)
+            queryset = queryset.filter(class_name=class_name)
         if status:
             queryset = queryset.filter(status=status)
         if device_id:
@@ -263,19 +309,15 @@ class AttendanceViewSet(viewsets.ModelViewSet):
                     student.grade, student.branch, student.level
                 )
 
-            attendance = Attendance.create_attendance(
-                student=student,
-                attendance_type=attendance_type,
-                timestamp=timestamp,
-                device=device,
-            )
-
-            try:
-                sms_service = SMSNotificationService()
-                sms_service.send_attendance_notification(attendance)
-            except Exception as e:
-                print(f"✗ Error sending SMS notification: {str(e)}")
-                print(f"  Traceback: {traceback.format_exc()}")
+            # The SMS notification is queued with the record and sent by the outbox dispatcher
+            with transaction.atomic():
+                attendance = Attendance.create_attendance(
+                    student=student,
+                    attendance_type=attendance_type,
+                    timestamp=timestamp,
+                    device=device,
+                )
+                enqueue_notifications(attendance)
 
             return Response(
                 AttendanceSerializer(attendance).data, status=status.HTTP_201_CREATED
@@ -285,37 +327,86 @@ class AttendanceViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=["get"])
     def student_attendance(self, request):
-        """Get attendance records for a specific student"""
+        """Get a page of attendance records for a specific student (supports view=compact and keyset pagination)"""
         student_id = request.query_params.get("student_id")
         if not student_id:
             return Response({"error": "student_id parameter is required"}, status=400)
 
         try:
             student = Student.objects.get(id=student_id)
-            attendances = self.queryset.filter(student=student)
-            serializer = self.get_serializer(attendances, many=True)
-            return Response(serializer.data)
-        except Student.DoesNotExist:
+        except (Student.DoesNotExist, ValueError):
             return Response({"error": "Student not found"}, status=404)
 
+        attendances = self.queryset.filter(student=student)
+        try:
+            names = self.get_compact_field_names()
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        if names is not None:
+            page = self.paginate_queryset(self.get_compact_queryset(attendances, names))
+            return self.get_paginated_response(
+                [{name: self.format_compact_value(name, row[name]) for name in names} for row in page]
+            )
+
+        page = self.paginate_queryset(attendances)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     @action(detail=False, methods=["get"])
-    def today_summary(self, request):
-        """Get today's attendance summary - counts unique students, not records"""
-        # Get today's date in device timezone for consistency
-        device_tz = get_device_timezone()
-        today_utc = timezone.now()
-        today_local = today_utc.astimezone(device_tz).date()
+    def student_statistics(self, request):
+        """Get a student's running attendance statistics for the current school year"""
+        student_id = request.query_params.get("student_id")
+        if not student_id:
+            return Response({"error": "student_id parameter is required"}, status=400)
+
+        try:
+            student = Student.objects.get(id=student_id)
+        except (Student.DoesNotExist, ValueError):
+            return Response({"error": "Student not found"}, status=404)
+
+        stats = StudentAttendanceStats.objects.filter(student=student).first()
+        if stats is None:
+            stats = StudentAttendanceStats(student=student, school_year_start=get_school_year_start())
+        return Response(StudentAttendanceStatsSerializer(stats).data)
+
+    @action(detail=False, methods=["get"])
+    def at_risk(self, request):
+        """Get students with the longest current absence streaks"""
+        try:
+            min_streak = int(request.query_params.get("min_streak", AT_RISK_MIN_STREAK))
+        except ValueError:
+            return Response({"error": "min_streak must be a number"}, status=400)
+
+        stats = StudentAttendanceStats.objects.filter(
+            streak_status="ABSENT",
+            current_streak__gte=min_streak,
+            school_year_start=get_school_year_start(),
+            student__is_active=True,
+        ).select_related("student", "student__branch")
+        report_filters = parse_report_filters(request.query_params)
+        if report_filters["branch_id"]:
+            stats = stats.filter(student__branch_id=report_filters["branch_id"])
+        if report_filters["grade"]:
+            stats = stats.filter(student__grade=report_filters["grade"])
+        if report_filters["level"]:
+            stats = stats.filter(student__level=report_filters["level"])
+        if report_filters["class_name"]:
+            stats = stats.filter(student__class_name=report_filters["class_name"])
+        stats = stats.order_by("-current_streak", "student_id")
+
+        paginator = PageNumberPagination()
+        page = paginator.paginate_queryset(stats, request, view=self)
+        return paginator.get_paginated_response(StudentAttendanceStatsSerializer(page, many=True).data)
 
-        # Convert today's date range to UTC datetime range for database query
-        # Start of today in device timezone
-        start_of_day_local = datetime.combine(today_local, datetime.min.time())
-        start_of_day_local_tz = device_tz.localize(start_of_day_local)
-        start_of_day_utc = start_of_day_local_tz.astimezone(pytz.UTC)
+    @action(detail=False, methods=["get"])
+    def today_summary(self, request):
+        """Get today's attendance summary - counts unique students, not records
 
-        # End of today in device timezone
-        end_of_day_local = datetime.combine(today_local, datetime.max.time())
-        end_of_day_local_tz = device_tz.localize(end_of_day_local)
-        end_of_day_utc = end_of_day_local_tz.astimezone(pytz.UTC)
+        Served from live Redis counters that are updated at ingest time and
+        rebuilt from the database on a cache miss or day rollover.
+        """
+        # Get today's date in device timezone for consistency
+        today_local = get_local_date()
 
         # Filter by branch if provided
         branch_id = request.query_params.get("branch_id")
@@ -323,68 +414,19 @@ class AttendanceViewSet(viewsets.ModelViewSet):
         if branch_id:
             try:
                 branch = Branch.objects.get(id=branch_id)
-            except Branch.DoesNotExist:
+            except (Branch.DoesNotExist, ValueError):
                 pass
 
-        # Get attendance records for today (filter by UTC timestamp range)
-        today_attendances = self.queryset.filter(
-            timestamp__gte=start_of_day_utc, timestamp__lte=end_of_day_utc
-        )
-        if branch:
-            today_attendances = today_attendances.filter(student__branch=branch)
-
-        # Get all CHECK_IN records for today
-        today_check_ins = today_attendances.filter(attendance_type="CHECK_IN")
-
-        # For each student, determine their best status (ATTENDED > LATE > ABSENT)
-        # Status priority: ATTENDED = 3, LATE = 2, ABSENT = 1, None = 0
-        student_status_map = {}
-        for attendance in today_check_ins.select_related("student"):
-            student_id = attendance.student_id
-            status = attendance.status
-
-            # Status priority: ATTENDED > LATE > ABSENT
-            if status == "ATTENDED":
-                priority = 3
-            elif status == "LATE":
-                priority = 2
-            elif status == "ABSENT":
-                priority = 1
-            else:
-                priority = 0
-
-            # Keep the highest priority status for each student
-            if (
-                student_id not in student_status_map
-                or priority > student_status_map[student_id]["priority"]
-            ):
-                student_status_map[student_id] = {
-                    "status": status,
-                    "priority": priority,
-                }
-
-        # Count students by their best status
-        attended_count = sum(
-            1 for v in student_status_map.values() if v["status"] == "ATTENDED"
-        )
-        late_count = sum(
-            1 for v in student_status_map.values() if v["status"] == "LATE"
-        )
-
-        # Count unique students who checked in today (regardless of status)
-        unique_check_in_students = len(student_status_map)
-
-        # Count check-outs (can be multiple per student, so count records)
-        check_outs_count = today_attendances.filter(attendance_type="CHECK_OUT").count()
+        summary = get_day_summary(today_local, branch.id if branch else None)
 
         return Response(
             {
                 "date": today_local.isoformat(),
-                "check_ins": unique_check_in_students,  # Unique students who checked in
-                "check_outs": check_outs_count,
-                "attended": attended_count,  # Unique students with ATTENDED as best status
-                "late": late_count,  # Unique students with LATE as best status (no ATTENDED)
-                "total_records": today_attendances.count(),
+                "check_ins": summary["check_ins"],  # Unique students who checked in
+                "check_outs": summary["check_outs"],
+                "attended": summary["attended"],  # Unique students with ATTENDED as best status
+                "late": summary["late"],  # Unique students with LATE as best status (no ATTENDED)
+                "total_records": summary["total_records"],
             }
         )
 
@@ -452,10 +494,10 @@ class AttendanceViewSet(viewsets.ModelViewSet):
             except Branch.DoesNotExist:
                 pass
 
-        # Get base queryset (will filter by date range in loop using UTC datetime ranges)
+        # Get base queryset (will filter by device-local date in loop)
         queryset = self.queryset.all()
         if branch:
-            queryset = queryset.filter(student__branch=branch)
+            queryset = queryset.filter(branch=branch)
 
         # Get total students count (filtered by branch if applicable)
         total_students_query = Student.objects.filter(is_active=True)
@@ -463,26 +505,17 @@ class AttendanceViewSet(viewsets.ModelViewSet):
             total_students_query = total_students_query.filter(branch=branch)
         total_students_count = total_students_query.count()
 
+        # Absences recorded by the end-of-day job; other days derive them from the roster
+        absence_counts = count_absences_by_day(start_date, end_date, branch_id=branch.id if branch else None)
+
         # Get daily breakdown
         daily_data = []
-        device_tz = get_device_timezone()
 
         for i in range(num_days):
             date = start_date + timedelta(days=i)
 
-            # Convert date to UTC datetime range for database query
-            start_of_day_local = datetime.combine(date, datetime.min.time())
-            start_of_day_local_tz = device_tz.localize(start_of_day_local)
-            start_of_day_utc = start_of_day_local_tz.astimezone(pytz.UTC)
-
-            end_of_day_local = datetime.combine(date, datetime.max.time())
-            end_of_day_local_tz = device_tz.localize(end_of_day_local)
-            end_of_day_utc = end_of_day_local_tz.astimezone(pytz.UTC)
-
-            # Filter by UTC timestamp range for this day
-            day_attendances = queryset.filter(
-                timestamp__gte=start_of_day_utc, timestamp__lte=end_of_day_utc
-            )
+            # Filter by the device-local date of the records
+            day_attendances = queryset.filter(local_date=date)
 
             # Get all CHECK_IN records for this day
             day_check_ins = day_attendances.filter(attendance_type="CHECK_IN")
@@ -531,7 +564,10 @@ class AttendanceViewSet(viewsets.ModelViewSet):
             check_outs = day_attendances.filter(attendance_type="CHECK_OUT").count()
 
             # Calculate absent (students who didn't attend - no ATTENDED or LATE status)
-            absent = max(0, total_students_count - present)
+            if date in absence_counts:
+                absent = absence_counts[date]
+            else:
+                absent = max(0, total_students_count - present)
 
             # Format date label based on period
             DATE_FORMAT = "%d/%m"
@@ -584,218 +620,150 @@ class AttendanceViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=["get"])
     def attendance_report(self, request):
         """Get attendance report with student attendance status"""
-        # Get filter parameters
-        branch_id = request.query_params.get("branch_id")
-        grade = request.query_params.get("grade")
-        level = request.query_params.get("level")
-        class_name = request.query_params.get("class")
-        date_from = request.query_params.get("date_from")
-        date_to = request.query_params.get("date_to")
-
-        # Default to today if no date range provided
-        today = timezone.now().date()
-        if not date_from:
-            date_from = today.isoformat()
-        if not date_to:
-            date_to = today.isoformat()
-
-        # Build student query
-        students_query = Student.objects.filter(is_active=True)
-
-        if branch_id:
-            try:
-                branch = Branch.objects.get(id=branch_id)
-                students_query = students_query.filter(branch=branch)
-            except Branch.DoesNotExist:
-                pass
-
-        if grade:
-            students_query = students_query.filter(grade=grade)
-
-        if level:
-            students_query = students_query.filter(level=level)
-
-        if class_name:
-            students_query = students_query.filter(class_name=class_name)
+        report_filters = parse_report_filters(request.query_params)
+        return Response(build_report(report_filters))
 
-        # Get all matching students
-        students = students_query.select_related("branch").order_by(
-            "first_name", "last_name"
-        )
-
-        # Get attendance records for the date range
-        attendance_query = self.queryset.filter(
-            timestamp__date__gte=date_from, timestamp__date__lte=date_to
-        )
-
-        if branch_id:
-            try:
-                branch = Branch.objects.get(id=branch_id)
-                attendance_query = attendance_query.filter(student__branch=branch)
-            except Branch.DoesNotExist:
-                pass
-
-        if grade:
-            attendance_query = attendance_query.filter(student__grade=grade)
-
-        if level:
-            attendance_query = attendance_query.filter(student__level=level)
-
-        if class_name:
-            attendance_query = attendance_query.filter(student__class_name=class_name)
-
-        # Build report data
-        report_data = []
-        for student in students:
-            # Get attendance records for this student in the date range
-            student_attendances = attendance_query.filter(student=student)
-
-            # Check if student has any check-ins in the date range
-            check_ins = student_attendances.filter(attendance_type="CHECK_IN")
-            has_attended = check_ins.exists()
-
-            # Determine the best status for this student (ATTENDED > LATE > ABSENT)
-            # Status priority: ATTENDED = 3, LATE = 2, ABSENT = 1, None = 0
-            best_status = "ABSENT"
-            best_priority = 0
-
-            if has_attended:
-                for attendance in check_ins:
-                    status = attendance.status
-                    if status == "ATTENDED":
-                        priority = 3
-                    elif status == "LATE":
-                        priority = 2
-                    elif status == "ABSENT":
-                        priority = 1
-                    else:
-                        priority = 0
-
-                    # Keep the highest priority status
-                    if priority > best_priority:
-                        best_priority = priority
-                        best_status = status if status else "ABSENT"
-
-            # Map status to display value
-            if best_status == "ATTENDED":
-                attendance_status_display = "Present"
-            elif best_status == "LATE":
-                attendance_status_display = "Late"
-            else:
-                attendance_status_display = "Absent"
-
-            # Get first check-in and last check-out if any
-            first_check_in = check_ins.order_by("timestamp").first()
-            last_check_out = (
-                student_attendances.filter(attendance_type="CHECK_OUT")
-                .order_by("-timestamp")
-                .first()
-            )
-
-            # Count total check-ins and check-outs
-            check_in_count = check_ins.count()
-            check_out_count = student_attendances.filter(
-                attendance_type="CHECK_OUT"
-            ).count()
-
-            report_data.append(
-                {
-                    "student_id": student.id,
-                    "student_name": student.full_name,
-                    "student_id_number": student.student_id,
-                    "grade": student.grade,
-                    "level": student.level,
-                    "class_name": student.class_name or "",
-                    "branch": {"id": student.branch.id, "name": student.branch.name},
-                    "has_attended": has_attended,
-                    "attendance_status": attendance_status_display,
-                    "attendance_status_code": best_status,
-                    "first_check_in": first_check_in.timestamp.isoformat()
-                    if first_check_in
-                    else None,
-                    "last_check_out": last_check_out.timestamp.isoformat()
-                    if last_check_out
-                    else None,
-                    "check_in_count": check_in_count,
-                    "check_out_count": check_out_count,
-                    "total_attendance_days": check_in_count,
-                }
-            )
-
-        # Calculate summary statistics
-        total_students = len(report_data)
-        present_count = sum(
-            1 for item in report_data if item["attendance_status_code"] == "ATTENDED"
-        )
-        late_count = sum(
-            1 for item in report_data if item["attendance_status_code"] == "LATE"
-        )
-        absent_count = sum(
-            1 for item in report_data if item["attendance_status_code"] == "ABSENT"
-        )
+    @action(detail=False, methods=["get"])
+    def attendance_register(self, request):
+        """Get a students x school days register with one status code per day"""
+        report_filters = parse_report_filters(request.query_params)
+        try:
+            register = build_register(report_filters)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        return Response(register)
 
-        return Response(
+    @action(detail=False, methods=["get"])
+    def absences(self, request):
+        """Get recorded absences for a date range (defaults to today) with report filters"""
+        report_filters = parse_report_filters(request.query_params)
+        try:
+            date_from = datetime.strptime(report_filters["date_from"], "%Y-%m-%d").date()
+            date_to = datetime.strptime(report_filters["date_to"], "%Y-%m-%d").date()
+        except ValueError:
+            return Response({"error": "Invalid date format. Use YYYY-MM-DD"}, status=400)
+        if date_from > date_to:
+            return Response({"error": "date_from must be on or before date_to"}, status=400)
+
+        absences = get_absences(
+            date_from,
+            date_to,
+            branch_id=report_filters["branch_id"],
+            grade=report_filters["grade"],
+            level=report_filters["level"],
+            class_name=report_filters["class_name"],
+        ).values(
+            "id",
+            "date",
+            "student_id",
+            "student__first_name",
+            "student__last_name",
+            "student__student_id",
+            "branch_id",
+            "grade",
+            "level",
+            "class_name",
+        ).order_by("-date", "student_id")
+
+        recorded_days = materialized_days(date_from, date_to)
+        pending_days = [
+            day.isoformat()
+            for day in get_school_days(date_from, min(date_to, get_local_date()))
+            if day not in recorded_days
+        ]
+
+        paginator = PageNumberPagination()
+        page = paginator.paginate_queryset(absences, request, view=self)
+        results = [
             {
-                "date_from": date_from,
-                "date_to": date_to,
-                "filters": {
-                    "branch_id": branch_id,
-                    "grade": grade,
-                    "level": level,
-                    "class": class_name,
-                },
-                "summary": {
-                    "total_students": total_students,
-                    "present": present_count,
-                    "late": late_count,
-                    "absent": absent_count,
-                    "attendance_rate": round((present_count / total_students * 100), 2)
-                    if total_students > 0
-                    else 0,
-                },
-                "students": report_data,
+                "id": row["id"],
+                "date": row["date"].isoformat(),
+                "student": row["student_id"],
+                "student_name": f'{row["student__first_name"]} {row["student__last_name"]}',
+                "student_id_number": row["student__student_id"],
+                "branch": row["branch_id"],
+                "grade": row["grade"],
+                "level": row["level"],
+                "class_name": row["class_name"],
             }
+            for row in page
+        ]
+        response = paginator.get_paginated_response(results)
+        response.data["pending_dates"] = pending_days
+        return response
+
+    @action(detail=False, methods=["get"])
+    def attendance_report_export(self, request):
+        """Download the attendance report as CSV or XLSX (file_format=csv|xlsx)
+
+        Rows are streamed from a server-side cursor, so memory stays flat for
+        whole-branch, multi-week reports.
+        """
+        report_filters = parse_report_filters(request.query_params)
+        file_format = request.query_params.get("file_format", "csv")
+        if file_format not in ("csv", "xlsx"):
+            return Response({"error": "file_format must be csv or xlsx"}, status=400)
+
+        filename = f"attendance_report_{report_filters['date_from']}_{report_filters['date_to']}"
+        return export_response(
+            iter_report_rows(report_filters),
+            ATTENDANCE_REPORT_COLUMNS,
+            filename,
+            file_format,
+            sheet_title="Attendance Report",
         )
 
 
-class SMSLogViewSet(viewsets.ModelViewSet):
+class SMSLogViewSet(CompactProjectionMixin, viewsets.ModelViewSet):
     """ViewSet for viewing and managing SMS logs"""
 
     queryset = SMSLog.objects.select_related("student", "parent", "attendance").all()
     serializer_class = SMSLogSerializer
+    pagination_class = SMSLogPagination
+    compact_fields = SMS_LOG_COMPACT_FIELDS
     filter_backends = [
         DjangoFilterBackend,
-        filters.SearchFilter,
+        RankedSearchFilter,
         filters.OrderingFilter,
     ]
-    search_fields = [
-        "student__first_name",
-        "student__last_name",
-        "student__student_id",
-        "parent__first_name",
-        "parent__last_name",
-        "phone_number",
-    ]
-    filterset_fields = ["status", "student", "parent", "attendance"]
-    ordering_fields = ["created_at", "sent_at", "status"]
+    search_documents = {"student_id": Student, "parent_id": Parent}
+    # The number messaged, which the parent may have changed since
+    search_phone_fields = ["phone_number"]
+    filterset_fields = {
+        "status": ["exact", "in"],
+        "channel": ["exact"],
+        "student": ["exact"],
+        "parent": ["exact"],
+        "attendance": ["exact"],
+    }
+    ordering_fields = ["created_at", "sent_at", "delivered_at", "status"]
     ordering = ["-created_at"]
+    # The log also records WhatsApp messages; listings show SMS unless ?channel= is given
+    default_channel = "SMS"
+    default_channel_actions = ("list", "statistics", "export")
 
     def get_queryset(self):
         queryset = super().get_queryset()
+        if self.action in self.default_channel_actions and not self.request.query_params.get("channel"):
+            queryset = queryset.filter(channel=self.default_channel)
         # Filter by date range if provided
         date_from = self.request.query_params.get("date_from")
         date_to = self.request.query_params.get("date_to")
         student_id = self.request.query_params.get("student_id")
         branch_id = self.request.query_params.get("branch")
 
+        # Dates are device-local days, converted to UTC bounds so the
+        # created_at index is used
         if date_from:
-            queryset = queryset.filter(created_at__date__gte=date_from)
+            try:
+                start_date = datetime.strptime(date_from, "%Y-%m-%d").date()
+                queryset = queryset.filter(created_at__gte=get_local_day_bounds(start_date)[0])
+            except ValueError:
+                queryset = queryset.filter(created_at__gte=date_from)
         if date_to:
-            # Add 1 day to include the entire end date
             try:
                 end_date = datetime.strptime(date_to, "%Y-%m-%d").date()
-                end_date_plus_one = end_date + timedelta(days=1)
-                queryset = queryset.filter(created_at__date__lt=end_date_plus_one)
+                queryset = queryset.filter(created_at__lte=get_local_day_bounds(end_date)[1])
             except ValueError:
                 # If date format is invalid, fall back to original behavior
                 queryset = queryset.filter(created_at__lte=date_to)
@@ -816,7 +784,9 @@ class SMSLogViewSet(viewsets.ModelViewSet):
         queryset = self.get_queryset()
 
         total = queryset.count()
-        sent = queryset.filter(status="SENT").count()
+        # Delivered messages were sent too
+        sent = queryset.filter(status__in=["SENT", "DELIVERED"]).count()
+        delivered = queryset.filter(status="DELIVERED").count()
         failed = queryset.filter(status="FAILED").count()
         pending = queryset.filter(status="PENDING").count()
 
@@ -824,12 +794,50 @@ class SMSLogViewSet(viewsets.ModelViewSet):
             {
                 "total": total,
                 "sent": sent,
+                "delivered": delivered,
                 "failed": failed,
                 "pending": pending,
                 "success_rate": round((sent / total * 100), 2) if total > 0 else 0,
+                "delivery_rate": round((delivered / sent * 100), 2) if sent > 0 else 0,
             }
         )
 
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """Download the filtered SMS logs as CSV or XLSX (file_format=csv|xlsx)"""
+        file_format = request.query_params.get("file_format", "csv")
+        if file_format not in ("csv", "xlsx"):
+            return Response({"error": "file_format must be csv or xlsx"}, status=400)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        filename = f"sms_logs_{timezone.now().date().isoformat()}"
+        return export_response(
+            iter_sms_log_rows(queryset),
+            SMS_LOG_COLUMNS,
+            filename,
+            file_format,
+            sheet_title="SMS Logs",
+        )
+
+
+class SMSLogArchiveViewSet(SMSLogViewSet):
+    """
+    Read-only SMS logs of archived school years (see attendance.archive).
+
+    Same filters, statistics and export as the SMS logs, on the archive table.
+    """
+
+    http_method_names = ["get", "head", "options"]
+    queryset = SMSLogArchive.objects.select_related("student", "parent").all()
+    serializer_class = SMSLogArchiveSerializer
+    filterset_fields = {
+        "status": ["exact", "in"],
+        "channel": ["exact"],
+        "student": ["exact"],
+        "parent": ["exact"],
+        "attendance_id": ["exact"],
+    }
+
 
 class AttendanceSettingsViewSet(viewsets.ModelViewSet):
     """ViewSet for managing attendance settings (singleton pattern)"""
@@ -876,3 +884,98 @@ class AttendanceSettingsViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
         self.perform_update(serializer)
         return Response(serializer.data)
+
+
+class ReportJobViewSet(
+    mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet
+):
+    """ViewSet for background report jobs (request, poll status, download result)"""
+
+    queryset = ReportJob.objects.all()
+    serializer_class = ReportJobSerializer
+
+    def create(self, request, *args, **kwargs):
+        """Request a report; identical concurrent requests share one job"""
+        serializer = ReportJobCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        report_filters = {
+            "branch_id": data.get("branch_id"),
+            "grade": data.get("grade"),
+            "level": data.get("level"),
+            "class_name": data.get("class_name"),
+            "date_from": data["date_from"].isoformat(),
+            "date_to": data["date_to"].isoformat(),
+        }
+        job = start_report_job(report_filters, data["file_format"], request.user)
+
+        response_status = (
+            status.HTTP_200_OK if job.status == "COMPLETED" else status.HTTP_202_ACCEPTED
+        )
+        return Response(self.get_serializer(job).data, status=response_status)
+
+    @action(detail=True, methods=["get"])
+    def download(self, request, pk=None):
+        """Download a completed report job's result"""
+        job = self.get_object()
+        if job.status != "COMPLETED" or job.is_expired:
+            return Response(
+                {"error": f"Report is not available (status: {job.status})"},
+                status=status.HTTP_409_CONFLICT,
+            )
+        if job.file_format == "json":
+            return Response(job.result)
+        return FileResponse(
+            job.file.open("rb"),
+            as_attachment=True,
+            filename=os.path.basename(job.file.name),
+        )
+
+
+class SMSDeliveryReceiptView(APIView):
+    """Mora delivery reports, posted to this URL with ?token=<SMS_WEBHOOK_TOKEN>"""
+
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        token = getattr(settings, "SMS_WEBHOOK_TOKEN", None)
+        if not token or not hmac.compare_digest(request.query_params.get("token", ""), token):
+            return Response({"error": "Invalid token"}, status=status.HTTP_403_FORBIDDEN)
+        # Acknowledged once queued; receipts are applied in batches by a periodic task
+        queued = queue_receipts(parse_sms_receipts(request.data))
+        return Response({"queued": queued})
+
+
+class WhatsAppStatusWebhookView(APIView):
+    """WhatsApp Cloud API webhook: subscription check (GET) and signed status callbacks (POST)"""
+
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        verify_token = getattr(settings, "WHATSAPP_WEBHOOK_VERIFY_TOKEN", None)
+        if (
+            verify_token
+            and request.query_params.get("hub.mode") == "subscribe"
+            and hmac.compare_digest(request.query_params.get("hub.verify_token", ""), verify_token)
+        ):
+            return HttpResponse(request.query_params.get("hub.challenge", ""), content_type="text/plain")
+        return Response({"error": "Verification failed"}, status=status.HTTP_403_FORBIDDEN)
+
+    def post(self, request):
+        app_secret = getattr(settings, "WHATSAPP_APP_SECRET", None)
+        body = request.body
+        if not app_secret:
+            return Response({"error": "Invalid signature"}, status=status.HTTP_403_FORBIDDEN)
+        expected = "sha256=" + hmac.new(app_secret.encode(), body, hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(request.META.get("HTTP_X_HUB_SIGNATURE_256", ""), expected):
+            return Response({"error": "Invalid signature"}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return Response({"error": "Invalid JSON"}, status=status.HTTP_400_BAD_REQUEST)
+        # Acknowledged once queued; receipts are applied in batches by a periodic task
+        queued = queue_receipts(parse_whatsapp_receipts(payload))
+        return Response({"queued": queued})
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.search import rebuild_search_documents
+
+
+class Command(BaseCommand):
+    help = 'Recompute the normalized search documents of every student and parent'
+
+    def handle(self, *args, **options):
+        students, parents = rebuild_search_documents()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt search documents for {students} student(s) and {parents} parent(s)'))
@@ -0,0 +1,141 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:45
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+# The document builder of core.search as of this migration, frozen so later
+# changes to it do not change what this migration writes. Documents built
+# here are brought up to date by the rebuild_search_documents command.
+ARABIC_DIACRITICS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed]')
+ARABIC_TRANSLATION = str.maketrans({
+    '\u0623': '\u0627',
+    '\u0625': '\u0627',
+    '\u0622': '\u0627',
+    '\u0671': '\u0627',
+    '\u0649': '\u064a',
+    '\u0626': '\u064a',
+    '\u0624': '\u0648',
+    '\u0629': '\u0647',
+    '\u0640': None,
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},
+    **{chr(0x06f0 + digit): str(digit) for digit in range(10)},
+})
+SEPARATORS = re.compile(r'[^\w@.\-]+')
+COUNTRY_CODE = '966'
+
+
+def normalize_text(value):
+    if not value:
+        return ''
+    value = unicodedata.normalize('NFKC', str(value)).lower()
+    value = ARABIC_DIACRITICS.sub('', value).translate(ARABIC_TRANSLATION)
+    return ' '.join(SEPARATORS.sub(' ', value).split())
+
+
+def phone_variants(phone):
+    digits = re.sub(r'\D', '', normalize_text(phone))
+    if not digits:
+        return []
+    national = digits
+    if national.startswith('00'):
+        national = national[2:]
+    if national.startswith(COUNTRY_CODE):
+        national = national[len(COUNTRY_CODE):]
+    national = national.lstrip('0')
+    if not national:
+        return [digits]
+    return list(dict.fromkeys([digits, national, f'0{national}', f'{COUNTRY_CODE}{national}']))
+
+
+def build_document(*parts):
+    words = []
+    for part in parts:
+        words.extend(normalize_text(part).split())
+    return ' '.join(dict.fromkeys(words))
+
+
+def student_document(student, parents):
+    parts = [student.first_name, student.last_name, student.student_id]
+    for parent in parents:
+        parts.extend([parent.first_name, parent.last_name, *phone_variants(parent.phone_number)])
+    return build_document(*parts)
+
+
+def parent_document(parent, student_ids):
+    return build_document(
+        parent.first_name, parent.last_name, parent.email, *phone_variants(parent.phone_number), *student_ids
+    )
+
+
+def build_search_documents(apps, schema_editor):
+    Student = apps.get_model('core', 'Student')
+    Parent = apps.get_model('core', 'Parent')
+
+    students = []
+    for student in Student.objects.prefetch_related('parents').iterator(chunk_size=500):
+        student.search_document = student_document(student, student.parents.all())
+        students.append(student)
+        if len(students) >= 500:
+            Student.objects.bulk_update(students, ['search_document'])
+            students = []
+    Student.objects.bulk_update(students, ['search_document'])
+
+    parents = []
+    for parent in Parent.objects.prefetch_related('students').iterator(chunk_size=500):
+        parent.search_document = parent_document(parent, [student.student_id for student in parent.students.all()])
+        parents.append(parent)
+        if len(parents) >= 500:
+            Parent.objects.bulk_update(parents, ['search_document'])
+            parents = []
+    Parent.objects.bulk_update(parents, ['search_document'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_userprofile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parent',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False, help_text='Normalized search text (see core.search)'),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False, help_text='Normalized search text (see core.search)'),
+        ),
+        migrations.RunPython(build_search_documents, migrations.RunPython.noop),
+        # Trigram GIN indexes serve LIKE '%word%' and similarity searches on the
+        # documents. Servers without the pg_trgm contrib module (or without the
+        # privilege to create it) keep working with unindexed substring search.
+        migrations.RunSQL(
+            sql="""
+            DO $$
+            BEGIN
+                CREATE EXTENSION IF NOT EXISTS pg_trgm;
+            EXCEPTION WHEN feature_not_supported OR undefined_file OR insufficient_privilege THEN
+                RAISE NOTICE 'pg_trgm not available, search documents are not trigram indexed';
+            END
+            $$;
+            DO $$
+            BEGIN
+                IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+                    CREATE INDEX IF NOT EXISTS core_student_search_trgm
+                        ON core_student USING gin (search_document gin_trgm_ops);
+                    CREATE INDEX IF NOT EXISTS core_parent_search_trgm
+                        ON core_parent USING gin (search_document gin_trgm_ops);
+                END IF;
+            END
+            $$;
+            """,
+            reverse_sql="""
+            DROP INDEX IF EXISTS core_student_search_trgm;
+            DROP INDEX IF EXISTS core_parent_search_trgm;
+            """,
+        ),
+    ]
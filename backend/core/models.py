@@ -1,5 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_save, pre_save
+from django.dispatch import receiver
 
 
 class UserRole(models.TextChoices):
@@ -57,6 +59,7 @@ class Parent(models.Model):
     email = models.EmailField(unique=True)
     phone_number = models.CharField(max_length=15, blank=True)
     address = models.TextField(blank=True)
+    search_document = models.TextField(blank=True, default='', editable=False, help_text="Normalized search text (see core.search)")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -89,6 +92,7 @@ class Student(models.Model):
     branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='students', help_text="Branch this student belongs to")
     parents = models.ManyToManyField(Parent, related_name='students', blank=True)
     is_active = models.BooleanField(default=True)
+    search_document = models.TextField(blank=True, default='', editable=False, help_text="Normalized search text (see core.search)")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -102,3 +106,58 @@ class Student(models.Model):
     def full_name(self):
         return f"{self.first_name} {self.last_name}"
 
+
+@receiver(pre_save, sender=Student)
+@receiver(pre_save, sender=Parent)
+def set_initial_search_document(sender, instance, **kwargs):
+    """New rows are searchable right away by their own fields; links are added on commit"""
+    from .search import parent_document, student_document
+
+    if instance.pk is None:
+        if sender is Student:
+            instance.search_document = student_document(instance)
+        else:
+            instance.search_document = parent_document(instance)
+
+
+@receiver(post_save, sender=Student)
+def refresh_student_search(sender, instance, created, **kwargs):
+    """A changed student changes their own document and their parents' (student ID)"""
+    from .search import schedule_refresh
+
+    if not created:
+        schedule_refresh(
+            student_ids=[instance.pk],
+            parent_ids=instance.parents.values_list('id', flat=True),
+        )
+
+
+@receiver(post_save, sender=Parent)
+def refresh_parent_search(sender, instance, created, **kwargs):
+    """A changed parent changes their own document and their children's (name, phone)"""
+    from .search import schedule_refresh
+
+    if not created:
+        schedule_refresh(
+            student_ids=instance.students.values_list('id', flat=True),
+            parent_ids=[instance.pk],
+        )
+
+
+@receiver(m2m_changed, sender=Student.parents.through)
+def refresh_linked_search(sender, instance, action, reverse, pk_set, **kwargs):
+    """Linking or unlinking parents and students changes both sides' documents"""
+    from .search import schedule_refresh
+
+    if action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        return
+    if action == 'pre_clear':
+        # The cleared links are gone by post_clear; remember the other side now
+        related = instance.students if reverse else instance.parents
+        instance._search_cleared_ids = list(related.values_list('id', flat=True))
+        return
+    other_ids = list(pk_set or getattr(instance, '_search_cleared_ids', []))
+    if reverse:
+        schedule_refresh(student_ids=other_ids, parent_ids=[instance.pk])
+    else:
+        schedule_refresh(student_ids=[instance.pk], parent_ids=other_ids)
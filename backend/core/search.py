@@ -0,0 +1,271 @@
+"""
+Search documents for students and parents
+
+Each student and parent row carries a search_document: a normalized,
+denormalized text of everything the roster is searched by (names, IDs, the
+linked parents or children, email and phone numbers in local and
+international form). Normalization folds Arabic letter variants, strips
+diacritics and tatweel and maps Arabic-Indic digits to ASCII, so "أحمد",
+"احمد" and "اَحمد" all match. Documents are indexed with pg_trgm GIN indexes
+(migration 0008), which serve substring (LIKE) and similarity searches.
+
+Documents are kept current by signals in core.models: rows get a document
+when created, and changes to linked rows are refreshed in one batch when the
+transaction commits. rebuild_search_documents recomputes every document.
+"""
+import re
+import threading
+import unicodedata
+
+from django.db import connection, transaction
+from rest_framework import filters
+
+# Harakat, Quranic marks and superscript alef
+ARABIC_DIACRITICS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed]')
+ARABIC_TRANSLATION = str.maketrans({
+    '\u0623': '\u0627',  # alef with hamza above -> alef
+    '\u0625': '\u0627',  # alef with hamza below -> alef
+    '\u0622': '\u0627',  # alef with madda -> alef
+    '\u0671': '\u0627',  # alef wasla -> alef
+    '\u0649': '\u064a',  # alef maksura -> yeh
+    '\u0626': '\u064a',  # yeh with hamza -> yeh
+    '\u0624': '\u0648',  # waw with hamza -> waw
+    '\u0629': '\u0647',  # teh marbuta -> heh
+    '\u0640': None,  # tatweel
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},  # Arabic-Indic digits
+    **{chr(0x06f0 + digit): str(digit) for digit in range(10)},  # Eastern Arabic-Indic digits
+})
+# Everything except letters, digits and the characters of emails and IDs
+SEPARATORS = re.compile(r'[^\w@.\-]+')
+
+COUNTRY_CODE = '966'
+
+SEARCH_REFRESH_BATCH_SIZE = 500
+
+
+def normalize_text(value):
+    """Lowercased, Arabic-normalized text with single spaces between words"""
+    if not value:
+        return ''
+    value = unicodedata.normalize('NFKC', str(value)).lower()
+    value = ARABIC_DIACRITICS.sub('', value).translate(ARABIC_TRANSLATION)
+    return ' '.join(SEPARATORS.sub(' ', value).split())
+
+
+def phone_variants(phone):
+    """The digits of a phone number as dialled locally (05...), internationally (9665...) and bare"""
+    digits = re.sub(r'\D', '', normalize_text(phone))
+    if not digits:
+        return []
+    national = digits
+    if national.startswith('00'):
+        national = national[2:]
+    if national.startswith(COUNTRY_CODE):
+        national = national[len(COUNTRY_CODE):]
+    national = national.lstrip('0')
+    if not national:
+        return [digits]
+    return list(dict.fromkeys([digits, national, f'0{national}', f'{COUNTRY_CODE}{national}']))
+
+
+def build_document(*parts):
+    words = []
+    for part in parts:
+        words.extend(normalize_text(part).split())
+    return ' '.join(dict.fromkeys(words))
+
+
+def student_document(student, parents=()):
+    """Search document of a student: names, student ID, parents' names and phones"""
+    parts = [student.first_name, student.last_name, student.student_id]
+    for parent in parents:
+        parts.extend([parent.first_name, parent.last_name, *phone_variants(parent.phone_number)])
+    return build_document(*parts)
+
+
+def parent_document(parent, student_ids=()):
+    """Search document of a parent: names, email, phone and the children's student IDs"""
+    return build_document(
+        parent.first_name, parent.last_name, parent.email, *phone_variants(parent.phone_number), *student_ids
+    )
+
+
+def refresh_student_documents(student_ids):
+    """Recompute the search documents of the given students"""
+    from .models import Student
+
+    student_ids = list(student_ids)
+    for start in range(0, len(student_ids), SEARCH_REFRESH_BATCH_SIZE):
+        students = list(
+            Student.objects.filter(id__in=student_ids[start:start + SEARCH_REFRESH_BATCH_SIZE])
+            .only('id', 'first_name', 'last_name', 'student_id', 'search_document')
+            .prefetch_related('parents')
+        )
+        changed = []
+        for student in students:
+            document = student_document(student, student.parents.all())
+            if document != student.search_document:
+                student.search_document = document
+                changed.append(student)
+        Student.objects.bulk_update(changed, ['search_document'])
+
+
+def refresh_parent_documents(parent_ids):
+    """Recompute the search documents of the given parents"""
+    from .models import Parent
+
+    parent_ids = list(parent_ids)
+    for start in range(0, len(parent_ids), SEARCH_REFRESH_BATCH_SIZE):
+        parents = list(
+            Parent.objects.filter(id__in=parent_ids[start:start + SEARCH_REFRESH_BATCH_SIZE])
+            .only('id', 'first_name', 'last_name', 'email', 'phone_number', 'search_document')
+            .prefetch_related('students')
+        )
+        changed = []
+        for parent in parents:
+            document = parent_document(parent, [student.student_id for student in parent.students.all()])
+            if document != parent.search_document:
+                parent.search_document = document
+                changed.append(parent)
+        Parent.objects.bulk_update(changed, ['search_document'])
+
+
+# IDs waiting for the current thread's transaction to commit
+_pending = threading.local()
+
+
+def _pending_ids():
+    if not hasattr(_pending, 'students'):
+        _pending.students, _pending.parents = set(), set()
+    return _pending.students, _pending.parents
+
+
+def _flush_pending():
+    students, parents = _pending_ids()
+    student_ids, parent_ids = set(students), set(parents)
+    students.clear()
+    parents.clear()
+    refresh_student_documents(student_ids)
+    refresh_parent_documents(parent_ids)
+
+
+def schedule_refresh(student_ids=(), parent_ids=()):
+    """
+    Refresh documents once the current transaction commits.
+
+    Changes made inside one transaction (e.g. a bulk upload) are refreshed
+    together, in a few batched queries.
+    """
+    students, parents = _pending_ids()
+    students.update(student_ids)
+    parents.update(parent_ids)
+    if not connection.in_atomic_block:
+        _flush_pending()
+    elif not any(callback is _flush_pending for _, callback, _ in connection.run_on_commit):
+        transaction.on_commit(_flush_pending)
+
+
+def rebuild_search_documents():
+    """
+    Recompute every student and parent search document.
+
+    Returns:
+        tuple: (students, parents) processed
+    """
+    from .models import Parent, Student
+
+    student_ids = list(Student.objects.order_by('id').values_list('id', flat=True))
+    parent_ids = list(Parent.objects.order_by('id').values_list('id', flat=True))
+    refresh_student_documents(student_ids)
+    refresh_parent_documents(parent_ids)
+    return len(student_ids), len(parent_ids)
+
+
+_trigram_available = {}
+
+
+def trigram_available():
+    """Whether pg_trgm is installed (similarity matching and ranking need it)"""
+    if connection.vendor != 'postgresql':
+        return False
+    if connection.alias not in _trigram_available:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+            _trigram_available[connection.alias] = cursor.fetchone()[0]
+    return _trigram_available[connection.alias]
+
+
+def document_condition(query, field='search_document'):
+    """
+    Q matching documents containing every word of a normalized query, or,
+    with pg_trgm, documents with a word similar to the query (typos).
+    """
+    from django.db.models import Q
+
+    condition = Q()
+    for word in query.split():
+        condition &= Q(**{f'{field}__contains': word})
+    if trigram_available():
+        condition |= Q(**{f'{field}__trigram_word_similar': query})
+    return condition
+
+
+def phone_condition(query, field):
+    """
+    Q matching phone numbers containing a query that is a phone number,
+    however either is dialled (local or international form); None for other
+    queries
+    """
+    from django.db.models import Q
+
+    digits = query.replace(' ', '')
+    if not digits.isdigit():
+        return None
+    condition = Q()
+    for variant in phone_variants(digits):
+        condition |= Q(**{f'{field}__contains': variant})
+    return condition
+
+
+class RankedSearchFilter(filters.SearchFilter):
+    """
+    ?search= over the student and parent search documents.
+
+    Views declare search_documents: {lookup: document model}. A 'pk' lookup
+    on the view's own model filters its document directly and, unless
+    ?ordering= is given, orders results by trigram similarity. Other lookups
+    (e.g. 'student_id') filter on the IDs of matching documents, which keeps
+    large tables like attendance and SMS logs free of joins and DISTINCT.
+    Phone number columns of the view's own model listed in
+    search_phone_fields also match numeric queries.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search_documents = getattr(view, 'search_documents', None)
+        query = normalize_text(' '.join(self.get_search_terms(request)))
+        if not search_documents or not query:
+            return super().filter_queryset(request, queryset, view)
+
+        from django.db.models import Q
+
+        condition = Q()
+        rank_own_model = False
+        for lookup, model in search_documents.items():
+            if lookup == 'pk' and model is queryset.model:
+                condition |= document_condition(query)
+                rank_own_model = True
+            else:
+                matching = model.objects.filter(document_condition(query)).values('pk')
+                condition |= Q(**{f'{lookup}__in': matching})
+        for field in getattr(view, 'search_phone_fields', ()):
+            phone_match = phone_condition(query, field)
+            if phone_match is not None:
+                condition |= phone_match
+        queryset = queryset.filter(condition)
+
+        if rank_own_model and trigram_available() and not request.query_params.get(filters.OrderingFilter.ordering_param):
+            from django.contrib.postgres.search import TrigramWordSimilarity
+            queryset = queryset.annotate(
+                search_rank=TrigramWordSimilarity(query, 'search_document')
+            ).order_by('-search_rank', *queryset.query.order_by or ['-pk'])
+        return queryset
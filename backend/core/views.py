@@ -11,6 +11,7 @@ from datetime import datetime
 import re
 from .models import Parent, Student, Branch, Grade, UserProfile, UserRole
 from .serializers import ParentSerializer, StudentSerializer, BranchSerializer, UserSerializer, UserCreateSerializer
+from .search import RankedSearchFilter
 
 
 class BranchViewSet(viewsets.ModelViewSet):
@@ -25,8 +26,9 @@ class BranchViewSet(viewsets.ModelViewSet):
 class ParentViewSet(viewsets.ModelViewSet):
     queryset = Parent.objects.prefetch_related('students').all()
     serializer_class = ParentSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['first_name', 'last_name', 'email', 'phone_number', 'students__student_id']
+    # Search runs last so its relevance order wins unless ?ordering= is given
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, RankedSearchFilter]
+    search_documents = {'pk': Parent}
     filterset_fields = ['email']
     ordering_fields = ['created_at', 'first_name', 'last_name']
     ordering = ['-created_at']
@@ -164,8 +166,9 @@ class ParentViewSet(viewsets.ModelViewSet):
 class StudentViewSet(viewsets.ModelViewSet):
     queryset = Student.objects.prefetch_related('parents').all()
     serializer_class = StudentSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['first_name', 'last_name', 'student_id', 'parents__first_name', 'parents__last_name']
+    # Search runs last so its relevance order wins unless ?ordering= is given
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, RankedSearchFilter]
+    search_documents = {'pk': Student}
     filterset_fields = ['grade', 'level', 'class_name', 'gender', 'is_active', 'parents', 'branch']
     ordering_fields = ['created_at', 'first_name', 'last_name', 'student_id']
     ordering = ['-created_at']
@@ -1,9 +1,24 @@
 """
-Custom middleware to exempt API routes from CSRF
+Custom middleware: CSRF exemption for API routes and per-request SQL profiling
 """
+import heapq
+import json
+import logging
+import random
+import sys
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
 from django.utils.deprecation import MiddlewareMixin
 from django.views.decorators.csrf import csrf_exempt
 
+slow_request_logger = logging.getLogger('schoolhub.slow_requests')
+
+# Frames from these paths are skipped when looking for the code that issued a query
+_LIBRARY_MARKERS = ('site-packages', 'dist-packages', f'{sys.prefix}/lib')
+
 
 class DisableCSRFForAPI(MiddlewareMixin):
     """
@@ -14,3 +29,113 @@ class DisableCSRFForAPI(MiddlewareMixin):
             setattr(request, '_dont_enforce_csrf_checks', True)
         return None
 
+
+def _query_origin():
+    """First project frame (path:line in function) on the current stack"""
+    base_dir = str(settings.BASE_DIR)
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (
+            filename.startswith(base_dir)
+            and filename != __file__
+            and not any(marker in filename for marker in _LIBRARY_MARKERS)
+        ):
+            return f'{filename[len(base_dir) + 1:]}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+class QueryProfile:
+    """
+    Database execute wrapper counting statements and DB time for one request.
+
+    Only the top_n slowest statements are kept; the stack is only walked for a
+    statement that makes it into the top list, so the common path is two clock
+    reads and a counter increment.
+    """
+
+    def __init__(self, top_n):
+        self.top_n = top_n
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = []  # min-heap of (duration, sequence, sql, origin)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            if self.top_n and (len(self.slowest) < self.top_n or duration > self.slowest[0][0]):
+                entry = (duration, self.count, sql, _query_origin())
+                if len(self.slowest) < self.top_n:
+                    heapq.heappush(self.slowest, entry)
+                else:
+                    heapq.heapreplace(self.slowest, entry)
+
+    def slowest_statements(self):
+        return [
+            {'duration_ms': round(duration * 1000, 2), 'sql': sql[:1000], 'origin': origin}
+            for duration, _, sql, origin in sorted(self.slowest, reverse=True)
+        ]
+
+
+class SQLProfilerMiddleware:
+    """
+    Middleware counting queries and DB time per request.
+
+    Totals are returned in a Server-Timing header (db and app entries) to
+    staff users, and to everyone with DEBUG on. Requests slower than SQL_PROFILER_SLOW_REQUEST_MS are sampled at
+    SQL_PROFILER_SAMPLE_RATE into the 'schoolhub.slow_requests' logger as one
+    JSON record, with the slowest statements and the code that issued them.
+    Time spent streaming a response body after the view returns is not counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'SQL_PROFILER_ENABLED', True)
+        self.top_n = getattr(settings, 'SQL_PROFILER_TOP_N', 5)
+        self.slow_request_ms = getattr(settings, 'SQL_PROFILER_SLOW_REQUEST_MS', 1000)
+        self.sample_rate = getattr(settings, 'SQL_PROFILER_SAMPLE_RATE', 1.0)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        profile = QueryProfile(self.top_n)
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile))
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - start) * 1000
+        db_ms = profile.duration * 1000
+
+        if self.show_timing(request):
+            response['Server-Timing'] = (
+                f'db;desc="{profile.count} queries";dur={db_ms:.2f}, app;dur={total_ms:.2f}'
+            )
+
+        if total_ms >= self.slow_request_ms and random.random() < self.sample_rate:
+            slow_request_logger.warning(json.dumps({
+                'event': 'slow_request',
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(total_ms, 2),
+                'db_ms': round(db_ms, 2),
+                'query_count': profile.count,
+                'slowest_queries': profile.slowest_statements(),
+            }))
+        return response
+
+    @staticmethod
+    def show_timing(request):
+        """Whether the client may see the profile (DRF sets request.user once it authenticates)"""
+        if settings.DEBUG:
+            return True
+        user = getattr(request, 'user', None)
+        return bool(user is not None and user.is_authenticated and user.is_staff)
@@ -27,6 +27,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
     'django_celery_beat', 
@@ -36,6 +37,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'schoolhub.middleware.SQLProfilerMiddleware',  # Query count/DB time per request
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -100,6 +102,15 @@ TIME_ZONE = env('TIME_ZONE')
 USE_I18N = True
 USE_TZ = True
 
+# School calendar: weekdays without school (Python weekday numbers, Monday=0)
+# Default is Friday and Saturday
+SCHOOL_WEEKEND_DAYS = env.list('SCHOOL_WEEKEND_DAYS', cast=int, default=[4, 5])
+# Month the school year starts in (1-12); closed school years can be archived
+SCHOOL_YEAR_START_MONTH = env.int('SCHOOL_YEAR_START_MONTH', default=8)
+# Local time (TIME_ZONE) of the end-of-school-day job recording absences
+ABSENCE_JOB_HOUR = env.int('ABSENCE_JOB_HOUR', default=15)
+ABSENCE_JOB_MINUTE = env.int('ABSENCE_JOB_MINUTE', default=0)
+
 # Static files
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
@@ -146,6 +157,91 @@ SMS_USERNAME = env('SMS_USERNAME', default=None)
 SMS_SENDER_NAME = env('SMS_SENDER_NAME', default=None)
 SMS_SENDER_NUMBER = env('SMS_SENDER_NUMBER', default=None)
 SMS_API_BASE_URL = 'https://mora-sa.com/api/v1'
+# Queued SMS wait this many seconds so identical texts are sent as one
+# multi-number submission (of at most SMS_BATCH_MAX_NUMBERS numbers)
+SMS_BATCH_WINDOW_SECONDS = env.float('SMS_BATCH_WINDOW_SECONDS', default=2)
+SMS_BATCH_MAX_NUMBERS = env.int('SMS_BATCH_MAX_NUMBERS', default=100)
+
+# Provider HTTP clients: pooled keep-alive sessions per worker process, with
+# connect/read timeouts (seconds) and retries of unsent requests per provider
+PROVIDER_HTTP_POOL_SIZE = env.int('PROVIDER_HTTP_POOL_SIZE', default=10)
+SMS_HTTP_CONNECT_TIMEOUT = env.float('SMS_HTTP_CONNECT_TIMEOUT', default=5)
+SMS_HTTP_READ_TIMEOUT = env.float('SMS_HTTP_READ_TIMEOUT', default=30)
+SMS_HTTP_RETRIES = env.int('SMS_HTTP_RETRIES', default=2)
+WHATSAPP_HTTP_CONNECT_TIMEOUT = env.float('WHATSAPP_HTTP_CONNECT_TIMEOUT', default=5)
+WHATSAPP_HTTP_READ_TIMEOUT = env.float('WHATSAPP_HTTP_READ_TIMEOUT', default=20)
+WHATSAPP_HTTP_RETRIES = env.int('WHATSAPP_HTTP_RETRIES', default=2)
+
+# Provider rate limits (token buckets in Redis shared by all workers):
+# sustained requests per second and burst size; 0 per second disables a limit.
+# Senders wait up to RATE_LIMIT_MAX_WAIT_SECONDS for capacity, then reschedule
+SMS_RATE_LIMIT_PER_SECOND = env.float('SMS_RATE_LIMIT_PER_SECOND', default=5)
+SMS_RATE_LIMIT_BURST = env.int('SMS_RATE_LIMIT_BURST', default=10)
+WHATSAPP_RATE_LIMIT_PER_SECOND = env.float('WHATSAPP_RATE_LIMIT_PER_SECOND', default=50)
+WHATSAPP_RATE_LIMIT_BURST = env.int('WHATSAPP_RATE_LIMIT_BURST', default=80)
+RATE_LIMIT_MAX_WAIT_SECONDS = env.float('RATE_LIMIT_MAX_WAIT_SECONDS', default=10)
+
+# Provider circuit breakers: a provider whose failures (no response, 5xx, calls
+# slower than CIRCUIT_BREAKER_SLOW_CALL_SECONDS) reach CIRCUIT_BREAKER_FAILURE_RATIO
+# of at least CIRCUIT_BREAKER_MIN_REQUESTS requests within the window is not
+# called for CIRCUIT_BREAKER_OPEN_SECONDS; fatal account errors (e.g. insufficient
+# balance) stop it for CIRCUIT_BREAKER_FATAL_OPEN_SECONDS. Messages wait in the
+# outbox, and one probe request resumes sending once the provider recovers.
+# Each can be overridden per provider (SMS_CIRCUIT_BREAKER_OPEN_SECONDS, ...)
+CIRCUIT_BREAKER_ENABLED = env.bool('CIRCUIT_BREAKER_ENABLED', default=True)
+CIRCUIT_BREAKER_WINDOW_SECONDS = env.int('CIRCUIT_BREAKER_WINDOW_SECONDS', default=60)
+CIRCUIT_BREAKER_MIN_REQUESTS = env.int('CIRCUIT_BREAKER_MIN_REQUESTS', default=10)
+CIRCUIT_BREAKER_FAILURE_RATIO = env.float('CIRCUIT_BREAKER_FAILURE_RATIO', default=0.5)
+CIRCUIT_BREAKER_SLOW_CALL_SECONDS = env.float('CIRCUIT_BREAKER_SLOW_CALL_SECONDS', default=10)
+CIRCUIT_BREAKER_OPEN_SECONDS = env.int('CIRCUIT_BREAKER_OPEN_SECONDS', default=30)
+CIRCUIT_BREAKER_FATAL_OPEN_SECONDS = env.int('CIRCUIT_BREAKER_FATAL_OPEN_SECONDS', default=600)
+CIRCUIT_BREAKER_PROBE_SECONDS = env.int('CIRCUIT_BREAKER_PROBE_SECONDS', default=45)
+
+# Notification outbox: notifications are queued with the attendance record and
+# sent by dispatch workers, retried with exponential backoff (base doubled per
+# attempt, capped) and dead-lettered after the last attempt
+NOTIFICATION_OUTBOX_BATCH_SIZE = env.int('NOTIFICATION_OUTBOX_BATCH_SIZE', default=50)
+NOTIFICATION_OUTBOX_MAX_ATTEMPTS = env.int('NOTIFICATION_OUTBOX_MAX_ATTEMPTS', default=6)
+NOTIFICATION_OUTBOX_RETRY_BASE_SECONDS = env.int('NOTIFICATION_OUTBOX_RETRY_BASE_SECONDS', default=30)
+NOTIFICATION_OUTBOX_RETRY_MAX_SECONDS = env.int('NOTIFICATION_OUTBOX_RETRY_MAX_SECONDS', default=3600)
+# A claimed batch not finished within the lease is picked up by another worker;
+# the lease is raised to twice the longest provider request, and requests that
+# could outlast it are not started
+NOTIFICATION_OUTBOX_LEASE_SECONDS = env.int('NOTIFICATION_OUTBOX_LEASE_SECONDS', default=300)
+NOTIFICATION_OUTBOX_RETENTION_DAYS = env.int('NOTIFICATION_OUTBOX_RETENTION_DAYS', default=14)
+# Punches of the same student, type and local day closer than this to a
+# notified punch are not notified again (0 disables)
+NOTIFICATION_SUPPRESSION_WINDOW_SECONDS = env.int('NOTIFICATION_SUPPRESSION_WINDOW_SECONDS', default=600)
+# Time budget of one dispatch task, dispatch tasks started for a large sync,
+# and interval of the periodic dispatch task
+NOTIFICATION_DISPATCH_SECONDS = env.int('NOTIFICATION_DISPATCH_SECONDS', default=50)
+NOTIFICATION_DISPATCH_CONCURRENCY = env.int('NOTIFICATION_DISPATCH_CONCURRENCY', default=4)
+NOTIFICATION_DISPATCH_INTERVAL_SECONDS = env.int('NOTIFICATION_DISPATCH_INTERVAL_SECONDS', default=30)
+# Delivery receipt webhooks: Mora reports must carry ?token=SMS_WEBHOOK_TOKEN,
+# WhatsApp callbacks are signed with WHATSAPP_APP_SECRET (and the subscription
+# is verified with WHATSAPP_WEBHOOK_VERIFY_TOKEN). Queued receipts are applied
+# in batches every DELIVERY_RECEIPT_INTERVAL_SECONDS to logs created within
+# DELIVERY_RECEIPT_LOOKBACK_DAYS
+SMS_WEBHOOK_TOKEN = env('SMS_WEBHOOK_TOKEN', default=None)
+WHATSAPP_APP_SECRET = env('WHATSAPP_APP_SECRET', default=None)
+WHATSAPP_WEBHOOK_VERIFY_TOKEN = env('WHATSAPP_WEBHOOK_VERIFY_TOKEN', default=None)
+DELIVERY_RECEIPT_INTERVAL_SECONDS = env.int('DELIVERY_RECEIPT_INTERVAL_SECONDS', default=10)
+DELIVERY_RECEIPT_BATCH_SIZE = env.int('DELIVERY_RECEIPT_BATCH_SIZE', default=1000)
+DELIVERY_RECEIPT_LOOKBACK_DAYS = env.int('DELIVERY_RECEIPT_LOOKBACK_DAYS', default=7)
+# Dispatcher used by the dispatch task: 'async' sends a claimed batch's requests
+# concurrently from one worker (at most <PROVIDER>_ASYNC_CONCURRENCY in flight
+# per provider), 'sync' sends them one at a time
+NOTIFICATION_DISPATCH_MODE = env('NOTIFICATION_DISPATCH_MODE', default='async')
+NOTIFICATION_ASYNC_BATCH_SIZE = env.int('NOTIFICATION_ASYNC_BATCH_SIZE', default=500)
+SMS_ASYNC_CONCURRENCY = env.int('SMS_ASYNC_CONCURRENCY', default=50)
+WHATSAPP_ASYNC_CONCURRENCY = env.int('WHATSAPP_ASYNC_CONCURRENCY', default=100)
+# Channel backends (dotted paths, see attendance.channel_backends): the real
+# providers by default; InMemoryBackend, or MoraStubBackend/WhatsAppStubBackend
+# with a local stub provider at NOTIFICATION_STUB_URL (manage.py
+# run_provider_stub), for offline load tests
+SMS_BACKEND = env('SMS_BACKEND', default='attendance.channel_backends.MoraBackend')
+WHATSAPP_BACKEND = env('WHATSAPP_BACKEND', default='attendance.channel_backends.WhatsAppCloudBackend')
+NOTIFICATION_STUB_URL = env('NOTIFICATION_STUB_URL', default='http://127.0.0.1:8025')
 
 # Celery Configuration
 # Use a different Redis database (1) to avoid conflicts with other projects
@@ -163,3 +259,24 @@ CELERY_TASK_REJECT_ON_WORKER_LOST = True
 CELERY_TASK_ACKS_LATE = True
 CELERY_WORKER_PREFETCH_MULTIPLIER = 1
 
+
+# Redis Configuration (application data: live counters, locks, rate limits)
+# Defaults to the Celery broker so no extra service needs to be configured
+REDIS_URL = env('REDIS_URL', default=CELERY_BROKER_URL)
+REDIS_SOCKET_TIMEOUT = env.float('REDIS_SOCKET_TIMEOUT', default=0.5)
+
+# Background report jobs
+# Results of reports that include today expire after this many seconds;
+# reports covering only past days are cached indefinitely
+REPORT_JOB_TTL_SECONDS = env.int('REPORT_JOB_TTL_SECONDS', default=900)
+REPORT_JOB_STALE_SECONDS = env.int('REPORT_JOB_STALE_SECONDS', default=1800)
+
+# Attendance archival: rows moved per batch by the archive_attendance command
+ARCHIVE_BATCH_SIZE = env.int('ARCHIVE_BATCH_SIZE', default=5000)
+
+# SQL profiling middleware: Server-Timing header for staff users (everyone with
+# DEBUG) and a sampled structured log ('schoolhub.slow_requests') for slow requests
+SQL_PROFILER_ENABLED = env.bool('SQL_PROFILER_ENABLED', default=True)
+SQL_PROFILER_SLOW_REQUEST_MS = env.int('SQL_PROFILER_SLOW_REQUEST_MS', default=1000)
+SQL_PROFILER_SAMPLE_RATE = env.float('SQL_PROFILER_SAMPLE_RATE', default=1.0)
+SQL_PROFILER_TOP_N = env.int('SQL_PROFILER_TOP_N', default=5)
@@ -42,6 +42,19 @@ export const getAttendanceReport = async (params) => {
   return response.data
 }
 
+export const getAttendanceRegister = async (params) => {
+  const response = await client.get('/attendance/records/attendance_register/', { params })
+  return response.data
+}
+
+export const exportAttendanceReport = async (params) => {
+  const response = await client.get('/attendance/records/attendance_report_export/', {
+    params,
+    responseType: 'blob',
+  })
+  return response.data
+}
+
 export const deleteAttendanceRecord = async (id) => {
   const response = await client.delete(`/attendance/records/${id}/`)
   return response.data
@@ -1,7 +1,10 @@
 import client from './client'
 
-export const getSMSLogs = async (params) => {
-  const response = await client.get('/attendance/sms-logs/', { params })
+// Logs of archived school years are served read-only by a separate endpoint
+const smsLogsPath = (archived) => (archived ? '/attendance/sms-logs-archive/' : '/attendance/sms-logs/')
+
+export const getSMSLogs = async (params, archived = false) => {
+  const response = await client.get(smsLogsPath(archived), { params })
   return response.data
 }
 
@@ -15,8 +18,16 @@ export const deleteSMSLog = async (id) => {
   return response.data
 }
 
-export const getSMSStatistics = async (params) => {
-  const response = await client.get('/attendance/sms-logs/statistics/', { params })
+export const getSMSStatistics = async (params, archived = false) => {
+  const response = await client.get(`${smsLogsPath(archived)}statistics/`, { params })
   return response.data
 }
 
+
+export const exportSMSLogs = async (params, archived = false) => {
+  const response = await client.get(`${smsLogsPath(archived)}export/`, {
+    params,
+    responseType: 'blob',
+  })
+  return response.data
+}
@@ -25,6 +25,7 @@ import DataTable from '../components/DataTable'
 import { format } from 'date-fns'
 import { formatTimestampInOriginalTimezone } from '../utils/dateFormat'
 import CheckCircleIcon from '@mui/icons-material/CheckCircle'
+import DoneAllIcon from '@mui/icons-material/DoneAll'
 import ErrorIcon from '@mui/icons-material/Error'
 import HourglassEmptyIcon from '@mui/icons-material/HourglassEmpty'
 
@@ -38,6 +39,7 @@ function SMSLogs() {
   const [selectedStatus, setSelectedStatus] = useState('')
   const [dateFrom, setDateFrom] = useState('')
   const [dateTo, setDateTo] = useState('')
+  const [archived, setArchived] = useState(false)
   const [snackbar, setSnackbar] = useState({ open: false, message: '', severity: 'success' })
   const queryClient = useQueryClient()
   const { t } = useTranslation()
@@ -57,19 +59,20 @@ function SMSLogs() {
   })
 
   const { data: statisticsData } = useQuery({
-    queryKey: ['sms-statistics', selectedBranch, dateFrom, dateTo],
+    queryKey: ['sms-statistics', archived, selectedBranch, dateFrom, dateTo],
     queryFn: () => {
       const params = {}
       if (selectedBranch) params.branch = selectedBranch
       if (dateFrom) params.date_from = dateFrom
       if (dateTo) params.date_to = dateTo
-      return getSMSStatistics(params)
+      return getSMSStatistics(params, archived)
     },
   })
 
   const { data, isLoading } = useQuery({
     queryKey: [
       'sms-logs',
+      archived,
       page,
       searchValue,
       sortBy,
@@ -87,10 +90,12 @@ function SMSLogs() {
         ordering: sortOrder === 'asc' ? sortBy : `-${sortBy}`,
       }
       if (selectedBranch) params.branch = selectedBranch
-      if (selectedStatus) params.status = selectedStatus
+      // Delivered messages were sent too
+      if (selectedStatus === 'SENT') params.status__in = 'SENT,DELIVERED'
+      else if (selectedStatus) params.status = selectedStatus
       if (dateFrom) params.date_from = dateFrom
       if (dateTo) params.date_to = dateTo
-      return getSMSLogs(params)
+      return getSMSLogs(params, archived)
     },
     enabled: true,
     refetchOnWindowFocus: false,
@@ -103,6 +108,7 @@ function SMSLogs() {
   const getStatusChip = (status) => {
     const statusConfig = {
       SENT: { color: 'success', label: t('sms.status.sent'), icon: <CheckCircleIcon fontSize="small" /> },
+      DELIVERED: { color: 'success', label: t('sms.status.delivered'), icon: <DoneAllIcon fontSize="small" /> },
       FAILED: { color: 'error', label: t('sms.status.failed'), icon: <ErrorIcon fontSize="small" /> },
       PENDING: { color: 'warning', label: t('sms.status.pending'), icon: <HourglassEmptyIcon fontSize="small" /> },
     }
@@ -220,6 +226,23 @@ function SMSLogs() {
           {t('reports.filters')}
         </Typography>
         <Grid container spacing={2}>
+          <Grid item xs={12} sm={6} md={3}>
+            <FormControl fullWidth>
+              <InputLabel>{t('sms.records')}</InputLabel>
+              <Select
+                value={archived ? 'archived' : 'current'}
+                label={t('sms.records')}
+                onChange={(e) => {
+                  setArchived(e.target.value === 'archived')
+                  setPage(1)
+                }}
+              >
+                <MenuItem value="current">{t('sms.currentRecords')}</MenuItem>
+                <MenuItem value="archived">{t('sms.archivedRecords')}</MenuItem>
+              </Select>
+            </FormControl>
+          </Grid>
+
           <Grid item xs={12} sm={6} md={3}>
             <FormControl fullWidth>
               <InputLabel>{t('attendance.filterByBranch')}</InputLabel>
@@ -248,6 +271,7 @@ function SMSLogs() {
               >
                 <MenuItem value="">{t('common.all')}</MenuItem>
                 <MenuItem value="SENT">{t('sms.status.sent')}</MenuItem>
+                <MenuItem value="DELIVERED">{t('sms.status.delivered')}</MenuItem>
                 <MenuItem value="FAILED">{t('sms.status.failed')}</MenuItem>
                 <MenuItem value="PENDING">{t('sms.status.pending')}</MenuItem>
               </Select>
@@ -351,8 +375,8 @@ function SMSLogs() {
           sortOrder={sortOrder}
           searchValue={searchInput}
           onSearchChange={setSearchInput}
-          onDelete={handleDelete}
-          onBulkDelete={handleBulkDelete}
+          onDelete={archived ? undefined : handleDelete}
+          onBulkDelete={archived ? undefined : handleBulkDelete}
           page={page - 1}
           rowsPerPage={15}
           totalCount={data?.count || 0}